@@ -17,6 +17,7 @@ import board
 import traceback
 
 from settings import app_config
+from metrics import METRICS
 
 # --- application class   ----------------------------------------------------
 
@@ -35,11 +36,23 @@ class Application:
     if with_rtc and self._rtc_ext:
       self._rtc_ext.update_time(app_config.time_url)
     dataprovider.set_wifi(self.wifi)
+    if hasattr(uiprovider,"set_wifi"):
+      uiprovider.set_wifi(self.wifi)          # thin client (render service)
 
     self._dataprovider = dataprovider
     self._uiprovider   = uiprovider
     self.data = {}
 
+    # refresh of unchanged content is skipped, but forced after
+    # app_config.refresh_force skipped refreshes (0: never force)
+    self._force_refresh = getattr(app_config,'refresh_force',0)
+    self._skipped       = 0
+
+    # partial refreshs of changed regions, but a full refresh after
+    # app_config.refresh_full partial refreshs (limits ghosting)
+    self._full_refresh  = getattr(app_config,'refresh_full',10)
+    self._partial       = 0
+
   # --- get HAL   ------------------------------------------------------------
 
   # Import HAL (hardware-abstraction-layer).
@@ -92,6 +105,26 @@ class Application:
     if self._debug:
       print(text)
 
+  # --- execute and measure a phase   ----------------------------------------
+
+  def _phase(self,phase,func,*args):
+    """ call func, record duration and free memory of the phase """
+
+    METRICS.mem_free(f"mem.{phase}.before")
+    start = time.monotonic()
+    result = func(*args)
+    duration = time.monotonic()-start
+    METRICS.observe(f"time.{phase}",duration)
+    METRICS.mem_free(f"mem.{phase}.after")
+    self.msg(f"{phase}: {duration:f}s")
+    return result
+
+  # --- export metrics   -----------------------------------------------------
+
+  def export_metrics(self):
+    """ print metrics (serial) and write them to app_config.metrics_file """
+    METRICS.export(getattr(app_config,'metrics_file',None))
+
   # --- update data from server   --------------------------------------------
 
   def update_data(self):
@@ -99,33 +132,78 @@ class Application:
 
     self.blink(0.3,color=Application.RED)
     self.data["bat_level"] = self.bat_level()
-
-    start = time.monotonic()
-    self._dataprovider.update_data(self.data)
-    duration = time.monotonic()-start
+    try:
+      self._phase("update_data",self._dataprovider.update_data,self.data)
+    finally:
+      self.compact_data()
     self.blink(0.3,color=Application.GREEN)
-    self.msg(f"update_data (dataprovider): {duration:f}s")
+
+  # --- update data into back-buffer (double-buffering)   --------------------
+
+  def fetch_data(self):
+    """ update data into a back-buffer and return it.
+
+    Only reads self.data, so it can run in a thread while the UI uses
+    the front-buffer. Use swap_data() to activate the result.
+    """
+
+    back = {"station_index": self.data.get("station_index",0)}
+    if "departures" in self.data:
+      back["departures"] = list(self.data["departures"])
+      back["base"]       = list(self.data["departures"])
+    if "stale" in self.data:
+      back["stale"] = dict(self.data["stale"])
+    self._phase("update_data",self._dataprovider.update_data,back)
+    return back
+
+  def swap_data(self,back):
+    """ swap back-buffer into the model (single assignment) """
+
+    new   = back["departures"]
+    front = self.data.get("departures",None)
+    if front and "base" in back:
+      # keep entries updated in the front-buffer in the meantime
+      new = [f if b is o else b for f,b,o in zip(front,new,back["base"])]
+    self.data["departures"] = new
+    self.data["stale"]      = back.get("stale",{})
+    self.data["bat_level"]  = self.bat_level()
+    self.compact_data()
+
+  # --- compact model   ------------------------------------------------------
+
+  def compact_data(self):
+    """ let the data-provider drop unused data (optional).
+
+    Called after an update in the thread of the UI, so all live data is
+    in self.data and no fetch runs in parallel.
+    """
+    if hasattr(self._dataprovider,"compact"):
+      self._dataprovider.compact(self.data)
 
   # --- handle data-exception   ----------------------------------------------
 
   def handle_exception(self,ex):
     """ pass exception of data-provider to ui-provider """
 
+    METRICS.inc("errors")
     self.blink(0.3,color=Application.RED)
-    start = time.monotonic()
-    self._uiprovider.handle_exception(self.display,ex)
-    duration = time.monotonic()-start
-    self.msg(f"handle_exception (uiprovider): {duration:f}s")
+    self._phase("handle_exception",self._uiprovider.handle_exception,
+                self.display,ex)
 
   # --- create ui   ----------------------------------------------------------
 
   def create_ui(self):
     """ create UI. UI-provider might buffer UI for performance """
 
-    start = time.monotonic()
-    self._ui = self._uiprovider.create_ui(self.display)
-    duration = time.monotonic()-start
-    self.msg(f"create_content (uiprovider): {duration:f}s")
+    self._ui = self._phase("create_ui",self._uiprovider.create_ui,
+                           self.display)
+
+  # --- prepare ui   ---------------------------------------------------------
+
+  def prepare_ui(self):
+    """ let the UI-provider prepare pages for fast updates (optional) """
+    if hasattr(self._uiprovider,"prepare"):
+      self._phase("prepare_ui",self._uiprovider.prepare,self.data)
 
   # --- update display   -----------------------------------------------------
 
@@ -133,16 +211,33 @@ class Application:
     """ update display """
 
     # update UI with current model
-    start = time.monotonic()
-    self._uiprovider.update_ui(self.data)
-    duration = time.monotonic()-start
-    self.msg(f"update_ui (uiprovider): {duration:f}s")
+    changed = self._phase("update_ui",self._uiprovider.update_ui,self.data)
+
+    # skip refresh if the ui-provider reports unchanged content
+    dirty = None
+    if changed is False:
+      self._skipped += 1
+      if not self._force_refresh or self._skipped < self._force_refresh:
+        METRICS.inc("refresh_skipped")
+        self.msg(f"show (HAL): skipped ({self._skipped}x unchanged)")
+        return
+    elif hasattr(self._uiprovider,"dirty_regions"):
+      dirty = self._uiprovider.dirty_regions()
+    self._skipped = 0
+
+    # refresh changed regions only, periodically the complete display
+    if dirty is not None:
+      self._partial += 1
+      if self._full_refresh and self._partial > self._full_refresh:
+        dirty = None
+    if dirty is None:
+      self._partial = 0
+      METRICS.inc("refresh")
+    else:
+      METRICS.inc("refresh_partial")
 
     # and show content on screen
-    start = time.monotonic()
-    self._show(self._ui)
-    duration = time.monotonic()-start
-    self.msg(f"show (HAL): {duration:f}s")
+    self._phase("show",self._show,self._ui,dirty)
 
   # --- free memory from UI   ------------------------------------------------
 
@@ -175,10 +270,15 @@ class Application:
   def run(self):
     """ main application logic usually called in a loop """
 
+    METRICS.inc("cycles")
+    start = time.monotonic()
+
     # try to update data, catch any exception
     try:
       self.update_data()    # update data before UI is created
       self.create_ui()      # ui-provider should buffer this for performance
       self.update_display()
+      self.prepare_ui()     # uses time after the refresh
     except Exception as ex:
       self.handle_exception(ex)
+    METRICS.observe("time.cycle",time.monotonic()-start)
@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------
+# Decoder for compressed http-responses (gzip and deflate).
+#
+# The body is decompressed chunk by chunk, so it is never buffered as a
+# whole. CPython uses zlib.decompressobj(), CircuitPython uses
+# deflate.DeflateIO (available since CircuitPython 9).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+try:
+  from io import IOBase as _IOBase
+except ImportError:
+  _IOBase = object
+
+try:
+  import zlib
+  _deflate = None
+  if not hasattr(zlib,'decompressobj'):
+    raise ImportError
+except ImportError:
+  zlib = None
+  try:
+    import deflate as _deflate
+  except ImportError:
+    _deflate = None
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+# --- check if decoding is supported   ---------------------------------------
+
+def available():
+  """ check if decompression is supported on this platform """
+  return zlib is not None or _deflate is not None
+
+# --- case-insensitive header lookup   ---------------------------------------
+
+def get_header(resp,name):
+  """ case-insensitive lookup of a response header """
+  for key,value in resp.headers.items():
+    if key.lower() == name:
+      return value
+  return None
+
+# --- file-like adapter for chunks   -----------------------------------------
+
+class _ChunkStream(_IOBase):
+  """ readable stream on top of an iterator of chunks """
+
+  def __init__(self,chunks):
+    self._chunks = chunks
+    self._buf    = b""
+    self._pos    = 0
+
+  def readinto(self,buf):
+    if self._pos >= len(self._buf):
+      try:
+        self._buf = next(self._chunks)
+      except StopIteration:
+        return 0
+      self._pos = 0
+    n = min(len(buf),len(self._buf)-self._pos)
+    buf[0:n] = self._buf[self._pos:self._pos+n]
+    self._pos += n
+    return n
+
+  def read(self,size):
+    buf = bytearray(size)
+    mv  = memoryview(buf)
+    n   = 0
+    while n < size:
+      count = self.readinto(mv[n:])
+      if not count:
+        break
+      n += count
+    return bytes(mv[:n])
+
+# --- decoders   -------------------------------------------------------------
+
+def _decode_zlib(chunks):
+  """ decode using zlib.decompressobj (CPython) """
+
+  # wbits=47: automatic detection of gzip- and zlib-header
+  decoder = zlib.decompressobj(47)
+  for chunk in chunks:
+    data = decoder.decompress(chunk)
+    if data:
+      yield data
+  data = decoder.flush()
+  if data:
+    yield data
+
+def _decode_deflateio(chunks,encoding,chunk_size):
+  """ decode using deflate.DeflateIO (CircuitPython) """
+
+  fmt = _deflate.GZIP if encoding == "gzip" else _deflate.ZLIB
+  decoder = _deflate.DeflateIO(_ChunkStream(chunks),fmt)
+  buf = bytearray(chunk_size)
+  mv  = memoryview(buf)
+  while True:
+    n = decoder.readinto(buf)
+    if not n:
+      break
+    yield bytes(mv[:n])
+
+def decode(chunks,encoding,chunk_size=256):
+  """ return iterator of decoded chunks """
+
+  if not encoding or encoding == "identity":
+    return chunks
+  if not encoding in ["gzip","deflate"]:
+    raise ValueError(f"unsupported content-encoding: {encoding}")
+  if zlib:
+    return _decode_zlib(chunks)
+  elif _deflate:
+    return _decode_deflateio(chunks,encoding,chunk_size)
+  raise ValueError(f"no decoder for content-encoding: {encoding}")
+
+# --- iterate over decoded content of a response   ---------------------------
+
+def _count(chunks,counter):
+  """ add length of (raw) chunks to counter[0] """
+  for chunk in chunks:
+    counter[0] += len(chunk)
+    yield chunk
+
+def iter_content(resp,chunk_size=256,counter=None):
+  """ replacement for resp.iter_content() that handles compression.
+
+  If counter (a list with one element) is given, the number of bytes
+  received is added to counter[0].
+  """
+
+  chunks = resp.iter_content(chunk_size)
+  if counter is not None:
+    chunks = _count(chunks,counter)
+  return decode(chunks,get_header(resp,"content-encoding"),chunk_size)
+
+def stream(resp,chunk_size=256,counter=None):
+  """ return readable stream (readinto(), read()) of the decoded content """
+  return _ChunkStream(iter_content(resp,chunk_size,counter))
@@ -0,0 +1,117 @@
+# -------------------------------------------------------------------------
+# Compiled departure filters (fourth field of app_config.stations).
+#
+# A filter is a line name (exact match, as before) or a dict:
+#
+#   {"lines":     ["S 1","S 8"],    # exact line names
+#    "prefix":    ["U","S"],        # prefixes of line names
+#    "regex":     "^(RE|RB) ",      # regex on the line name
+#    "dir":       ["Flughafen"],    # substrings of the direction
+#    "cancelled": "hide",           # or "only"
+#    "min_delay": 5}                # minimum delay in minutes
+#
+# The line conditions match if any of them matches, all other conditions
+# must match. The filter is compiled once into a predicate
+# accept(cancelled,delay,direction,line) that runs on the raw fields
+# (utf-8 bytes, delay in minutes) before they are decoded, so rejected
+# departures cost almost nothing. The regex is evaluated last.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import re
+
+# --- helper functions   -----------------------------------------------------
+
+def _as_list(value):
+  """ return value as list of utf-8 bytes """
+  if isinstance(value,str):
+    value = [value]
+  return [v.encode("utf-8") for v in value]
+
+# --- filter steps   ---------------------------------------------------------
+
+def _line_step(lines,prefixes,regex):
+  lines = set(lines)
+  if regex:
+    regex = re.compile(regex)
+  def step(cancelled,delay,direction,line):
+    if line is None:
+      return False
+    if line in lines:
+      return True
+    for prefix in prefixes:
+      if line.startswith(prefix):
+        return True
+    return bool(regex and regex.search(line.decode("utf-8")))
+  return step
+
+def _dir_step(parts):
+  def step(cancelled,delay,direction,line):
+    if direction is None:
+      return False
+    for part in parts:
+      if part in direction:
+        return True
+    return False
+  return step
+
+def _cancelled_step(mode):
+  if mode == "hide":
+    return lambda cancelled,delay,direction,line: not cancelled
+  elif mode == "only":
+    return lambda cancelled,delay,direction,line: cancelled
+  raise ValueError(f"filter: invalid value for cancelled: {mode}")
+
+def _delay_step(minimum):
+  return lambda cancelled,delay,direction,line: delay >= minimum
+
+# --- compile filter   -------------------------------------------------------
+
+def compile_filter(spec):
+  """ compile filter-spec, return predicate or None (no filter) """
+
+  if not spec:
+    return None
+  if isinstance(spec,str):
+    spec = {"lines": [spec]}
+
+  steps = []
+  if spec.get("cancelled",None):
+    steps.append(_cancelled_step(spec["cancelled"]))
+  if spec.get("min_delay",None):
+    steps.append(_delay_step(spec["min_delay"]))
+  if spec.get("dir",None):
+    steps.append(_dir_step(_as_list(spec["dir"])))
+  lines    = _as_list(spec.get("lines",None) or [])
+  prefixes = _as_list(spec.get("prefix",None) or [])
+  regex    = spec.get("regex",None)
+  if lines or prefixes or regex:
+    steps.append(_line_step(lines,prefixes,regex))
+
+  if not steps:
+    return None
+  if len(steps) == 1:
+    return steps[0]
+  def accept(cancelled,delay,direction,line):
+    for step in steps:
+      if not step(cancelled,delay,direction,line):
+        return False
+    return True
+  return accept
+
+def filter_key(spec):
+  """ return canonical string of filter-spec (e.g. part of cache-keys) """
+  if not spec:
+    return ""
+  if isinstance(spec,str):
+    return spec
+  return ";".join([f"{key}={spec[key]!r}" for key in sorted(spec)])
+
+def line_name(spec):
+  """ return line name of a simple filter (exact line name) or None """
+  return (spec or None) if isinstance(spec,str) else None
@@ -0,0 +1,392 @@
+# -------------------------------------------------------------------------
+# Streaming parsers for the departures-document of v6.db.transport.rest.
+#
+# DepartureParser is a purpose-built extractor: it only decodes the
+# fields the departure monitor needs and skips all other values (trip,
+# remarks, line.operator, stop.location, products, ...) on the token
+# level without creating objects for them.
+#
+# JsonStreamParser provides the same interface on top of json_stream.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import json
+
+# character codes
+_QUOTE   = 34     # "
+_COMMA   = 44     # ,
+_COLON   = 58     # :
+_LBRACK  = 91     # [
+_BSLASH  = 92     # \
+_RBRACK  = 93     # ]
+_N       = 110    # n (null)
+_LBRACE  = 123    # {
+_RBRACE  = 125    # }
+
+# --- selective extractor   --------------------------------------------------
+
+class DepartureParser:
+  """ extract departures from the streamed json-document.
+
+  departures() yields tuples (stop-name, cancelled, plannedWhen, delay,
+  direction, line-name). The optional predicate accept (see
+  departure_filter.py) is called with the raw fields, rejected
+  departures are not decoded. stop is the name of the stop (also if all
+  departures are rejected). Once the iteration is finished, the
+  attribute updated holds realtimeDataUpdatedAt. If the caller stops
+  early, complete is False and the rest of the stream is not read.
+  """
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self,chunks):
+    """ constructor """
+
+    self._chunks  = iter(chunks)
+    self._buf     = b""
+    self._pos     = 0
+    self.stop     = None
+    self.updated  = None
+    self.complete = False
+
+  # --- read next chunk   ----------------------------------------------------
+
+  def _fill(self):
+    """ read next chunk, return False at end of stream """
+
+    for chunk in self._chunks:
+      if chunk:
+        self._buf = bytes(chunk)
+        self._pos = 0
+        return True
+    return False
+
+  # --- return next non-whitespace character   -------------------------------
+
+  def _peek(self):
+    """ return next non-whitespace character without consuming it """
+
+    while True:
+      buf = self._buf
+      n   = len(buf)
+      pos = self._pos
+      while pos < n:
+        if buf[pos] > 32:
+          self._pos = pos
+          return buf[pos]
+        pos += 1
+      if not self._fill():
+        raise ValueError("unexpected end of data")
+
+  def _next(self):
+    """ consume and return next non-whitespace character """
+    c = self._peek()
+    self._pos += 1
+    return c
+
+  def _expect(self,char):
+    """ consume expected character """
+    c = self._next()
+    if c != char:
+      raise ValueError(f"invalid data: expected {chr(char)}, got {chr(c)}")
+
+  # --- read or skip string   ------------------------------------------------
+
+  def _read_string(self,keep=True):
+    """ read raw string (opening quote already consumed) """
+
+    parts = []
+    bs    = 0                      # backslashes at the end of the last chunk
+    while True:
+      buf   = self._buf
+      start = self._pos
+      pos   = start
+      while True:
+        q = buf.find(b'"',pos)
+        if q < 0:
+          break
+        k = q
+        while k > start and buf[k-1] == _BSLASH:
+          k -= 1
+        n_bs = q - k + (bs if k == start else 0)
+        if n_bs % 2 == 0:
+          self._pos = q+1
+          if not keep:
+            return None
+          parts.append(buf[start:q])
+          return b"".join(parts)
+        pos = q+1                  # escaped quote
+
+      # string continues in next chunk
+      end = len(buf)
+      k = end
+      while k > start and buf[k-1] == _BSLASH:
+        k -= 1
+      bs = end - k + (bs if k == start else 0)
+      if keep:
+        parts.append(buf[start:])
+      if not self._fill():
+        raise ValueError("unexpected end of data")
+
+  def _decode(self,raw):
+    """ convert raw string to str """
+    if b"\\" in raw:
+      return json.loads('"'+raw.decode()+'"')
+    return raw.decode()
+
+  def _text(self,raw):
+    """ convert raw string (or None) to str """
+    return None if raw is None else self._decode(raw)
+
+  def _unescape(self,raw):
+    """ return raw string without escapes (utf-8) """
+    if raw and b"\\" in raw:
+      return self._decode(raw).encode("utf-8")
+    return raw
+
+  def _read_raw(self):
+    """ read raw string value (None for other values) """
+    if self._peek() == _QUOTE:
+      self._pos += 1
+      return self._read_string()
+    self._skip_value()
+    return None
+
+  # --- read scalar (number, true, false, null)   ----------------------------
+
+  def _read_scalar(self):
+    """ read raw scalar value """
+
+    parts = []
+    while True:
+      buf = self._buf
+      pos = self._pos
+      n   = len(buf)
+      i   = pos
+      while i < n:
+        c = buf[i]
+        if c == _COMMA or c == _RBRACE or c == _RBRACK or c <= 32:
+          parts.append(buf[pos:i])
+          self._pos = i
+          return b"".join(parts)
+        i += 1
+      parts.append(buf[pos:])
+      self._pos = n
+      if not self._fill():
+        return b"".join(parts)
+
+  # --- read value   ---------------------------------------------------------
+
+  def _read_value(self):
+    """ read and convert a scalar or string value """
+
+    c = self._peek()
+    if c == _QUOTE:
+      self._pos += 1
+      return self._decode(self._read_string())
+    elif c == _LBRACE or c == _LBRACK:
+      self._skip_value()
+      return None
+    raw = self._read_scalar()
+    if raw == b"null":
+      return None
+    elif raw == b"true":
+      return True
+    elif raw == b"false":
+      return False
+    elif b"." in raw or b"e" in raw or b"E" in raw:
+      return float(raw)
+    return int(raw)
+
+  # --- skip value   ---------------------------------------------------------
+
+  def _skip_value(self):
+    """ skip value without decoding it """
+
+    c = self._peek()
+    if c == _QUOTE:
+      self._pos += 1
+      self._read_string(False)
+    elif c == _LBRACE or c == _LBRACK:
+      self._pos += 1
+      self._skip_container()
+    else:
+      self._read_scalar()
+
+  def _skip_container(self):
+    """ skip object or array (opening bracket already consumed) """
+
+    depth = 1
+    while True:
+      buf = self._buf
+      pos = self._pos
+      q   = buf.find(b'"',pos)
+      end = len(buf) if q < 0 else q
+
+      # brackets between strings: only scan byte by byte if the
+      # container might end within this segment
+      closing = buf.count(b'}',pos,end) + buf.count(b']',pos,end)
+      if closing >= depth:
+        for i in range(pos,end):
+          c = buf[i]
+          if c == _LBRACE or c == _LBRACK:
+            depth += 1
+          elif c == _RBRACE or c == _RBRACK:
+            depth -= 1
+            if depth == 0:
+              self._pos = i+1
+              return
+      else:
+        depth += (buf.count(b'{',pos,end) + buf.count(b'[',pos,end) -
+                  closing)
+
+      if q < 0:
+        if not self._fill():
+          raise ValueError("unexpected end of data")
+      else:
+        self._pos = q+1
+        self._read_string(False)
+
+  # --- iterate over members of object   -------------------------------------
+
+  def _members(self):
+    """ yield keys of object (opening brace already consumed) """
+
+    if self._peek() == _RBRACE:
+      self._pos += 1
+      return
+    while True:
+      self._expect(_QUOTE)
+      key = self._read_string()
+      self._expect(_COLON)
+      yield key                    # caller must consume the value
+      c = self._next()
+      if c == _RBRACE:
+        return
+      elif c != _COMMA:
+        raise ValueError(f"invalid data: unexpected {chr(c)}")
+
+  # --- iterate over elements of array   -------------------------------------
+
+  def _elements(self):
+    """ yield for every element of array (opening bracket consumed) """
+
+    if self._peek() == _RBRACK:
+      self._pos += 1
+      return
+    while True:
+      yield                        # caller must consume the element
+      c = self._next()
+      if c == _RBRACK:
+        return
+      elif c != _COMMA:
+        raise ValueError(f"invalid data: unexpected {chr(c)}")
+
+  # --- read single field of a sub-object   ----------------------------------
+
+  def _object_field(self,name,raw=False):
+    """ read a single field of an object and skip the rest """
+
+    if self._peek() != _LBRACE:
+      return self._read_value()    # null
+    self._pos += 1
+    value = None
+    for key in self._members():
+      if key == name:
+        value = self._read_raw() if raw else self._read_value()
+      else:
+        self._skip_value()
+    return value
+
+  # --- parse a single departure   -------------------------------------------
+
+  def _departure(self,accept):
+    """ parse departure object, return None if rejected by accept """
+
+    self._expect(_LBRACE)
+    stop = planned = delay = direction = line = None
+    cancelled = False
+    for key in self._members():
+      if key == b"stop":
+        stop = self._object_field(b"name",True)
+      elif key == b"when":
+        cancelled = self._peek() == _N
+        self._skip_value()
+      elif key == b"plannedWhen":
+        planned = self._read_raw()
+      elif key == b"delay":
+        delay = self._read_value()
+      elif key == b"direction":
+        direction = self._read_raw()
+      elif key == b"line":
+        line = self._object_field(b"name",True)
+      else:
+        self._skip_value()
+    if self.stop is None and stop is not None:
+      self.stop = self._decode(stop)
+    if accept and not accept(cancelled,int(delay/60) if delay else 0,
+                             self._unescape(direction),self._unescape(line)):
+      return None
+    return (self._text(stop),cancelled,self._text(planned),delay,
+            self._text(direction),self._text(line))
+
+  # --- iterate over departures   --------------------------------------------
+
+  def departures(self,accept=None):
+    """ yield departures (accepted by the optional predicate) """
+
+    self._expect(_LBRACE)
+    for key in self._members():
+      if key == b"departures":
+        self._expect(_LBRACK)
+        for _ in self._elements():
+          dep = self._departure(accept)
+          if dep:
+            yield dep
+      elif key == b"realtimeDataUpdatedAt":
+        self.updated = self._read_value()
+      else:
+        self._skip_value()
+    self.complete = True
+
+# --- parser based on json_stream   ------------------------------------------
+
+class JsonStreamParser:
+  """ same interface as DepartureParser, but using json_stream """
+
+  def __init__(self,chunks):
+    """ constructor """
+    try:
+      # Blinka (CPython)
+      import json_stream
+    except:
+      # CircuitPython
+      import adafruit_json_stream as json_stream
+    self._jdata   = json_stream.load(chunks)
+    self.stop     = None
+    self.updated  = None
+    self.complete = False
+
+  def departures(self,accept=None):
+    """ yield departures (accepted by the optional predicate) """
+
+    jdata = self._jdata
+    for dep in jdata["departures"]:
+      # note: the order of access must match the order within the document
+      result = (dep["stop"]["name"],dep["when"] is None,dep["plannedWhen"],
+                dep["delay"],dep["direction"],dep["line"]["name"])
+      self.stop = self.stop or result[0]
+      if accept:
+        _,cancelled,_,delay,direction,line = result
+        if not accept(cancelled,int(delay/60) if delay else 0,
+                      direction and direction.encode("utf-8"),
+                      line and line.encode("utf-8")):
+          continue
+      yield result
+    self.updated  = jdata["realtimeDataUpdatedAt"]
+    self.complete = True
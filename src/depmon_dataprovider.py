@@ -1,7 +1,8 @@
 # -------------------------------------------------------------------------
 # Dataprovider for the Departure Monitor.
 #
-# Interface to https://v6.db.transport.rest/
+# Interface to https://v6.db.transport.rest/ or to the edge-proxy
+# tools/depproxy.py (app_config.proxy_url).
 #
 # Author: Bernhard Bablok
 # License: GPL3
@@ -12,37 +13,17 @@
 
 import gc
 import time
-try:
-  # Blinka (CPython)
-  import json_stream
-except:
-  # CircuitPython
-  import adafruit_json_stream as json_stream
 
 from settings import app_config
-
-# --- interface to https://v6.db.transport.rest/   ---------------------------
-
-URL_PREFIX='https://v6.db.transport.rest/stops'
-URL_SUFFIX='departures?linesOfStops=false&remarks=false&pretty=false'
-
-# --- helper classes (value-holders)   ---------------------------------------
-
-class DepInfo:
-  """ Value-holder for departure information """
-  def __init__(self,plan,delay,line,dir,cancelled):
-    self.plan      = plan
-    self.delay     = delay
-    self.line      = line
-    self.dir       = dir
-    self.cancelled = cancelled
-
-class StatInfo:
-  """ departure info for a station """
-  def __init__(self,name,info,update):
-    self.name   = name
-    self.info   = info
-    self.update = update
+from departure_parser import DepartureParser, JsonStreamParser
+from depmon_model import StatInfo, DepList, STRINGS, CLOCK
+from text_replacer import TextReplacer
+from metrics import METRICS
+from fetch_guard import FetchGuard
+from proxy_payload import PayloadReader
+from departure_filter import compile_filter, filter_key, line_name
+from rest_api import URL_PREFIX, create_url, parse_time, parse_date
+import content_decoder
 
 # --- main data-provider class   ---------------------------------------------
 
@@ -51,6 +32,34 @@ class DepmonDataProvider:
   def __init__(self,debug=False):
     self._debug = debug
     self._wifi  = None
+    self._url_prefix = getattr(app_config,'url_prefix',URL_PREFIX)
+    self._lazy  = getattr(app_config,'fetch_mode','all') == 'lazy'
+    self._max_age = getattr(app_config,'max_age',app_config.upd_time)
+    self._fetched = [None]*len(app_config.stations)  # time of last fetch
+    self._executor = None      # thread-pool (app_config.fetch_concurrency)
+    if getattr(app_config,'parser','extract') == 'json_stream':
+      self._parser = JsonStreamParser
+    else:
+      self._parser = DepartureParser
+    self._max_departures = getattr(app_config,'max_departures',0)
+    self._proxy_url    = getattr(app_config,'proxy_url',None)
+    self._proxy_buffer = getattr(app_config,'proxy_buffer',256)
+    self._guard = FetchGuard(len(app_config.stations),debug=debug)
+    self._retries     = getattr(app_config,'fetch_retries',1)
+    self._retry_delay = getattr(app_config,'fetch_retry_delay',1)
+    self._replace = TextReplacer(getattr(app_config,'replace',[]),
+                                 getattr(app_config,'replace_cache',64))
+    self._filters = [compile_filter(station[3])
+                     for station in app_config.stations]
+    self._offset  = 0          # utc-offset (also if all departures rejected)
+    self._cache = None
+    if getattr(app_config,'cache',False):
+      from response_cache import ResponseCache
+      self._cache = ResponseCache(
+        path=getattr(app_config,'cache_dir',None),
+        ttl=getattr(app_config,'cache_ttl',0),
+        max_body=getattr(app_config,'cache_max_body',0),
+        debug=debug)
 
   # --- print debug-message   ------------------------------------------------
 
@@ -68,101 +77,330 @@ class DepmonDataProvider:
   # --- trace memory   -------------------------------------------------------
 
   def _mem_free(self,label):
-    """ print free memory (not available with Blinka) """
+    """ record and print free memory (not available with Blinka) """
+    METRICS.mem_free(f"mem.{label}")
     try:
-      self.msg(f"{label}: {gc.mem_free()}")
+      self.msg(f"free memory {label}: {gc.mem_free()}")
     except:
       pass
 
-  # --- parse iso-time   -----------------------------------------------------
-
-  def _parse_time(self,tm):
-    """ parse iso-timestamp """
-
-    the_date, the_time = tm.split('T')
-    #year,month,mday   = the_date.split('-')
-    hour,minute        = the_time.split(':')[0:2]
-
-    offset = the_time[-6:]
-    sign = 1 if offset[0] == '+' else -1
-    offset = sign*3600*int(offset[1:3])+sign*60*int(offset[4:])
-    return [hour,minute,offset]
-
   # --- create query-url   ---------------------------------------------------
 
   def _create_url(self,station,via,products):
     """ create query url for hafas """
+    return create_url(self._url_prefix,station,via,products,
+                      app_config.duration)
+
+  # --- query departures from edge-proxy   -----------------------------------
+
+  def _quote(self,value):
+    """ url-encode query-value """
+    result = ""
+    for b in str(value).encode("utf-8"):
+      if (48 <= b <= 57 or 65 <= b <= 90 or 97 <= b <= 122 or
+          b in b"-_.,"):
+        result += chr(b)
+      else:
+        result += f"%{b:02X}"
+    return result
 
-    url = f"{URL_PREFIX}/{station}/{URL_SUFFIX}&duration={app_config.duration}"
-    if via:
-      url = f"{url}&direction={via}"
-    if not products:
-      return url
-
-    # if we need to filter by product, set all products to false except those
-    # that are provided
-    all_products = {
-      "nationalExpress": "false",
-      "national": "false",
-      "regionalExpress": "false",
-      "regional": "false",
-      "suburban": "false",
-      "bus": "false",
-      "ferry": "false",
-      "subway": "false",
-      "tram": "false",
-      "taxi": "false"
-      }
-    for p in products.split(","):
-      all_products[p] = "true"
-
-    # add to url
-    for key,value in all_products.items():
-      url += f"&{key}={value}"
+  def _create_proxy_url(self,station,via,products,line,max_departures):
+    """ create query url for tools/depproxy.py """
+
+    url = (f"{self._proxy_url}?station={self._quote(station)}" +
+           f"&duration={app_config.duration}")
+    for key,value in [("via",via),("products",products),("line",line),
+                      ("max",max_departures)]:
+      if value:
+        url += f"&{key}={self._quote(value)}"
     return url
-    
+
+  def _fetch_proxy(self,station,via,product,line,accept):
+    """ query pre-parsed departures of a single station from the proxy """
+
+    self.msg(f"fetching departures for {station} from proxy")
+    start = time.monotonic()
+    info = DepList()
+    # the proxy only supports the simple filter (exact line name). Other
+    # filters run on the device, so the device also limits the departures
+    on_proxy = not line or line_name(line)
+    max_departures = self._max_departures if on_proxy else 0
+    resp = self._wifi.get(self._create_proxy_url(station,via,product,
+                                                 line_name(line),
+                                                 max_departures))
+    if resp.status_code != 200:
+      self._wifi.close(resp,drain=False)
+      raise RuntimeError(f"proxy: status {resp.status_code}")
+
+    reader = PayloadReader(lambda buf: self._wifi.readinto(resp,buf),
+                           self._proxy_buffer)
+    for plan,delay,cancelled,name,direction in reader.departures(accept):
+      info.append(plan,delay,self._replace(name),self._replace(direction),
+                  cancelled)
+      if len(info) == self._max_departures:
+        break                      # rest of the payload is not read
+    self._wifi.close(resp,drain=reader.complete)
+    if METRICS.enabled:
+      METRICS.observe("time.fetch",time.monotonic()-start)
+      METRICS.set(f"bytes.{station}",reader.bytes)
+      METRICS.inc("bytes",reader.bytes)
+      METRICS.set(f"departures.{station}",len(info))
+      METRICS.inc("departures",len(info))
+    return StatInfo(self._replace(reader.name),info,reader.updated)
+
+  # --- query departures of a single station   ------------------------------
+
+  def _fetch_station(self,station,via,product,line,accept):
+    """ query departures of a single station and return StatInfo. line
+    is the filter-spec, accept the compiled filter """
+
+    if self._proxy_url:
+      return self._fetch_proxy(station,via,product,line,accept)
+
+    self.msg(f"fetching departures for {station}")
+    start = time.monotonic()
+    info = DepList()
+    offset    = self._offset
+    url   = self._create_url(station,via,product)
+
+    # check cache: the cached result is filtered, so stations with the
+    # same url but different filters need their own entries
+    entry = None
+    if self._cache:
+      key = url
+      if line:
+        key = f"{url}#{filter_key(line)}"
+      entry = self._cache.lookup(key)
+      if entry and self._cache.is_fresh(entry):
+        self._cache.hit(key,"ttl")
+        return StatInfo.from_list(entry["result"])
+
+    self._mem_free("fetch.before")
+    if self._cache:
+      resp = self._wifi.get(url,headers=self._cache.validators(entry))
+    else:
+      resp = self._wifi.get(url)
+    counter = [0] if METRICS.enabled else None    # bytes received
+    body = self._wifi.iter_content(resp,256,counter)
+
+    # revalidate cache-entry: server-side (304) or using the checksum
+    digest = None
+    if self._cache:
+      if entry and resp.status_code == 304:
+        self._wifi.close(resp)
+        self._cache.hit(key,"not modified")
+        self._cache.touch(key)
+        return StatInfo.from_list(entry["result"])
+      body,digest = self._cache.read_body(body)
+      if entry and digest is not None and digest == entry["digest"]:
+        self._wifi.close(resp)
+        self._cache.hit(key,"checksum")
+        self._cache.touch(key)
+        return StatInfo.from_list(entry["result"])
+      self._cache.miss(key)
+
+    parser = self._parser(body)
+    for _,cancelled,planned,delay,direction,name in (
+      parser.departures(accept)):
+      plan,offset = parse_time(planned)
+      if delay:
+        delay = int(int(delay)/60)
+      else:
+        delay = 0
+      info.append(plan,delay,self._replace(name),self._replace(direction),
+                  cancelled)
+      if len(info) == self._max_departures:
+        break
+
+    # get update-timepoint (robust code, might not exist, and is
+    # missing if we stopped early). Fallback: time of the response, the
+    # clock (countdown) and the footer need a local time
+    stat_name = parser.stop or str(station)
+    self._offset = offset
+    updated = parser.updated
+    if updated:
+      updated = int(updated)+offset
+    else:
+      try:
+        updated = parse_date(content_decoder.get_header(resp,"date"))+offset
+      except Exception:
+        updated = None               # no or unexpected date-header
+    self._mem_free("parse.after")
+    # close socket instead of draining the rest of an incomplete response
+    self._wifi.close(resp,drain=parser.complete)
+    parser = None
+    gc.collect()
+    self._mem_free("fetch.after")
+    if METRICS.enabled:
+      METRICS.observe("time.fetch",time.monotonic()-start)
+      METRICS.set(f"bytes.{station}",counter[0])
+      METRICS.inc("bytes",counter[0])
+      METRICS.set(f"departures.{station}",len(info))
+      METRICS.inc("departures",len(info))
+    result = StatInfo(self._replace(stat_name),info,updated)
+    if self._cache:
+      self._cache.store(key,resp,digest,result.as_list())
+    return result
+
+  # --- query station with retries   ----------------------------------------
+
+  def _fetch_guarded(self,index):
+    """ query station with retries, return (StatInfo,None) or (None,error) """
+
+    reason = self._guard.check(index)
+    if reason:
+      return (None,RuntimeError(f"{app_config.stations[index][0]}: {reason}"))
+
+    delay = self._retry_delay
+    for attempt in range(self._retries+1):
+      try:
+        result = self._fetch_station(*app_config.stations[index],
+                                     self._filters[index])
+        self._guard.success(index)
+        return (result,None)
+      except Exception as ex:
+        error = ex
+        self.msg(f"fetching station {index} failed: {ex}")
+        if attempt < self._retries:
+          time.sleep(delay)
+          delay *= 2
+    self._guard.failure(index)
+    return (None,error)
+
+  # --- query departures of multiple stations   ------------------------------
+
+  def _fetch_stations(self,indices):
+    """ query stations, return list of (StatInfo,error) in the order of
+    indices """
+
+    # app_config.fetch_concurrency: maximal number of parallel requests.
+    # Threads are only available with CPython, CircuitPython always
+    # fetches sequentially
+    concurrency = getattr(app_config,'fetch_concurrency',1)
+    limit = min(concurrency,len(indices))
+    if limit > 1 and not self._executor:
+      try:
+        from concurrent.futures import ThreadPoolExecutor
+        # kept across updates: the threads keep their sessions and
+        # connections (see wifi_helper_generic.py)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+      except ImportError:
+        limit = 1
+
+    if limit <= 1:
+      return [self._fetch_guarded(i) for i in indices]
+
+    self.msg(f"fetching {len(indices)} stations with {limit} threads")
+    # map() keeps the order of the input
+    return list(self._executor.map(self._fetch_guarded,indices))
+
+  # --- update given stations   ---------------------------------------------
+
+  def _update_stations(self,data,indices):
+    """ fetch the given stations and update the model """
+
+    if not "departures" in data:
+      data["departures"] = [None]*len(app_config.stations)
+    if not "stale" in data:
+      data["stale"] = {}           # index -> error of failed stations
+    data["update"] = None
+
+    try:
+      result = self._fetch_stations(indices)
+    finally:
+      self._wifi.radio_down()       # noop unless secrets.radio_off is set
+    now = time.monotonic()
+    error = None
+    for index,(stat_info,ex) in zip(indices,result):
+      if stat_info:
+        data["departures"][index] = stat_info
+        data["stale"].pop(index,None)
+        self._fetched[index] = now
+        CLOCK.sync(stat_info.update)   # local time of the realtime data
+      else:
+        # keep last good data, the UI marks it as stale
+        data["stale"][index] = str(ex)
+        if (data["departures"][index] is None and
+            index == data.get("station_index",0)):
+          error = ex
+
+    # nothing to show for the visible station
+    if error:
+      raise error
+
   # --- query departures   ---------------------------------------------------
 
   def update_data(self,data):
     """ callback for App: query data """
 
-    dm_data = {"departures": [], "update": None}
-
-    for station,via,product,line in app_config.stations:
-      self.msg(f"fetching departures for {station}")
-      info = []
-      url   = self._create_url(station,via,product)
-      self._mem_free("free memory before wifi.get()")
-      resp  = self._wifi.get(url)
-      jdata = json_stream.load(resp.iter_content(256))
-
-      for dep in jdata["departures"]:
-        stat_name = dep["stop"]["name"]
-        cancelled = dep["when"] is None
-        hour,minute,offset = self._parse_time(dep["plannedWhen"])
-        plan  = ":".join([hour,minute])
-        delay = dep["delay"]
-        if delay:
-          delay = int(int(delay)/60)
-        else:
-          delay = 0
-        direction = dep["direction"]
-        name      = dep["line"]["name"]
-        # filter for given line
-        if line and name != line:
-          continue
-        info.append(DepInfo(plan,delay,name,direction,cancelled))
-
-      # get update-timepoint (robust code, might not exist)
-      updated = jdata["realtimeDataUpdatedAt"]
-      if updated:
-        updated = int(updated)+offset
-      self._mem_free("free memory after parsing response")
-      #resp.close()
-      #resp = None
-      jdata = None
-      gc.collect()
-      self._mem_free("free memory after closing response")
-      dm_data["departures"].append(StatInfo(stat_name,info,updated))
-
-    data.update(dm_data)
+    if self._lazy:
+      # only fetch the visible station, other stations are fetched
+      # on demand (see prefetch() and update_station())
+      self._update_stations(data,[data["station_index"]])
+    else:
+      self._update_stations(data,list(range(len(app_config.stations))))
+
+  # --- drop unused strings   ------------------------------------------------
+
+  def compact(self,data):
+    """ drop line-names and directions no longer in use.
+
+    Remaps all stations of data. Must not run while other threads read
+    or update the model (see Application.compact_data()).
+    """
+    STRINGS.compact(data.get("departures",None) or [],
+                    getattr(app_config,'string_table',256))
+
+  # --- check age of station data   ------------------------------------------
+
+  def is_stale(self,data,index):
+    """ check if data of station is missing or older than max_age """
+
+    if not "departures" in data or data["departures"][index] is None:
+      return True
+    if self._fetched[index] is None:
+      return True                  # e.g. restored from a snapshot
+    return time.monotonic() - self._fetched[index] > self._max_age
+
+  # --- update single station   ----------------------------------------------
+
+  def update_station(self,data,index):
+    """ fetch a single station (lazy mode: fetch on demand) """
+    self._update_stations(data,[index])
+
+  # --- retry failed stations   ---------------------------------------------
+
+  def retry_stale(self,data):
+    """ fetch failed stations if their retry is due.
+
+    Returns True if stations were fetched.
+    """
+
+    indices = [i for i in data.get("stale",{}) if self._guard.due(i)]
+    if not indices:
+      return False
+    self.msg(f"retrying stations {indices}")
+    self._update_stations(data,indices)
+    return True
+
+  # --- prefetch neighbours of current station   -----------------------------
+
+  def prefetch(self,data):
+    """ fetch stations next to the visible station (lazy mode only).
+
+    Returns True if stations were fetched.
+    """
+
+    n = len(app_config.stations)
+    if not self._lazy or n < 2:
+      return False
+    index = data["station_index"]
+    indices = []
+    for i in [(index+1) % n, (index-1) % n]:   # KEY_RIGHT, KEY_LEFT
+      if not i in indices and self.is_stale(data,i):
+        indices.append(i)
+    if not indices:
+      return False
+    self.msg(f"prefetching stations {indices}")
+    self._update_stations(data,indices)
+    return True
@@ -0,0 +1,235 @@
+# -------------------------------------------------------------------------
+# Data model of the Departure Monitor.
+#
+# Departures of a station are kept in column arrays (DepList). Line
+# names and directions are interned in a string table shared by all
+# stations and all update cycles. Times are local time in minutes (or
+# seconds) since 1970-01-01, the current time is provided by CLOCK.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import time
+from array import array
+try:
+  from threading import Lock
+except ImportError:
+  Lock = None                  # CircuitPython: no threads
+
+# --- day number of a date   -------------------------------------------------
+
+def day_number(year,month,day):
+  """ return days since 1970-01-01 (proleptic gregorian calendar) """
+
+  year -= month <= 2
+  era   = year // 400
+  yoe   = year - era*400
+  doy   = (153*(month + (-3 if month > 2 else 9)) + 2)//5 + day-1
+  doe   = yoe*365 + yoe//4 - yoe//100 + doy
+  return era*146097 + doe - 719468
+
+# --- local clock   ----------------------------------------------------------
+
+class Clock:
+  """ local time synchronized with the server.
+
+  The time of the realtime data is the reference, time.monotonic()
+  advances the clock between updates. The clock never runs backwards,
+  i.e. outdated server times (idle backend) are ignored.
+  """
+
+  def __init__(self):
+    """ constructor """
+    self._base   = None        # local time (seconds since 1970)
+    self._synced = None        # time.monotonic() of the last sync
+
+  def sync(self,now):
+    """ set local time (seconds since 1970) """
+    if now and (self._base is None or now > self.now()):
+      self._base   = now
+      self._synced = time.monotonic()
+
+  def now(self):
+    """ return local time (seconds since 1970) or None if not synced """
+    if self._base is None:
+      return None
+    return self._base + int(time.monotonic()-self._synced)
+
+  def minutes(self,default=None):
+    """ return local time in minutes since 1970 (default: seconds if
+    not synced) """
+    now = self.now() or default
+    return now//60 if now else None
+
+# shared clock
+CLOCK = Clock()
+
+# --- string table   ---------------------------------------------------------
+
+class StringTable:
+  """ table of interned strings """
+
+  def __init__(self):
+    """ constructor """
+    self._index   = {}
+    self._strings = []
+    self._lock    = Lock() if Lock else None
+
+  def __len__(self):
+    return len(self._strings)
+
+  def _add(self,text):
+    """ add string (must not be in table) """
+    index = self._index.get(text,None)
+    if index is None:
+      index = len(self._strings)
+      self._strings.append(text)
+      self._index[text] = index
+    return index
+
+  def add(self,text):
+    """ return index of text, add it if necessary """
+    index = self._index.get(text,None)
+    if index is not None:
+      return index
+    if self._lock:
+      with self._lock:
+        return self._add(text)
+    return self._add(text)
+
+  def get(self,index):
+    """ return string for index """
+    return self._strings[index]
+
+  def compact(self,stations,limit):
+    """ drop strings not used by stations if the table exceeds limit """
+
+    if len(self._strings) <= limit:
+      return
+    strings = self._strings
+    self._strings = []
+    self._index   = {}
+    for stat_info in stations:
+      if stat_info is None:
+        continue
+      for column in [stat_info.info.line,stat_info.info.dir]:
+        for i in range(len(column)):
+          column[i] = self._add(strings[column[i]])
+
+# shared string table
+STRINGS = StringTable()
+
+# --- value-holder for a single departure   ----------------------------------
+
+class DepInfo:
+  """ Value-holder for departure information """
+  __slots__ = ('plan','delay','line','dir','cancelled')
+  def __init__(self,plan,delay,line,dir,cancelled):
+    self.plan      = plan
+    self.delay     = delay
+    self.line      = line
+    self.dir       = dir
+    self.cancelled = cancelled
+
+# --- departures of a station   ----------------------------------------------
+
+class DepList:
+  """ departures of a station in column arrays.
+
+  Indexing returns a DepInfo created on the fly.
+  """
+  __slots__ = ('plan','delay','cancelled','line','dir')
+
+  def __init__(self):
+    """ constructor """
+    self.plan      = array('L')      # planned time: minutes since 1970
+    self.delay     = array('h')      # delay in minutes
+    self.cancelled = bytearray()     # bitset
+    self.line      = array('H')      # index into STRINGS
+    self.dir       = array('H')      # index into STRINGS
+
+  def append(self,plan,delay,line,dir,cancelled):
+    """ add departure (plan: local time in minutes since 1970) """
+    n = len(self.plan)
+    if n % 8 == 0:
+      self.cancelled.append(0)
+    if cancelled:
+      self.cancelled[n >> 3] |= 1 << (n & 7)
+    self.plan.append(plan)
+    self.delay.append(max(-32768,min(32767,delay)))
+    self.line.append(STRINGS.add(line))
+    self.dir.append(STRINGS.add(dir))
+
+  def is_cancelled(self,index):
+    """ query cancelled-bit """
+    return bool(self.cancelled[index >> 3] & (1 << (index & 7)))
+
+  def __len__(self):
+    return len(self.plan)
+
+  def __getitem__(self,index):
+    if index < 0:
+      index += len(self.plan)
+    plan = self.plan[index] % 1440
+    return DepInfo(f"{plan//60:02}:{plan%60:02}",self.delay[index],
+                   STRINGS.get(self.line[index]),STRINGS.get(self.dir[index]),
+                   self.is_cancelled(index))
+
+  def __iter__(self):
+    for index in range(len(self.plan)):
+      yield self[index]
+
+  def departed(self,index,now):
+    """ check if departure left before now (minutes since 1970) """
+    return self.plan[index] + max(0,self.delay[index]) < now
+
+  def expire(self,now):
+    """ return copy without departures that left before now, or self if
+    nothing departed """
+
+    keep = [i for i in range(len(self.plan)) if not self.departed(i,now)]
+    if len(keep) == len(self.plan):
+      return self
+    info = DepList()
+    for i in keep:
+      info.append(self.plan[i],self.delay[i],STRINGS.get(self.line[i]),
+                  STRINGS.get(self.dir[i]),self.is_cancelled(i))
+    return info
+
+# --- departures of a station   ----------------------------------------------
+
+class StatInfo:
+  """ departure info for a station """
+  __slots__ = ('name','info','update')
+  def __init__(self,name,info,update):
+    self.name   = name
+    self.info   = info
+    self.update = update
+
+  def as_list(self):
+    """ convert to list (for serialization) """
+    info = self.info
+    return [self.name,self.update,
+            [[info.plan[i],info.delay[i],STRINGS.get(info.line[i]),
+              STRINGS.get(info.dir[i]),info.is_cancelled(i)]
+             for i in range(len(info))]]
+
+  def expire(self,now):
+    """ return StatInfo without departed departures (or self) """
+    info = self.info.expire(now)
+    if info is self.info:
+      return self
+    return StatInfo(self.name,info,self.update)
+
+  @staticmethod
+  def from_list(value):
+    """ create StatInfo from list (see as_list()) """
+    name,update,deps = value
+    info = DepList()
+    for d in deps:
+      info.append(*d)
+    return StatInfo(name,info,update)
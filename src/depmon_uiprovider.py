@@ -2,6 +2,10 @@
 # UI provider for the Departure Monitor.
 #
 # This class implements the actual layout of all items on the display.
+# Departures are shown with their time or as countdown (minutes until
+# departure, app_config.display_mode). As a thin client
+# (app_config.render_url), it shows frames rendered by
+# tools/render_service.py instead.
 #
 # Author: Bernhard Bablok
 # License: GPL3
@@ -11,13 +15,15 @@
 # -------------------------------------------------------------------------
 
 import time
-import re
 import gc
 
 import displayio
 
 from settings import app_config
 from ui_settings import UI_SETTINGS
+from metrics import METRICS
+from depmon_model import CLOCK
+import content_decoder
 
 # --- Depmon Class for layout   -------------------------------------------
 
@@ -33,9 +39,29 @@ class DepmonUIProvider:
     self._info   = None
     self._name   = None
     self._update = None
-
-    if not hasattr(app_config,'replace'):
-      self._replace = lambda text: text
+    self._fingerprint = None   # fingerprint of content on the display
+    self._font   = None        # kept across clear_ui()
+    self._dirty  = None        # changed regions, None: complete display
+    self._full   = True        # next update changes the complete display
+
+    # countdown: minutes until departure instead of the time
+    self._countdown = getattr(app_config,'display_mode','time') == 'countdown'
+
+    # cache of prepared pages: (station,row) -> [StatInfo,dep-text,label,
+    # minute of the countdown]
+    self._pages      = {}
+    self._page_order = []      # least recently used first
+    self._page_limit = getattr(app_config,'page_cache',16)
+    self._page_labels = getattr(app_config,'page_labels',False)
+
+    # thin client: the render service (tools/render_service.py) delivers
+    # complete frames, no fonts and labels on the device
+    self._render_url   = getattr(app_config,'render_url',None)
+    self._render_depth = getattr(app_config,'render_depth',1)
+    self._wifi  = None
+    self._etag  = None
+    self._frame = None
+    self.page   = (0,0)        # (row,departures) of the frame (paging)
 
   # --- print debug-message   ------------------------------------------------
 
@@ -44,62 +70,302 @@ class DepmonUIProvider:
     if self._debug:
       print(text)
 
+  # --- fingerprint of content on the display   -----------------------------
+
+  @property
+  def fingerprint(self):
+    """ fingerprint of content on the display """
+    return self._fingerprint
+
+  @fingerprint.setter
+  def fingerprint(self,value):
+    """ set fingerprint (e.g. of the content still visible after a reset) """
+    self._fingerprint = value
+
+  # --- set wifi-object (thin client)   -------------------------------------
+
+  def set_wifi(self,wifi):
+    """ set wifi-object """
+    self._wifi = wifi
+
   # --- update data   --------------------------------------------------------
 
   def update_ui(self,new_data):
-    """ update data: callback for Application """
+    """ update data: callback for Application.
+
+    Returns False if the visible content did not change.
+    """
+
+    if self._render_url:
+      return self._update_frame(new_data)
 
     # update model
     self._bat_level = new_data["bat_level"]
     c_index = new_data["station_index"]
     self._rindex = new_data["row"]
-    self._info   = new_data["departures"][c_index].info
-    self._name   = new_data["departures"][c_index].name
-    self._update = new_data["departures"][c_index].update
+    stat_info = new_data["departures"][c_index]
+    if stat_info:
+      self._info   = stat_info.info
+      self._name   = stat_info.name
+      self._update = stat_info.update
+    else:
+      # no data (fetch failed): station-id, stale-footer and no departures
+      self._info   = None
+      self._name   = str(app_config.stations[c_index][0])
+      self._update = None
+
+    # create content and compare with the content on the display
+    header  = self._name
+    if new_data.get("metrics_page",False):
+      footerL = METRICS.summary()       # hidden footer page
+    elif not stat_info or c_index in new_data.get("stale",{}):
+      footerL = self._get_stale_text()  # last fetch failed
+    else:
+      footerL = self._get_footerL_text()
+    footerR = f"{self._bat_level:0.1f}V"
+    if stat_info:
+      page  = self._get_page(c_index,self._rindex,stat_info,
+                             self._now(self._update))
+    else:
+      page  = [None,"",None,None]       # not cached
+    dep     = page[1]
+    fingerprint = hash((c_index,self._rindex,header,footerL,footerR,dep))
+    fingerprint &= 0xFFFFFFFF
+    if fingerprint == self._fingerprint:
+      self.msg("update_ui: content unchanged")
+      return False
+    self._fingerprint = fingerprint
 
     # update UI
-    self._header.text  = self._replace(self._name)
-    self._footerL.text = self._get_footerL_text()
-    self._footerR.text = f"{self._bat_level:0.1f}V"
-    self._dep.text     = self._replace(self._get_departure_text())
-
-  # --- replace pre-defined strings   ----------------------------------------
-
-  def _replace(self,text):
-    """ replace predefined strings """
-
-    self.msg(f"before replace:")
-    self.msg(f"{text}")
-    patterns = getattr(app_config,'replace',[])
-    result = text
-    for src,dest in patterns:
-      result = re.sub(src,dest,result)
-    self.msg(f"after  replace:")
-    self.msg(f"{result}")
-    return result
+    self._dirty = []
+    self._set_text(self._header,header)
+    self._set_text(self._footerL,footerL)
+    self._set_text(self._footerR,footerR)
+    target = page[2] or self._dep_base     # prepared or standard label
+    if target is not self._dep:
+      self._swap_dep(target)
+    self._set_text(self._dep,dep)
+    if self._full:
+      self._dirty = None
+      self._full  = False
+    return True
+
+  # --- set text and record changed region   ---------------------------------
+
+  def _set_text(self,label,text):
+    """ set text of label and record the changed region """
+
+    if label.text == text:
+      return
+    x0,y0,w0,h0 = self._get_rect(label)
+    label.text = text
+    x1,y1,w1,h1 = self._get_rect(label)
+    # union of old and new area (the old text must be cleared)
+    x,y = min(x0,x1),min(y0,y1)
+    self._dirty.append((x,y,max(x0+w0,x1+w1)-x,max(y0+h0,y1+h1)-y))
+
+  def _get_rect(self,label):
+    """ return area (x,y,width,height) of label on the display """
+    x,y,w,h = label.bounding_box
+    return (label.x+x,label.y+y,w,h)
+
+  # --- replace departure-label with prepared label   ------------------------
+
+  def _swap_dep(self,label):
+    """ replace departure-label with a prepared label """
+
+    x0,y0,w0,h0 = self._get_rect(self._dep)
+    self._view[self._dep_index] = label
+    self._dep = label
+    x1,y1,w1,h1 = self._get_rect(label)
+    x,y = min(x0,x1),min(y0,y1)
+    self._dirty.append((x,y,max(x0+w0,x1+w1)-x,max(y0+h0,y1+h1)-y))
+
+  # --- current minute of the countdown   ------------------------------------
+
+  def _now(self,update):
+    """ return local time in minutes since 1970 (countdown) or None """
+    if not self._countdown:
+      return None
+    return CLOCK.minutes(update)
+
+  # --- page cache   ---------------------------------------------------------
+
+  def _get_page(self,c_index,row,stat_info,now=None):
+    """ return prepared page [stat_info,text,label,now] (label might be
+    None) """
+
+    key  = (c_index,row)
+    page = self._pages.get(key,None)
+    if page and page[0] is stat_info and page[3] == now:
+      if self._page_order[-1] != key:
+        self._page_order.remove(key)
+        self._page_order.append(key)
+      if (not page[2] and self._page_labels and self._view and
+          self._has_memory()):
+        page[2] = self._create_dep_label(page[1])
+      return page
+
+    page = [stat_info,self._get_departure_text(stat_info.info,row,now),None,
+            now]
+    if not self._page_limit:
+      return page
+    if key in self._pages:
+      self._page_order.remove(key)
+    elif len(self._page_order) >= self._page_limit:
+      del self._pages[self._page_order.pop(0)]
+    if self._page_labels and self._view and self._has_memory():
+      page[2] = self._create_dep_label(page[1])
+    self._pages[key] = page
+    self._page_order.append(key)
+    return page
+
+  def _has_memory(self):
+    """ check if there is enough memory for a prepared label """
+    try:
+      return gc.mem_free() > getattr(app_config,'page_labels_min_free',32768)
+    except AttributeError:
+      return True                     # CPython
+
+  def _page_rows(self,n_departures):
+    """ return rows reachable with KEY_DOWN and KEY_UP (see
+    DepMon.process_keys()) """
+
+    step = UI_SETTINGS.ROWS
+    last = max(0,n_departures-step)          # KEY_DOWN clamps to the end
+    rows = list(range(0,last,step)) or [0]   # paging down
+    for row in range(last,0,-step):          # paging up from the end
+      if not row in rows:
+        rows.append(row)
+    return rows
+
+  def prepare(self,data):
+    """ prepare pages of all stations (callback after a data-update).
+
+    Pages of the current station are prepared first, followed by the
+    neighbours. At most app_config.page_cache pages are kept.
+    """
+
+    if (not self._page_limit or self._render_url or
+        not data.get("departures",None)):
+      return
+    n = len(data["departures"])
+    start = data.get("station_index",0)
+    count = 0
+    for i in range(n):
+      c_index = (start + (i+1)//2 * (1 if i % 2 else -1)) % n
+      stat_info = data["departures"][c_index]
+      if stat_info is None:
+        continue
+      for row in self._page_rows(len(stat_info.info)):
+        if count >= self._page_limit:
+          return
+        self._get_page(c_index,row,stat_info,self._now(stat_info.update))
+        count += 1
+    self.msg(f"prepared {count} pages")
+
+  # --- thin client: fetch frame from render service   ----------------------
+
+  def _update_frame(self,new_data):
+    """ fetch frame of the current page and blit it into the bitmap """
+
+    import bitmaptools
+    c_index = new_data["station_index"]
+    url = (f"{self._render_url}?width={self._frame.width}" +
+           f"&height={self._frame.height}&depth={self._render_depth}" +
+           f"&station={c_index}&row={new_data['row']}" +
+           f"&bat={new_data['bat_level']:0.1f}")
+    headers = {"If-None-Match": self._etag} if self._etag else None
+    resp = self._wifi.get(url,headers=headers)
+    try:
+      if resp.status_code in [200,304]:
+        self._read_page(resp)
+      if resp.status_code == 304:
+        self.msg("update_ui: frame unchanged")
+        return False
+      if resp.status_code != 200:
+        raise RuntimeError(f"render service: status {resp.status_code}")
+      # rows are padded to full bytes, first pixel in the MSBs
+      bitmaptools.readinto(self._frame,self._wifi.stream(resp),
+                           self._render_depth,1,True)
+      self._etag = content_decoder.get_header(resp,"etag")
+    finally:
+      self._wifi.close(resp)
+      self._wifi.radio_down()       # noop unless secrets.radio_off is set
+
+    # the ETag is the crc32 of the frame
+    fingerprint = int(self._etag.strip('"'),16) if self._etag else None
+    if fingerprint is not None and fingerprint == self._fingerprint:
+      self.msg("update_ui: content unchanged")
+      return False
+    self._fingerprint = fingerprint
+    self._dirty = None
+    return True
+
+  def _read_page(self,resp):
+    """ read page and clock sent with the frame """
+
+    row = content_decoder.get_header(resp,"x-row")
+    n   = content_decoder.get_header(resp,"x-departures")
+    self.page = (int(row or 0),int(n or 0))
+    now = content_decoder.get_header(resp,"x-time")
+    if now:
+      CLOCK.sync(int(now))          # countdown: redraw every minute
+
+  def _create_frame(self,display):
+    """ create view with a single TileGrid for frames """
+
+    n = 1 << self._render_depth
+    palette = displayio.Palette(n)
+    for i in range(n):
+      palette[i] = (255*i//(n-1))*0x010101      # gray levels, n-1: white
+    self._frame = displayio.Bitmap(display.width,display.height,n)
+    self._view  = displayio.Group()
+    self._view.append(displayio.TileGrid(self._frame,pixel_shader=palette))
+    self._etag  = None
+    return self._view
+
+  # --- query changed regions   ----------------------------------------------
+
+  def dirty_regions(self):
+    """ return list of regions (x,y,width,height) changed by the last
+    update_ui(), or None if the complete display changed """
+    return self._dirty
 
   # --- query footer text   --------------------------------------------------
 
   def _get_footerL_text(self):
     """ pretty print update time """
 
+    if not self._update:
+      return f"{UI_SETTINGS.FOOTER}: ?"
     ltime = getattr(time,'gmtime',time.localtime) # use time.gmtime with CPython
     ts = ltime(self._update)
     return f"{UI_SETTINGS.FOOTER}: {ts.tm_hour:02}:{ts.tm_min:02}:{ts.tm_sec:02}"
 
+  def _get_stale_text(self):
+    """ footer for stale data: time of last successful update """
+
+    if not self._update:
+      return f"{UI_SETTINGS.STALE} ?"
+    ltime = getattr(time,'gmtime',time.localtime) # use time.gmtime with CPython
+    ts = ltime(self._update)
+    return f"{UI_SETTINGS.STALE} {ts.tm_hour:02}:{ts.tm_min:02}"
+
   # --- query departure-text   -----------------------------------------------
 
-  def _get_departure_text(self):
-    """ get departure text """
+  def _get_departure_text(self,info,rindex,now=None):
+    """ get departure text (countdown if now is set) """
+
+    if now is not None:
+      return self._get_countdown_text(info,rindex,now)
 
     # get column-width for delay and line-name
+    rows = range(rindex,min(len(info),rindex+UI_SETTINGS.ROWS))
     wmax_delay = 1
     wmax_line  = 0
-    for index,d in enumerate(self._info):
-      if index < self._rindex:
-        continue
-      elif index == self._rindex + UI_SETTINGS.ROWS:
-        break
+    for index in rows:
+      d = info[index]
       wmax_delay = max(wmax_delay,len(str(d.delay)))
       wmax_line  = max(wmax_line,len(d.line))
 
@@ -109,11 +375,8 @@ class DepmonUIProvider:
 
     # create text
     txt_lines = []
-    for index,d in enumerate(self._info):
-      if index < self._rindex:
-        continue
-      elif index == self._rindex + UI_SETTINGS.ROWS:
-        break
+    for index in rows:
+      d = info[index]
       if d.cancelled:
         sign = ' '
         delay = 'X'*wmax_delay
@@ -130,6 +393,27 @@ class DepmonUIProvider:
                                        d=delay,n=d.line,dir=d.dir))
     return "\n".join(txt_lines)
 
+  def _get_countdown_text(self,info,rindex,now):
+    """ get departure text with minutes until departure (incl. delay) """
+
+    rows = range(rindex,min(len(info),rindex+UI_SETTINGS.ROWS))
+    minutes = [max(0,info.plan[i]+info.delay[i]-now) for i in rows]
+    wmax_min  = max([1]+[len(str(m)) for m in minutes])
+    wmax_line = 0
+    for index in rows:
+      wmax_line = max(wmax_line,len(info[index].line))
+
+    template  = f"{{m:>{wmax_min}}}{UI_SETTINGS.MINUTES}"
+    template += f" {{n:<{wmax_line}.{wmax_line}}} {{dir}}"
+
+    txt_lines = []
+    for index,m in zip(rows,minutes):
+      d = info[index]
+      if d.cancelled:
+        m = 'X'*wmax_min
+      txt_lines.append(template.format(m=m,n=d.line,dir=d.dir))
+    return "\n".join(txt_lines)
+
   # --- create complete UI   -------------------------------------------------
 
   def create_ui(self,display):
@@ -137,14 +421,20 @@ class DepmonUIProvider:
 
     if self._view:
       return self._view
+    if self._render_url:
+      return self._create_frame(display)
 
-    from adafruit_bitmap_font import bitmap_font
     from adafruit_display_text import label as label
     from adafruit_display_shapes.line import Line
     from vectorio import Rectangle
 
     self._view = displayio.Group()
-    font = bitmap_font.load_font(UI_SETTINGS.FONT)
+    self._full = True
+    if not self._font:
+      import glyph_font
+      self._font = glyph_font.load_font(UI_SETTINGS.FONT,
+                                        getattr(app_config,'glyph_cache',128))
+    font = self._font
 
     self._view.append(Rectangle(pixel_shader=UI_SETTINGS.PALETTE,x=0,y=0,
                        width=display.width,
@@ -163,13 +453,11 @@ class DepmonUIProvider:
     self._view.append(sep)
 
     # create departure label (left-middle)
-    self._dep = label.Label(font=font,color=UI_SETTINGS.FG_COLOR,
-                            tab_replacement=(2," "),
-                            line_spacing=1,
-                            text="\n".join(
-                              ["PLACEHOLDER" for _ in range(UI_SETTINGS.ROWS)]),
-                            anchor_point=(0,0.5))
-    self._dep.anchored_position = (UI_SETTINGS.MARGIN,display.height/2)
+    self._height = display.height
+    self._dep = self._create_dep_label(
+      "\n".join(["PLACEHOLDER" for _ in range(UI_SETTINGS.ROWS)]),label.Label)
+    self._dep_base  = self._dep
+    self._dep_index = len(self._view)
     self._view.append(self._dep)
 
     # create footer-label (update-time, left-bottom)
@@ -194,6 +482,21 @@ class DepmonUIProvider:
 
     return self._view
 
+  # --- create departure label   ---------------------------------------------
+
+  def _create_dep_label(self,text,cls=None):
+    """ create departure label (default: bitmap_label for prepared pages) """
+
+    if not cls:
+      from adafruit_display_text.bitmap_label import Label as cls
+    dep = cls(font=self._font,color=UI_SETTINGS.FG_COLOR,
+              tab_replacement=(2," "),
+              line_spacing=1,
+              text=text,
+              anchor_point=(0,0.5))
+    dep.anchored_position = (UI_SETTINGS.MARGIN,self._height/2)
+    return dep
+
   # --- clear UI and free memory   --------------------------------------
 
   def clear_ui(self):
@@ -203,6 +506,11 @@ class DepmonUIProvider:
       for _ in range(len(self._view)):
         self._view.pop()
     self._view = None
+    self._frame = None
+    self._fingerprint = None
+    self._full = True
+    self._pages = {}
+    self._page_order = []
     gc.collect()
 
   # --- handle exception   ---------------------------------------------------
@@ -213,8 +521,13 @@ class DepmonUIProvider:
     # print exception (useful during development)
     print(ex)
 
+    if self._render_url:
+      self._etag = None             # thin client: no labels, keep frame
+      return
     try:
       self.create_ui(display)       # make sure that we have the ui
       self._footerL.text = str(ex)  # update left footer
+      self._fingerprint  = None
+      self._full         = True
     except Exception as e:
       print(e)                      # can't do more
@@ -0,0 +1,101 @@
+# -------------------------------------------------------------------------
+# Backoff and circuit breaker for fetching stations.
+#
+# Stations that failed are retried after an exponentially growing delay
+# (app_config.fetch_backoff, limited by fetch_backoff_max). After
+# app_config.breaker_threshold consecutive failures, the circuit opens
+# and no requests are sent for breaker_timeout seconds. Afterwards a
+# single request probes the API: success closes the circuit, failure
+# opens it again.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import time
+
+from settings import app_config
+from metrics import METRICS
+
+class FetchGuard:
+  """ per-station backoff and circuit breaker """
+
+  def __init__(self,n,debug=False):
+    """ constructor (n: number of stations) """
+
+    self._debug       = debug
+    self._backoff     = getattr(app_config,'fetch_backoff',60)
+    self._backoff_max = getattr(app_config,'fetch_backoff_max',900)
+    self._threshold   = getattr(app_config,'breaker_threshold',3)
+    self._timeout     = getattr(app_config,'breaker_timeout',300)
+    self._failures    = [0]*n        # consecutive failures per station
+    self._next_try    = [0]*n        # earliest time of next request
+    self._consecutive = 0            # consecutive failures (all stations)
+    self._open_until  = None         # circuit open until (None: closed)
+    self._probing     = False        # circuit half-open: probe running
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- check if request is allowed   ----------------------------------------
+
+  def check(self,index):
+    """ return None if a request is allowed, else the reason """
+
+    now = time.monotonic()
+    if self._open_until is not None:
+      if now < self._open_until or self._probing:
+        return f"circuit open for {int(self._open_until-now)}s"
+      self._probing = True           # half-open: a single probe
+      self.msg("circuit half-open, probing")
+      return None
+    if now < self._next_try[index]:
+      return f"retry in {int(self._next_try[index]-now)}s"
+    return None
+
+  def due(self,index):
+    """ check if a retry of a failed station is due (no side-effects) """
+
+    now = time.monotonic()
+    if self._open_until is not None:
+      return now >= self._open_until and not self._probing
+    return now >= self._next_try[index]
+
+  # --- record result   ------------------------------------------------------
+
+  def success(self,index):
+    """ record successful request """
+
+    if self._open_until is not None:
+      self.msg("circuit closed")
+    self._failures[index] = 0
+    self._next_try[index] = 0
+    self._consecutive = 0
+    self._open_until  = None
+    self._probing     = False
+
+  def failure(self,index):
+    """ record failed request """
+
+    METRICS.inc("fetch_errors")
+    now = time.monotonic()
+    self._failures[index] += 1
+    delay = min(self._backoff_max,
+                self._backoff*2**(self._failures[index]-1))
+    self._next_try[index] = now + delay
+    self._consecutive += 1
+    if self._probing or (self._threshold and
+                         self._consecutive >= self._threshold):
+      METRICS.inc("breaker_open")
+      self._open_until = now + self._timeout
+      self._probing    = False
+      self.msg(f"circuit open for {self._timeout}s")
+    else:
+      self.msg(f"station {index}: retry in {delay}s")
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------
+# Loader for precompiled glyph subsets (see tools/compile_font.py).
+#
+# Glyphs are read lazily from the file and kept in a bounded cache. The
+# font implements the interface used by adafruit_display_text
+# (get_bounding_box(), get_glyph(), load_glyphs(), ascent, descent).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import struct
+
+import displayio
+from fontio import Glyph
+
+MAGIC  = b"DMF\x01"
+HEADER = "<4sHhhhhhh"
+RECORD = "<HBBbbbbI"
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+# --- compiled font   --------------------------------------------------------
+
+class GlyphFont:
+  """ font with lazily loaded glyphs """
+
+  def __init__(self,filename,cache_size=128):
+    """ constructor """
+
+    self._file = open(filename,"rb")
+    (magic,self._n,width,height,x,y,
+     self.ascent,self.descent) = struct.unpack(HEADER,
+                                               self._file.read(HEADER_SIZE))
+    if magic != MAGIC:
+      raise ValueError(f"{filename}: unsupported format")
+    self._bbox  = (width,height,x,y)
+    self._index = self._file.read(self._n*RECORD_SIZE)
+    self._cache_size = cache_size
+    self._cache = {}
+    self._order = []             # codepoints, least recently used first
+
+  # --- interface of adafruit_bitmap_font   ----------------------------------
+
+  def get_bounding_box(self):
+    """ return bounding box (width,height,x,y) """
+    return self._bbox
+
+  def load_glyphs(self,code_points):
+    """ preload glyphs """
+    if isinstance(code_points,int):
+      code_points = [code_points]
+    elif isinstance(code_points,str):
+      code_points = [ord(c) for c in code_points]
+    for code_point in code_points:
+      self.get_glyph(code_point)
+
+  def get_glyph(self,code_point):
+    """ return glyph (None if missing) """
+
+    glyph = self._cache.get(code_point,None)
+    if glyph:
+      if self._order[-1] != code_point:
+        self._order.remove(code_point)
+        self._order.append(code_point)
+      return glyph
+
+    glyph = self._read_glyph(code_point)
+    if glyph:
+      if len(self._order) >= self._cache_size:
+        del self._cache[self._order.pop(0)]
+      self._cache[code_point] = glyph
+      self._order.append(code_point)
+    return glyph
+
+  # --- read glyph from file   -----------------------------------------------
+
+  def _find(self,code_point):
+    """ binary search of code_point in index, return record or None """
+
+    low,high = 0,self._n-1
+    while low <= high:
+      mid = (low+high)//2
+      record = struct.unpack_from(RECORD,self._index,mid*RECORD_SIZE)
+      if record[0] == code_point:
+        return record
+      elif record[0] < code_point:
+        low = mid+1
+      else:
+        high = mid-1
+    return None
+
+  def _read_glyph(self,code_point):
+    """ read glyph from file """
+
+    record = self._find(code_point)
+    if not record:
+      return None
+    _,width,height,dx,dy,shift_x,shift_y,offset = record
+    stride = (width+7)//8
+    self._file.seek(offset)
+    data = self._file.read(stride*height)
+
+    bitmap = displayio.Bitmap(width,height,2)
+    for y in range(height):
+      row = y*stride
+      for x in range(width):
+        if data[row + (x >> 3)] & (0x80 >> (x & 7)):
+          bitmap[x,y] = 1
+    return Glyph(bitmap,0,width,height,dx,dy,shift_x,shift_y)
+
+# --- load compiled font or fallback to adafruit_bitmap_font   ---------------
+
+def load_font(filename,cache_size=128):
+  """ load compiled subset (same name with extension .bin) if available """
+
+  compiled = filename.rsplit(".",1)[0] + ".bin"
+  try:
+    return GlyphFont(compiled,cache_size)
+  except OSError:
+    from adafruit_bitmap_font import bitmap_font
+    return bitmap_font.load_font(filename)
@@ -0,0 +1,154 @@
+# -------------------------------------------------------------------------
+# Offline dataprovider for the Departure Monitor.
+#
+# Answers departure queries from a GTFS timetable compiled with
+# tools/gtfs_build.py (app_config.gtfs_file). Needs no network, but a
+# clock with local time (RTC). Departures are planned times only (no
+# delays or cancellations).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import time
+
+from settings import app_config
+from depmon_model import StatInfo, DepList, STRINGS, CLOCK, day_number
+from text_replacer import TextReplacer
+from metrics import METRICS
+from gtfs_index import GtfsIndex, PRODUCTS
+from departure_filter import compile_filter, line_name
+
+# --- main data-provider class   ---------------------------------------------
+
+class GtfsDataProvider:
+
+  def __init__(self,debug=False):
+    self._debug = debug
+    self._filename = getattr(app_config,'gtfs_file','gtfs.bin')
+    self._index = GtfsIndex(self._filename,
+                            getattr(app_config,'gtfs_cache',64))
+    self._max_departures = getattr(app_config,'max_departures',0)
+    self._replace = TextReplacer(getattr(app_config,'replace',[]),
+                                 getattr(app_config,'replace_cache',64))
+    self._stations = [self._compile_query(*station)
+                      for station in app_config.stations]
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- set wifi-object   ----------------------------------------------------
+
+  def set_wifi(self,wifi):
+    """ set wifi-object (unused) """
+    pass
+
+  # --- resolve station-tuple   ----------------------------------------------
+
+  def _compile_query(self,station,via,products,line):
+    """ resolve stop, via-stop, products and line to index-values """
+
+    stop = self._index.stop(station)
+    if not stop:
+      raise ValueError(f"stop {station} not in {self._filename}")
+    via_bit = 0
+    if via:
+      via_bit = self._index.via_bit(via)
+      if not via_bit:
+        raise ValueError(f"via-stop {via} not in {self._filename}")
+    product_bits = 0
+    if products:
+      for p in products.split(","):
+        product_bits |= 1 << PRODUCTS.index(p)
+    # simple filter (exact line name) uses the index, other filters are
+    # applied to the strings (cancelled and delay do not apply)
+    line_index = None
+    accept     = None
+    if line_name(line):
+      # unknown line: never matches
+      line_index = self._index.find_string(line)
+      if line_index is None:
+        line_index = -1
+    else:
+      accept = compile_filter(line)
+    self.msg(f"station {station}: {stop[2]} departures")
+    return (stop,via_bit,line_index,product_bits,accept)
+
+  # --- query departures of a single station   ------------------------------
+
+  def _query_station(self,query,day,minute,updated):
+    """ query departures of a single station and return StatInfo """
+
+    start = time.monotonic()
+    stop,via,line,products,accept = query
+    info = DepList()
+    for plan,line_index,headsign in self._index.departures(
+      stop,day,minute,app_config.duration,
+      0 if accept else self._max_departures,via,line,products):
+      name      = self._index.string(line_index)
+      direction = self._index.string(headsign)
+      if accept and not accept(False,0,direction.encode("utf-8"),
+                               name.encode("utf-8")):
+        continue
+      info.append(1440*day+plan,0,self._replace(name),
+                  self._replace(direction),False)
+      if len(info) == self._max_departures:
+        break
+    if METRICS.enabled:
+      METRICS.observe("time.query",time.monotonic()-start)
+      METRICS.inc("departures",len(info))
+    return StatInfo(self._replace(stop[0]),info,updated)
+
+  # --- query departures   ---------------------------------------------------
+
+  def update_data(self,data):
+    """ callback for App: query data """
+
+    if not "departures" in data:
+      data["departures"] = [None]*len(app_config.stations)
+    data["update"] = None
+
+    now    = time.localtime()
+    day    = day_number(now.tm_year,now.tm_mon,now.tm_mday)
+    minute = 60*now.tm_hour+now.tm_min
+    if self._index.services(day) is None:
+      raise ValueError(
+        f"no timetable for {now.tm_year}-{now.tm_mon:02}-{now.tm_mday:02}")
+    updated = 86400*day+60*minute+now.tm_sec
+    CLOCK.sync(updated)
+
+    for index,query in enumerate(self._stations):
+      data["departures"][index] = self._query_station(query,day,minute,
+                                                      updated)
+
+  # --- drop unused strings   ------------------------------------------------
+
+  def compact(self,data):
+    """ drop line-names and directions no longer in use """
+    STRINGS.compact(data.get("departures",None) or [],
+                    getattr(app_config,'string_table',256))
+
+  # --- interface of DepmonDataProvider (fetch on demand)   ------------------
+
+  def is_stale(self,data,index):
+    """ check if data of station is missing """
+    return not "departures" in data or data["departures"][index] is None
+
+  def update_station(self,data,index):
+    """ query all stations (cheap) """
+    self.update_data(data)
+
+  def retry_stale(self,data):
+    """ no failed requests """
+    return False
+
+  def prefetch(self,data):
+    """ all stations are queried by update_data() """
+    return False
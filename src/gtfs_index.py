@@ -0,0 +1,195 @@
+# -------------------------------------------------------------------------
+# Reader for precompiled GTFS timetables (see tools/gtfs_build.py).
+#
+# Departures of a stop are sorted by time, so a query is a binary search
+# for the first departure plus a scan. Service days are bitsets (one per
+# day, one bit per service), strings are read lazily from the file.
+#
+# Format of the file (little endian):
+#   header:   magic "DMG\x01", first day (days since 1970-01-01), number
+#             of days, services, strings, stops and via-stops
+#   via:      string index of the stop-id per via-stop (bit in records)
+#   stops:    per stop: string index of stop-id and name, offset and
+#             number of departures
+#   calendar: per day: bitset of active services
+#   strings:  offsets (number of strings + 1), utf-8 data
+#   records:  per departure: minutes after midnight of the service day
+#             (may exceed 24h), service, line, headsign, via-bits, product
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import struct
+
+MAGIC  = b"DMG\x01"
+HEADER = "<4sIHHHHB"
+STOP   = "<HHII"
+RECORD = "<HHHHHB"
+HEADER_SIZE = struct.calcsize(HEADER)
+STOP_SIZE   = struct.calcsize(STOP)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+# products of the REST-API (app_config.stations), index is stored per record
+PRODUCTS = ["nationalExpress","national","regionalExpress","regional",
+            "suburban","bus","ferry","subway","tram","taxi"]
+
+CHUNK = 32                        # records per read while scanning
+
+# --- compiled timetable   ---------------------------------------------------
+
+class GtfsIndex:
+  """ departures of a precompiled GTFS-feed """
+
+  def __init__(self,filename,cache_size=64):
+    """ constructor """
+
+    self._file = open(filename,"rb")
+    (magic,self.first_day,self.n_days,n_services,self._n_strings,
+     self._n_stops,n_via) = struct.unpack(HEADER,self._file.read(HEADER_SIZE))
+    if magic != MAGIC:
+      raise ValueError(f"{filename}: unsupported format")
+    self._via    = struct.unpack(f"<{n_via}H",self._file.read(2*n_via))
+    self._stops  = HEADER_SIZE + 2*n_via
+    self._stride = (n_services+7)//8
+    self._calendar = self._stops + self._n_stops*STOP_SIZE
+    self._offsets  = self._calendar + self.n_days*self._stride
+    self._strings  = self._offsets + 4*(self._n_strings+1)
+    self._days  = {}                 # day -> bitset of active services
+    self._cache = {}                 # string index -> string
+    self._cache_size = cache_size
+    self._buffer = bytearray(CHUNK*RECORD_SIZE)
+
+  # --- strings   ------------------------------------------------------------
+
+  def string(self,index):
+    """ return string for index """
+
+    text = self._cache.get(index,None)
+    if text is None:
+      self._file.seek(self._offsets+4*index)
+      start,end = struct.unpack("<II",self._file.read(8))
+      self._file.seek(self._strings+start)
+      text = self._file.read(end-start).decode("utf-8")
+      if len(self._cache) >= self._cache_size:
+        self._cache = {}
+      self._cache[index] = text
+    return text
+
+  def find_string(self,text):
+    """ return index of text or None (linear search, use during setup) """
+
+    for index in range(self._n_strings):
+      if self.string(index) == text:
+        return index
+    return None
+
+  # --- stops and via-stops   ------------------------------------------------
+
+  def stop(self,stop_id):
+    """ return (name,offset,count) of stop or None """
+
+    stop_id = str(stop_id)
+    for i in range(self._n_stops):
+      self._file.seek(self._stops+i*STOP_SIZE)
+      id_index,name,offset,count = struct.unpack(STOP,
+                                                 self._file.read(STOP_SIZE))
+      if self.string(id_index) == stop_id:
+        return (self.string(name),offset,count)
+    return None
+
+  def via_bit(self,stop_id):
+    """ return bitmask of via-stop or None """
+
+    stop_id = str(stop_id)
+    for i,index in enumerate(self._via):
+      if self.string(index) == stop_id:
+        return 1 << i
+    return None
+
+  # --- service calendar   ---------------------------------------------------
+
+  def services(self,day):
+    """ return bitset of active services of day (days since 1970) or None """
+
+    bitset = self._days.get(day,None)
+    if bitset is None:
+      if not 0 <= day-self.first_day < self.n_days:
+        return None
+      self._file.seek(self._calendar+(day-self.first_day)*self._stride)
+      bitset = self._file.read(self._stride)
+      if len(self._days) >= 3:           # yesterday, today, tomorrow
+        self._days = {}
+      self._days[day] = bitset
+    return bitset
+
+  # --- query departures   ---------------------------------------------------
+
+  def _lower_bound(self,offset,count,minute):
+    """ return index of first departure at or after minute """
+
+    low,high = 0,count
+    while low < high:
+      mid = (low+high)//2
+      self._file.seek(offset+mid*RECORD_SIZE)
+      if struct.unpack("<H",self._file.read(2))[0] < minute:
+        low = mid+1
+      else:
+        high = mid
+    return low
+
+  def _scan(self,offset,count,t_from,t_to,active,shift,
+            via,line,products,n,result):
+    """ append up to n matching departures in [t_from,t_to) to result """
+
+    if active is None or t_from >= t_to:
+      return
+    found = 0
+    index = self._lower_bound(offset,count,t_from)
+    self._file.seek(offset+index*RECORD_SIZE)
+    buffer = memoryview(self._buffer)
+    while index < count:
+      size = min(CHUNK,count-index)*RECORD_SIZE
+      self._file.readinto(buffer[0:size])
+      for pos in range(0,size,RECORD_SIZE):
+        minute,service,line_index,headsign,via_bits,product = (
+          struct.unpack_from(RECORD,self._buffer,pos))
+        if minute >= t_to:
+          return
+        if (not active[service >> 3] & (1 << (service & 7)) or
+            (via and not via_bits & via) or
+            (line is not None and line_index != line) or
+            (products and not products & (1 << product))):
+          continue
+        result.append((minute-shift,line_index,headsign))
+        found += 1
+        if found == n:
+          return
+      index += size//RECORD_SIZE
+
+  def departures(self,stop,day,minute,horizon,n=0,via=0,line=None,
+                 products=0):
+    """ return sorted list of (minute,line,headsign) of departures at stop
+    (see stop()) within horizon minutes. Minutes are relative to the
+    start of day and line/headsign are string indices. Filters:
+    via-bitmask (see via_bit()), string index of line and bitmask of
+    products (index into PRODUCTS).
+    """
+
+    _,offset,count = stop
+    t_to = minute+horizon
+    n = n or count
+    result = []
+    # trips of yesterday after midnight, today, and tomorrow (horizon
+    # crosses midnight)
+    self._scan(offset,count,minute+1440,t_to+1440,self.services(day-1),
+               1440,via,line,products,n,result)
+    self._scan(offset,count,minute,t_to,self.services(day),
+               0,via,line,products,n,result)
+    self._scan(offset,count,max(0,minute-1440),t_to-1440,
+               self.services(day+1),-1440,via,line,products,n,result)
+    result.sort()
+    return result[:n]
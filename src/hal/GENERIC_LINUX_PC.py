@@ -18,14 +18,35 @@ import sys
 import time
 import board
 from hal.hal_base import HalBase
+from metrics import METRICS
+try:
+  from settings import app_config
+  DEBUG = getattr(app_config,'debug',False)
+except:
+  DEBUG = False
 
 class HalPygame(HalBase):
   """ GENERIC_LINUX_PC specific HAL-class """
 
-  def show(self,content):
-    """ show and refresh the display """
+  def show(self,content,dirty=None):
+    """ show and refresh the display (always complete, dirty regions
+    are only logged) """
     self._display.show(content)
     self._display.refresh()
+    self._log_regions(dirty)
+
+  def _log_regions(self,dirty):
+    """ log dirty regions and the pixels a partial update would save """
+    total = self._display.width*self._display.height
+    if dirty is None:
+      pixels = total
+    else:
+      pixels = min(total,sum([r[2]*r[3] for r in dirty]))
+    METRICS.inc("pixels_refreshed",pixels)
+    METRICS.inc("pixels_total",total)
+    if DEBUG:
+      print(f"dirty regions: {'all' if dirty is None else dirty} " +
+            f"({pixels}/{total} pixels, {100*pixels/total:.0f}%)")
 
   def bat_level(self):
     """ return battery level """
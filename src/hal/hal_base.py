@@ -106,8 +106,14 @@ class HalBase:
         self._display = self._display(self)
     return self._display
 
-  def show(self,content):
-    """ show and refresh the display """
+  def show(self,content,dirty=None):
+    """ show and refresh the display.
+
+    dirty is a list of changed regions (x,y,width,height) or None if
+    the complete display changed. HALs of panels with partial updates
+    override this method, the default always refreshes the complete
+    display.
+    """
 
     self._display.root_group = content
 
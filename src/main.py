@@ -15,6 +15,10 @@
 
 import sys
 import time
+try:
+  import asyncio
+except ImportError:
+  asyncio = None               # only needed for app_config.runtime = "async"
 try:
   import pygame
   alarm = {}
@@ -25,9 +29,18 @@ except:
 
 from application import Application
 from depmon_uiprovider   import DepmonUIProvider   as UIProvider
-from depmon_dataprovider import DepmonDataProvider as DataProvider
 from settings import app_config
+if getattr(app_config,'render_url',None):
+  from thin_dataprovider import ThinDataProvider as DataProvider
+elif getattr(app_config,'provider','rest') == 'gtfs':
+  from gtfs_dataprovider import GtfsDataProvider as DataProvider
+else:
+  from depmon_dataprovider import DepmonDataProvider as DataProvider
 from ui_settings import UI_SETTINGS
+from metrics import METRICS
+from update_scheduler import UpdateScheduler
+from snapshot import Snapshot
+from depmon_model import CLOCK
 
 DEBUG = getattr(app_config,'debug',False)
 
@@ -56,64 +69,231 @@ class DepMon(Application):
     data_provider = DataProvider(debug=DEBUG)
     super().__init__(data_provider,ui_provider,with_rtc=False,debug=DEBUG)
     self.blink(0.1,color=Application.GREEN)
+    self._scheduler   = UpdateScheduler(debug=DEBUG)
+    self._interval    = app_config.upd_time
+    self._next_update = 0
+
+    # countdown: recomputed locally every minute, no update necessary
+    self._countdown = getattr(app_config,'display_mode','time') == 'countdown'
+    self._minute    = None
+
+    # thin client: the render service knows the departures
+    self._thin = bool(getattr(app_config,'render_url',None))
 
     # fill initial values for model
     self.data["row"]           = 0
     self.data["station_index"] = 0
+    self.data["metrics_page"]  = False
+    self._snapshot = Snapshot(debug=DEBUG)
+    self._restored = self.restore()
     try:
       if hasattr(alarm,'sleep_memory'):
         index = alarm.sleep_memory[0]
         if index < len(app_config.stations):
+          if index != self.data["station_index"]:
+            self.data["row"] = 0
           self.data["station_index"] = index
     except:
       pass
 
+  # --- restore snapshot   ---------------------------------------------------
+
+  def restore(self):
+    """ restore model and schedule from the last snapshot """
+
+    result = self._snapshot.restore()
+    if not result:
+      return False
+    data,saved,interval,fingerprint = result
+    self.data.update(data)
+
+    # keep schedule if the next update is not due yet
+    now = time.monotonic()
+    if saved <= now < saved+interval:
+      self._interval    = interval
+      self._next_update = saved+interval
+
+    # e-ink displays keep their content across resets
+    if not self.is_pygame:
+      self._uiprovider.fingerprint = fingerprint
+    return True
+
+  # --- draw current model   -------------------------------------------------
+
+  def draw(self):
+    """ draw current model (e.g. after restore) without update """
+
+    try:
+      self.data["bat_level"] = self.bat_level()
+      self.create_ui()
+      self.update_display()
+    except Exception as ex:
+      self.handle_exception(ex)
+
+  # --- update and schedule next update   ------------------------------------
+
+  def update(self):
+    """ run update-cycle and compute time of the next update """
+
+    start = time.monotonic()
+    self.run()
+    self._interval    = self._scheduler.next_interval(self.data)
+    self._next_update = start + self._interval
+    self._snapshot.save(self.data,start,self._interval,
+                        self._uiprovider.fingerprint or 0)
+
+  # --- fetch station on demand (lazy mode)   --------------------------------
+
+  def update_station(self,index):
+    """ fetch data of the given station if missing or too old """
+
+    if not self._dataprovider.is_stale(self.data,index):
+      return True
+    try:
+      self.blink(0.3,color=Application.RED)
+      self._dataprovider.update_station(self.data,index)
+      self.blink(0.3,color=Application.GREEN)
+      self.prepare_ui()
+      return True
+    except Exception as ex:
+      self.handle_exception(ex)
+      return False
+
+  # --- retry failed stations   ---------------------------------------------
+
+  def retry_stale(self):
+    """ refetch failed stations when their backoff expired """
+
+    if not self.data.get("stale",None):
+      return
+    try:
+      if self._dataprovider.retry_stale(self.data):
+        self.prepare_ui()
+        self.update_display()
+    except Exception as ex:
+      self.handle_exception(ex)
+
+  # --- prefetch neighbour stations (lazy mode)   ----------------------------
+
+  def prefetch(self):
+    """ prefetch stations reachable with KEY_LEFT/KEY_RIGHT """
+
+    try:
+      if self._dataprovider.prefetch(self.data):
+        self.prepare_ui()
+    except Exception as ex:
+      self.msg(f"prefetch failed: {ex}")
+
+  # --- update countdown   ---------------------------------------------------
+
+  def countdown(self):
+    """ drop departed trains and redraw once per minute (countdown) """
+
+    if not self._countdown or not self.data.get("departures",None):
+      return
+    now = CLOCK.minutes()
+    if now is None or now == self._minute:
+      return
+    self._minute = now
+    departures = self.data["departures"]
+    for index,stat_info in enumerate(departures):
+      if stat_info:
+        departures[index] = stat_info.expire(now)
+
+    # keep row within the remaining departures
+    n_departures = self._n_departures(self.data["station_index"])
+    self.data["row"] = max(0,min(self.data["row"],
+                                 n_departures-UI_SETTINGS.ROWS))
+    try:
+      self.create_ui()
+      self.update_display()
+    except Exception as ex:
+      self.handle_exception(ex)
+
+  def _sleep_time(self):
+    """ seconds until the next update or the next minute (countdown) """
+
+    duration = self._next_update - time.monotonic()
+    now = CLOCK.now()
+    if self._countdown and now is not None:
+      duration = min(duration,60 - now % 60)
+    return max(0,duration)
+
+  # --- number of departures of a station   ---------------------------------
+
+  def _n_departures(self,index):
+    """ return number of departures of station (0: no data) """
+    if self._thin:
+      return self._uiprovider.page[1]     # of the frame on the display
+    departures = self.data.get("departures",None)
+    if not departures or departures[index] is None:
+      return 0
+    return len(departures[index].info)
+
+  # --- set station index   --------------------------------------------------
+
+  def _set_station(self,index,row=0):
+    """ set station index and row, keep index across deep-sleep """
+
+    self.data["station_index"] = index
+    self.data["row"] = row
+    try:
+      if hasattr(alarm,'sleep_memory'):
+        alarm.sleep_memory[0] = index
+    except:
+      pass
+
   # --- process keys by number   ----------------------------------------------
 
   def process_keys(self,key_nr):
     """ process key by nr: up, down, left, right """
 
     self.msg(f"process_keys for: {key_nr}")
+    start = time.monotonic()
     c_index = self.data["station_index"]
-    n_departures = len(self.data["departures"][c_index].info)
+    if self._thin:
+      self.data["row"] = self._uiprovider.page[0]  # clamped by the service
+    c_row   = self.data["row"]
+    n_departures = self._n_departures(c_index)
 
     if  key_nr == DepMon.KEY_RIGHT:
       if c_index < len(app_config.stations)-1:
-        self.data["station_index"] += 1
+        self._set_station(c_index+1)
       else:
-        self.data["station_index"] = 0     # wrap-around
-
-      self.data["row"] = 0
-      try:
-        if hasattr(alarm,'sleep_memory'):
-          alarm.sleep_memory[0] = self.data["station_index"]
-      except:
-        pass
+        self._set_station(0)              # wrap-around
 
     elif key_nr == DepMon.KEY_LEFT:
       if c_index > 0:
-        self.data["station_index"] -= 1
+        self._set_station(c_index-1)
       else:                               # wrap-around
-        self.data["station_index"] = len(app_config.stations)-1
-      self.data["row"] = 0
-      try:
-        if hasattr(alarm,'sleep_memory'):
-          alarm.sleep_memory[0] = self.data["station_index"]
-      except:
-        pass
+        self._set_station(len(app_config.stations)-1)
 
     elif key_nr == DepMon.KEY_DOWN:
       self.data["row"] += UI_SETTINGS.ROWS
       if self.data["row"] > n_departures-UI_SETTINGS.ROWS:
         self.data["row"] = max(0,n_departures-UI_SETTINGS.ROWS)
     elif key_nr == DepMon.KEY_UP:
+      if self.data["row"] == 0 and METRICS.enabled:
+        # KEY_UP on the first page: toggle metrics footer and export metrics
+        self.data["metrics_page"] = not self.data["metrics_page"]
+        if self.data["metrics_page"]:
+          self.export_metrics()
       self.data["row"] -= UI_SETTINGS.ROWS
       if self.data["row"] < 0:
         self.data["row"] = 0
     else:
       return
+    if key_nr in [DepMon.KEY_LEFT,DepMon.KEY_RIGHT]:
+      if not self.update_station(self.data["station_index"]):
+        self._set_station(c_index,c_row)  # stay on the previous station
+        return
     self.update_display()
 
+    # latency from key-press to refreshed display
+    duration = time.monotonic()-start
+    METRICS.observe("time.key",duration)
+    self.msg(f"key to refresh: {duration:f}s")
+
   # --- key-handler for PyGame-Display environment   -------------------------
 
   def on_event(self,ev):
@@ -135,15 +315,20 @@ class DepMon(Application):
     if app_config.off_time and rest_time <= 0:
       self.msg(f"shutdown due to {app_config.off_time}s of inactivity")
       self.shutdown()
+    elif time.monotonic() < self._next_update:
+      self.retry_stale()
+      self.countdown()
+      return                                     # next update not due
     else:
       if app_config.off_time:
-        rest_time = max(app_config.upd_time,int(rest_time))
+        rest_time = max(self._interval,int(rest_time))
         self.msg(f"about {rest_time}s left before auto-shutdown")
 
     # next cycle: fetch data and update display
     # note: this should be in a separate thread, not in the event-handler,
     #       but for simplicity, we do it here
-    self.run()
+    self.update()
+    self.prefetch()
 
   # --- main loop for PyGame-Display environment   ---------------------------
 
@@ -153,15 +338,19 @@ class DepMon(Application):
     # track time of inactivity for automatic shutdown
     self._last_key_time = time.monotonic()
 
-    self.run()
+    if self._restored:
+      self.draw()
+    if time.monotonic() >= self._next_update:
+      self.update()
+      self.prefetch()
     self.display.event_loop(
-      interval=app_config.upd_time,
+      interval=self._scheduler.tick,
       on_time=self.on_time, on_event=self.on_event, events=[pygame.KEYDOWN])
 
   # --- main loop for normal CircuitPython environment   ---------------------
 
-  def run_cp(self):
-    """ main-loop for normal environment """
+  def _init_keys(self):
+    """ create event-queue for keys """
 
     if self.keys and self._evqueue is None:
       keys = keypad.Keys(self.keys[1],
@@ -169,23 +358,39 @@ class DepMon(Application):
                          interval=0.1,max_events=4)
       self._evqueue = keys.events
 
+  def run_cp(self):
+    """ main-loop for normal environment """
+
+    self._init_keys()
+
     # track time of inactivity for automatic shutdown
     self._last_key_time = time.monotonic()
 
+    # draw restored snapshot (the update is skipped if not due yet)
+    if self._restored:
+      self.draw()
+
     while True:
-      start = time.monotonic()
-      self.run()
+      if time.monotonic() >= self._next_update:
+        self.update()
+        if self.keys:
+          # clear pending key-events (i.e. keys pressed during self.run())
+          self._evqueue.clear()
       if self.keys:
-        # clear pending key-events (i.e. keys pressed during self.run())
-        self._evqueue.clear()
+        self.prefetch()             # uses idle time, keys are queued
         self.msg("polling for keys...")
-        while time.monotonic()-start < app_config.upd_time:
+        while time.monotonic() < self._next_update:
           event = self._evqueue.get()
           if event and event.pressed:
             self._last_key_time = time.monotonic()
             self.process_keys(event.key_number)
+          else:
+            self.retry_stale()
+            self.countdown()
       else:
-        self.sleep(app_config.upd_time - (time.monotonic()-start))
+        while time.monotonic() < self._next_update:
+          self.sleep(self._sleep_time())
+          self.countdown()
 
       # check for auto-shutdown if no activity for longer than off_time
       rest_time = app_config.off_time - (time.monotonic()-self._last_key_time)
@@ -196,32 +401,136 @@ class DepMon(Application):
         #self.free_ui_memory()
         self.reset()  # hack for systems with low memory, noop otherwise
         if app_config.off_time:
-          rest_time = max(app_config.upd_time,int(rest_time))
+          rest_time = max(self._interval,int(rest_time))
           self.msg(f"about {rest_time}s left before auto-shutdown")
 
+  # --- asyncio runtime   ----------------------------------------------------
+
+  def run_async(self):
+    """ run data-fetching, key-handling and display-refresh as tasks """
+    asyncio.run(self._main_async())
+
+  async def _main_async(self):
+    """ main coroutine """
+
+    self._refresh = asyncio.Event()
+    self._last_key_time = time.monotonic()
+    if not self.is_pygame:
+      self._init_keys()
+    if self._restored:
+      self.draw()
+    await asyncio.gather(self._fetch_task(),self._key_task(),
+                         self._display_task())
+
+  async def _fetch_task(self):
+    """ fetch data into the back-buffer and swap it in """
+
+    # CPython: fetch in a thread, CircuitPython: fetch blocks, but keys
+    # are queued by keypad and processed afterwards
+    threads = hasattr(asyncio,"to_thread")
+    first   = True
+    while True:
+      await asyncio.sleep(max(0,self._next_update-time.monotonic()))
+      if not first:
+        self.reset()  # hack for systems with low memory, noop otherwise
+      first = False
+
+      start = time.monotonic()
+      METRICS.inc("cycles")
+      try:
+        if threads:
+          back = await asyncio.to_thread(self.fetch_data)
+        else:
+          back = self.fetch_data()
+        self.swap_data(back)
+      except Exception as ex:
+        self.handle_exception(ex)
+      self._interval    = self._scheduler.next_interval(self.data)
+      self._next_update = start + self._interval
+      self._refresh.set()
+      await asyncio.sleep(0)        # let the display-task run first
+      self.prefetch()
+
+  async def _display_task(self):
+    """ refresh display after a data-update """
+
+    while True:
+      await self._refresh.wait()
+      self._refresh.clear()
+      try:
+        self.create_ui()
+        self.update_display()
+        self.prepare_ui()
+      except Exception as ex:
+        self.handle_exception(ex)
+      self._snapshot.save(self.data,self._next_update-self._interval,
+                          self._interval,self._uiprovider.fingerprint or 0)
+
+  async def _key_task(self):
+    """ process keys and check for auto-shutdown """
+
+    while True:
+      keys = []
+      if self.is_pygame:
+        if self.display.check_quit():
+          sys.exit(0)
+        for ev in pygame.event.get(pygame.KEYDOWN):
+          if ev.key in [pygame.K_ESCAPE,pygame.K_q]:
+            sys.exit(0)
+          elif ev.key in DepMon.PYGAME_KEYMAP:
+            keys.append(DepMon.PYGAME_KEYMAP[ev.key])
+      elif self._evqueue:
+        event = self._evqueue.get()
+        while event:
+          if event.pressed:
+            keys.append(event.key_number)
+          event = self._evqueue.get()
+
+      for key in keys:
+        self._last_key_time = time.monotonic()
+        if not self.data.get("departures",None):
+          continue                          # no data yet
+        try:
+          self.process_keys(key)
+        except Exception as ex:
+          self.handle_exception(ex)
+
+      self.retry_stale()
+      self.countdown()
+
+      # check for auto-shutdown if no activity for longer than off_time
+      if (app_config.off_time and
+          time.monotonic()-self._last_key_time > app_config.off_time):
+        self.msg(f"shutdown due to {app_config.off_time}s of inactivity")
+        self.shutdown()
+      await asyncio.sleep(0.05)
+
 # --- main application code   -------------------------------------------------
 
-app = DepMon()
-exc_count = 0
-exc_max = getattr(app_config,"error_count",1)
+if __name__ == "__main__":
+  app = DepMon()
+  exc_count = 0
+  exc_max = getattr(app_config,"error_count",1)
 
-# retry even on error for at least error_count times
-while exc_count < exc_max:
-  try:
-    if app.is_pygame:
-      app.run_pygame()
-    else:
-      app.run_cp()
-  except Exception as ex:
-    exc_count += 1
-    app.msg(f"exception {exc_count} occured: {ex}")
-
-    # restart or end program
-    app.msg(f"exception count reached {exc_max}")
-    if getattr(app_config,"error_reset",False):
-      app.msg("forcing reset of device")
-      import supervisor
-      supervisor.reload()
-    else:
-      app.msg("app_config.error_reset unset or False. Stopping!")
-      raise ex
+  # retry even on error for at least error_count times
+  while exc_count < exc_max:
+    try:
+      if getattr(app_config,"runtime","loop") == "async":
+        app.run_async()
+      elif app.is_pygame:
+        app.run_pygame()
+      else:
+        app.run_cp()
+    except Exception as ex:
+      exc_count += 1
+      app.msg(f"exception {exc_count} occured: {ex}")
+
+      # restart or end program
+      app.msg(f"exception count reached {exc_max}")
+      if getattr(app_config,"error_reset",False):
+        app.msg("forcing reset of device")
+        import supervisor
+        supervisor.reload()
+      else:
+        app.msg("app_config.error_reset unset or False. Stopping!")
+        raise ex
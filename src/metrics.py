@@ -0,0 +1,163 @@
+# -------------------------------------------------------------------------
+# Metrics: counters, gauges and fixed-bucket histograms.
+#
+# Usage: "from metrics import METRICS". With app_config.metrics unset,
+# METRICS is a null-object whose methods do nothing.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import gc
+import time
+import json
+
+from settings import app_config
+
+# buckets for durations (seconds)
+TIME_BUCKETS = (0.01,0.05,0.1,0.25,0.5,1,2,5,10,30)
+
+# --- histogram   ------------------------------------------------------------
+
+class Histogram:
+  """ histogram with fixed buckets """
+
+  def __init__(self,buckets):
+    """ constructor """
+    self.buckets = buckets
+    self.counts  = [0]*(len(buckets)+1)     # last bucket: overflow
+    self.count   = 0
+    self.sum     = 0.0
+    self.last    = None
+
+  def observe(self,value):
+    """ add value """
+    i = 0
+    for limit in self.buckets:
+      if value <= limit:
+        break
+      i += 1
+    self.counts[i] += 1
+    self.count += 1
+    self.sum   += value
+    self.last   = value
+
+  def snapshot(self):
+    """ return compact representation """
+    return {"n": self.count, "sum": round(self.sum,3), "last": self.last,
+            "counts": self.counts}
+
+# --- metrics registry   -----------------------------------------------------
+
+class Metrics:
+  """ registry of metrics """
+
+  enabled = True
+
+  def __init__(self):
+    """ constructor """
+    self._counters   = {}
+    self._gauges     = {}
+    self._histograms = {}
+
+  def inc(self,name,value=1):
+    """ increment counter """
+    self._counters[name] = self._counters.get(name,0) + value
+
+  def set(self,name,value):
+    """ set gauge """
+    self._gauges[name] = value
+
+  def observe(self,name,value,buckets=TIME_BUCKETS):
+    """ add value to histogram """
+    hist = self._histograms.get(name,None)
+    if not hist:
+      hist = Histogram(buckets)
+      self._histograms[name] = hist
+    hist.observe(value)
+
+  def mem_free(self,name):
+    """ set gauge to gc.mem_free() (not available with CPython) """
+    try:
+      self._gauges[name] = gc.mem_free()
+    except AttributeError:
+      pass
+
+  def get(self,name,default=None):
+    """ return value of counter or gauge or last value of histogram """
+    if name in self._counters:
+      return self._counters[name]
+    elif name in self._gauges:
+      return self._gauges[name]
+    elif name in self._histograms:
+      return self._histograms[name].last
+    return default
+
+  def snapshot(self):
+    """ return all metrics """
+    return {
+      "time":       time.monotonic(),
+      "counters":   self._counters,
+      "gauges":     self._gauges,
+      "histograms": {name: hist.snapshot()
+                     for name,hist in self._histograms.items()}
+      }
+
+  def summary(self):
+    """ return a one-line summary (for the footer) """
+    upd = self.get("time.update_data",0) or 0
+    mem = self.get("mem.update_data.after",None)
+    text = (f"C{self.get('cycles',0)} U{upd:.1f}s " +
+            f"R{self.get('refresh',0)}/{self.get('refresh_skipped',0)} " +
+            f"E{self.get('errors',0)}")
+    if mem is not None:
+      text += f" M{mem//1024}k"
+    return text
+
+  def export(self,filename=None):
+    """ print snapshot to the console (serial) and write it to a file """
+
+    data = json.dumps(self.snapshot())
+    print(data)
+    if filename:
+      try:
+        with open(filename,"w") as f:
+          f.write(data)
+      except OSError as ex:
+        print(f"metrics: cannot write {filename}: {ex}")
+
+# --- null-object (metrics disabled)   ---------------------------------------
+
+class NullMetrics:
+  """ metrics disabled: all methods are noops """
+
+  enabled = False
+
+  def inc(self,name,value=1):
+    pass
+
+  def set(self,name,value):
+    pass
+
+  def observe(self,name,value,buckets=None):
+    pass
+
+  def mem_free(self,name):
+    pass
+
+  def get(self,name,default=None):
+    return default
+
+  def snapshot(self):
+    return {}
+
+  def summary(self):
+    return "metrics disabled"
+
+  def export(self,filename=None):
+    pass
+
+METRICS = Metrics() if getattr(app_config,'metrics',False) else NullMetrics()
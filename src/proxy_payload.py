@@ -0,0 +1,136 @@
+# -------------------------------------------------------------------------
+# Compact departure payload of the edge proxy (tools/depproxy.py).
+#
+# The payload is line based text (utf-8) and needs no json-parsing:
+#
+#   DMP2<TAB>updated<TAB>number of departures
+#   station name
+#   plan<TAB>delay<TAB>cancelled<TAB>line<TAB>direction   (per departure)
+#
+# updated is realtimeDataUpdatedAt in local time (seconds since 1970),
+# plan is local time in minutes since 1970, delay in minutes and
+# cancelled is 0 or 1.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+MAGIC = b"DMP2"
+
+# --- encode (proxy)   -------------------------------------------------------
+
+def _clean(text):
+  """ remove separators from text """
+  return (text or "").replace("\t"," ").replace("\n"," ")
+
+def encode_header(updated,count,name):
+  """ return header lines """
+  return (f"DMP2\t{updated or 0}\t{count}\n{_clean(name)}\n").encode("utf-8")
+
+def encode_departure(plan,delay,cancelled,line,direction):
+  """ return line of a single departure """
+  return (f"{plan}\t{delay}\t{1 if cancelled else 0}\t" +
+          f"{_clean(line)}\t{_clean(direction)}\n").encode("utf-8")
+
+# --- decode (device)   ------------------------------------------------------
+
+class PayloadReader:
+  """ read payload with a fixed-size buffer.
+
+  readinto is a function that fills a buffer and returns the number of
+  bytes (0 at the end of the data). departures() yields tuples (plan,
+  delay, cancelled, line, direction). name and updated are available
+  after the first departure (or the end of the iteration). If the
+  caller stops early, complete is False.
+  """
+
+  def __init__(self,readinto,size=256):
+    """ constructor """
+
+    self._readinto = readinto
+    self._buf   = bytearray(size)
+    self._mv    = memoryview(self._buf)
+    self._start = 0
+    self._end   = 0
+    self.name     = None
+    self.updated  = None
+    self.count    = 0
+    self.bytes    = 0                # bytes received
+    self.complete = False
+
+  # --- read next line   -----------------------------------------------------
+
+  def _line(self):
+    """ return (start,end) of the next line within the buffer """
+
+    while True:
+      nl = self._buf.find(b"\n",self._start,self._end)
+      if nl >= 0:
+        start = self._start
+        self._start = nl+1
+        return (start,nl)
+
+      # move partial line to the front and read more data
+      n = self._end - self._start
+      if n == len(self._buf):
+        raise ValueError("payload: line exceeds buffer")
+      if self._start:
+        self._buf[0:n] = self._buf[self._start:self._end]
+        self._start = 0
+        self._end   = n
+      count = self._readinto(self._mv[n:])
+      if not count:
+        raise ValueError("payload: unexpected end of data")
+      self.bytes += count
+      self._end  += count
+
+  def _fields(self,start,end,n):
+    """ split line into n fields (positions) """
+
+    fields = []
+    for _ in range(n-1):
+      tab = self._buf.find(b"\t",start,end)
+      if tab < 0:
+        raise ValueError("payload: invalid line")
+      fields.append((start,tab))
+      start = tab+1
+    fields.append((start,end))
+    return fields
+
+  def _int(self,field):
+    """ convert field to int """
+    return int(self._buf[field[0]:field[1]].decode())
+
+  def _str(self,field):
+    """ convert field to str """
+    return self._buf[field[0]:field[1]].decode("utf-8")
+
+  # --- iterate over departures   --------------------------------------------
+
+  def departures(self,accept=None):
+    """ yield departures (accepted by the optional predicate, see
+    departure_filter.py) """
+
+    start,end = self._line()
+    magic,updated,count = self._fields(start,end,3)
+    if self._buf[magic[0]:magic[1]] != MAGIC:
+      raise ValueError("payload: unsupported format")
+    self.updated = self._int(updated) or None
+    self.count   = self._int(count)
+    self.name    = self._str(self._line())
+
+    for _ in range(self.count):
+      start,end = self._line()
+      plan,delay,cancelled,line,direction = self._fields(start,end,5)
+      cancelled = self._buf[cancelled[0]] == 49
+      delay     = self._int(delay)
+      if accept and not accept(cancelled,delay,
+                               bytes(self._mv[direction[0]:direction[1]]),
+                               bytes(self._mv[line[0]:line[1]])):
+        continue
+      yield (self._int(plan),delay,cancelled,self._str(line),
+             self._str(direction))
+    self.complete = True
@@ -0,0 +1,182 @@
+# -------------------------------------------------------------------------
+# Response cache for departure queries.
+#
+# The cache keeps the parsed result of a query together with the
+# validators (ETag, Last-Modified) of the response and a checksum of the
+# body. Entries are kept in memory and optionally in a directory on
+# flash/disk, so they survive a reset of the device.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import time
+import json
+import binascii
+
+from content_decoder import get_header
+
+FORMAT = 2                     # format of stored results (see StatInfo)
+
+# --- helper functions   -----------------------------------------------------
+
+def _chain(head,tail):
+  """ yield buffered chunks, then the rest of the stream """
+  for chunk in head:
+    yield chunk
+  for chunk in tail:
+    yield chunk
+
+# --- cache class   ----------------------------------------------------------
+
+class ResponseCache:
+  """ cache for parsed responses keyed by query-url """
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self,path=None,ttl=0,max_body=0,debug=False):
+    """ constructor """
+
+    self._debug    = debug
+    self._path     = path
+    self._ttl      = ttl
+    self._max_body = max_body
+    self._entries  = {}
+    self.hits      = 0
+    self.misses    = 0
+
+    if self._path:
+      try:
+        import os
+        os.mkdir(self._path)
+      except OSError:
+        pass                       # exists or read-only
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- filename of entry   --------------------------------------------------
+
+  def _filename(self,url):
+    """ return filename for url """
+    return f"{self._path}/{binascii.crc32(url.encode()):08x}.json"
+
+  # --- lookup entry   -------------------------------------------------------
+
+  def lookup(self,url):
+    """ return entry for url or None """
+
+    entry = self._entries.get(url,None)
+    if entry or not self._path:
+      return entry
+    try:
+      with open(self._filename(url),"r") as f:
+        entry = json.load(f)
+      if entry["url"] != url or entry.get("format",1) != FORMAT:
+        return None                 # crc-collision or outdated entry
+      self._entries[url] = entry
+    except Exception:
+      entry = None
+    return entry
+
+  # --- check age of entry   -------------------------------------------------
+
+  def is_fresh(self,entry):
+    """ check if entry is younger than ttl """
+    age = time.time() - entry["time"]
+    return 0 <= age < self._ttl
+
+  # --- create headers for conditional request   -----------------------------
+
+  def validators(self,entry):
+    """ return headers for a conditional request """
+
+    headers = {}
+    if entry and entry["etag"]:
+      headers["If-None-Match"] = entry["etag"]
+    if entry and entry["modified"]:
+      headers["If-Modified-Since"] = entry["modified"]
+    return headers
+
+  # --- read body   ----------------------------------------------------------
+
+  def read_body(self,chunks):
+    """ buffer up to max_body bytes of the body and calculate checksum.
+
+    Returns the chunks and the checksum. Larger bodies are passed through
+    unbuffered and without checksum.
+    """
+
+    if not self._max_body:
+      return chunks, None
+
+    buffer = []
+    size   = 0
+    crc    = 0
+    for chunk in chunks:
+      buffer.append(chunk)
+      size += len(chunk)
+      crc = binascii.crc32(chunk,crc)
+      if size > self._max_body:
+        return _chain(buffer,chunks), None
+    return buffer, crc
+
+  # --- record hit or miss   -------------------------------------------------
+
+  def hit(self,url,reason):
+    """ record cache hit """
+    self.hits += 1
+    self.msg(f"cache hit ({reason}): {self.hits} hits, {self.misses} misses")
+
+  def miss(self,url):
+    """ record cache miss """
+    self.misses += 1
+    self.msg(f"cache miss: {self.hits} hits, {self.misses} misses")
+
+  # --- refresh timestamp of entry   -----------------------------------------
+
+  def touch(self,url):
+    """ mark entry as current """
+    entry = self._entries.get(url,None)
+    if entry:
+      entry["time"] = time.time()
+      self._save(url,entry)
+
+  # --- store result   -------------------------------------------------------
+
+  def store(self,url,resp,digest,result):
+    """ save result together with the validators of the response """
+
+    entry = {
+      "url":      url,
+      "time":     time.time(),
+      "etag":     get_header(resp,"etag"),
+      "modified": get_header(resp,"last-modified"),
+      "digest":   digest,
+      "format":   FORMAT,
+      "result":   result
+      }
+    self._entries[url] = entry
+    self._save(url,entry)
+
+  # --- save entry to flash/disk   -------------------------------------------
+
+  def _save(self,url,entry):
+    """ write entry to file (if possible) """
+
+    if not self._path:
+      return
+    try:
+      with open(self._filename(url),"w") as f:
+        json.dump(entry,f)
+    except OSError as ex:
+      # filesystem is usually read-only on MCUs: keep entries in memory
+      self.msg(f"cache: cannot write to {self._path}: {ex}")
+      self._path = None
@@ -0,0 +1,71 @@
+# -------------------------------------------------------------------------
+# Query-url and time-stamps of https://v6.db.transport.rest/
+#
+# Shared by DepmonDataProvider and the edge-proxy tools/depproxy.py.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+from depmon_model import day_number
+
+URL_PREFIX='https://v6.db.transport.rest/stops'
+URL_SUFFIX='departures?linesOfStops=false&remarks=false&pretty=false'
+
+PRODUCTS = ["nationalExpress","national","regionalExpress","regional",
+            "suburban","bus","ferry","subway","tram","taxi"]
+
+MONTHS = ["Jan","Feb","Mar","Apr","May","Jun",
+          "Jul","Aug","Sep","Oct","Nov","Dec"]
+
+# --- create query-url   -----------------------------------------------------
+
+def create_url(prefix,station,via,products,duration):
+  """ create query url for hafas """
+
+  url = f"{prefix}/{station}/{URL_SUFFIX}&duration={duration}"
+  if via:
+    url = f"{url}&direction={via}"
+  if not products:
+    return url
+
+  # if we need to filter by product, set all products to false except those
+  # that are provided
+  all_products = {p: "false" for p in PRODUCTS}
+  for p in products.split(","):
+    all_products[p] = "true"
+
+  # add to url
+  for key,value in all_products.items():
+    url += f"&{key}={value}"
+  return url
+
+# --- parse iso-time   -------------------------------------------------------
+
+def parse_time(tm):
+  """ parse iso-timestamp, return local time in minutes since 1970 and
+  the utc-offset in seconds """
+
+  the_date, the_time = tm.split('T')
+  year,month,mday    = the_date.split('-')
+  hour,minute        = the_time.split(':')[0:2]
+
+  offset = the_time[-6:]
+  sign = 1 if offset[0] == '+' else -1
+  offset = sign*3600*int(offset[1:3])+sign*60*int(offset[4:])
+  day = day_number(int(year),int(month),int(mday))
+  return [1440*day+60*int(hour)+int(minute),offset]
+
+# --- parse date-header   ----------------------------------------------------
+
+def parse_date(value):
+  """ parse http-date (e.g. "Sun, 18 Oct 2026 16:28:29 GMT"), return
+  utc in seconds since 1970 """
+
+  _,mday,month,year,the_time = value.split()[0:5]
+  hour,minute,second = the_time.split(':')
+  day = day_number(int(year),MONTHS.index(month)+1,int(mday))
+  return 86400*day+3600*int(hour)+60*int(minute)+int(second)
@@ -20,6 +20,15 @@ secrets.password  = 'my_secret_password'
 secrets.retry     = 2                      # connect attempts
 secrets.debugflag = False
 secrets.channel   = 6                      # optional: use fixed channel
+secrets.compress  = True                   # optional: request gzip-responses
+secrets.keepalive = 30                     # optional: max. idle connection (s)
+secrets.radio_off = False                  # optional: radio off between updates
+# optional: static address (no DHCP, faster reconnects with radio_off)
+#secrets.hostname  = 'depmon'
+#secrets.address   = '192.168.1.42'
+#secrets.netmask   = '255.255.255.0'
+#secrets.gateway   = '192.168.1.1'
+#secrets.dns       = '192.168.1.1'
 
 # hardware configuration (optional)  -----------------------------------------
 
@@ -61,21 +70,80 @@ app_config.error_reset = True        # reset or stop
 #  station-ID of departure
 #  station-ID of direction
 #  filter for product (use None for no filter)
-#  filter for line name (use None for no filter)
+#  filter for line name (use None for no filter) or a filter-dict
+#  (see departure_filter.py), e.g. {"prefix": "S", "cancelled": "hide"}
 app_config.stations = [
   (8005676,8004158,None,None),   # Starnberg in direction to Pasing
   (8004158,8005676,None,None)    # Pasing in direction to Starnberg
   ]
 
+#app_config.url_prefix = "http://localhost:8080/stops" # e.g. tools/depserver.py
+#app_config.proxy_url = "http://proxy-host:8081/departures" # tools/depproxy.py
+#app_config.proxy_buffer = 256   # read-buffer for the proxy (max. line length)
+#app_config.provider = "gtfs"     # offline timetable (default: "rest"), the
+#app_config.gtfs_file = "gtfs.bin" # station-IDs are GTFS stop-ids
+#app_config.gtfs_cache = 64       # strings cached by the gtfs-provider
+#app_config.render_url = "http://render-host:8082/frame" # thin client,
+#app_config.render_depth = 1      # tools/render_service.py, bits per pixel
 app_config.duration = 120        # time-horizon in minutes
 app_config.upd_time = 60         # update interval in seconds
+#app_config.upd_min = 30          # adaptive update interval: lower and
+#app_config.upd_max = 600         # upper bound (default: upd_time)
+#app_config.upd_lead = 1          # update n minutes before next departure
+#app_config.upd_profiles = [      # bounds per time of day:
+#  (6,9,30,120),                  # (from hour,to hour,upd_min,upd_max)
+#  (23,5,600,3600)
+#  ]
 app_config.off_time = 120        # stop after given time of inactivity
+app_config.display_mode = "time" # "countdown": minutes until departure,
+                                 # updated every minute without network
+app_config.runtime = "loop"      # "async": fetch, keys and display as
+                                 # asyncio-tasks (needs asyncio on the MCU)
+app_config.refresh_force = 0     # force refresh of unchanged content after
+                                 # n skipped refreshes (0: never)
+app_config.refresh_full = 10     # full refresh after n partial refreshs
+                                 # (displays with partial updates only)
+app_config.max_departures = 0    # stop parsing after n departures (0: all)
+#app_config.parser = "json_stream" # default: built-in extractor
+#app_config.string_table = 256   # max. interned line-names/directions
+app_config.fetch_concurrency = 1 # parallel requests (CPython only)
+app_config.fetch_mode = "all"    # "lazy": only fetch visible station and
+                                 # prefetch neighbours
+#app_config.max_age = 60         # lazy mode: refetch if older (seconds)
+app_config.fetch_retries = 1     # retries of a failed station per update
+app_config.fetch_retry_delay = 1 # delay before first retry (doubled)
+app_config.fetch_backoff = 60    # failed station: skip for n seconds,
+app_config.fetch_backoff_max = 900 # doubled after every failure
+app_config.breaker_threshold = 3 # stop requests after n failures in a row
+app_config.breaker_timeout = 300 # for n seconds
+
+# response cache (optional)
+#app_config.cache = True
+#app_config.cache_dir = "cache"  # None: memory only (filesystem must be writable)
+#app_config.cache_ttl = 0        # seconds to reuse result without request
+#app_config.cache_max_body = 16384 # compare checksum of bodies up to this size
+
+# snapshot of the departures for fast restarts (sleep-memory, or file
+# if the snapshot does not fit into sleep-memory)
+app_config.snapshot = True
+#app_config.snapshot_file = "/snapshot.bin" # filesystem must be writable
+
+# metrics (optional): KEY_UP on the first page toggles a metrics footer
+# and prints the metrics to the console
+#app_config.metrics = True
+#app_config.metrics_file = "/tmp/depmon_metrics.json" # also write to file
 
 # replacements (list of tuples (from,to), supports regex-syntax)
+# applied to station names, line names and directions
 app_config.replace = [
   ("München","MUC")
   ]
 
+#app_config.glyph_cache = 128     # glyphs cached by compiled fonts
+app_config.page_cache = 16       # prepared pages (0: disable)
+app_config.page_labels = False   # prepare labels of pages (needs memory)
+#app_config.page_labels_min_free = 32768 # only if more memory is free
+
 # changes to UI-defaults (see ui_settings.py for a list)   -------------------
 
 ui_config = Settings()
@@ -0,0 +1,227 @@
+# -------------------------------------------------------------------------
+# Snapshot of the departure data for fast restarts.
+#
+# The snapshot is a compact, versioned binary image of the model
+# (departures of all stations, station index, row) and the schedule. It
+# is kept in alarm.sleep_memory (after the station index in byte 0) if it
+# fits and in app_config.snapshot_file otherwise. Both survive
+# supervisor.reload() and deep sleep.
+#
+# Format (little endian):
+#   header:   magic "DM", version, station index, row, number of stations,
+#             crc of app_config.stations, time of save (monotonic, s),
+#             interval (s), fingerprint of the display, number of strings,
+#             length of the payload, crc of the payload
+#   payload:  strings (length, utf-8)
+#             per station: flag (0: no data) or flag, name (string index),
+#             update, number n of departures, n*plan (minutes since
+#             1970), n*delay, n*line, n*dir (string indices), cancelled
+#             bitset
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import struct
+from array import array
+try:
+  from binascii import crc32
+except ImportError:
+  from zlib import crc32
+try:
+  import alarm
+except ImportError:
+  alarm = None
+
+from settings import app_config
+from depmon_model import StatInfo, DepList, STRINGS
+
+MAGIC   = b"DM"
+VERSION = 2
+HEADER  = "<2sBBHBIIHIHHI"
+HEADER_SIZE = struct.calcsize(HEADER)
+OFFSET  = 1                    # byte 0 of sleep_memory: station index
+
+# --- encode model   ---------------------------------------------------------
+
+def _config_crc():
+  """ crc of the station configuration (snapshots of other configs are
+  invalid) """
+  return crc32(repr(app_config.stations).encode())
+
+def encode(data,saved=0,interval=0,fingerprint=0):
+  """ encode model as bytes """
+
+  strings = []
+  index   = {}
+  def add(text):
+    i = index.get(text,None)
+    if i is None:
+      i = len(strings)
+      strings.append(text)
+      index[text] = i
+    return i
+
+  stations = []
+  for stat_info in data.get("departures",[]):
+    if stat_info is None:
+      stations.append(b"\x00")
+      continue
+    info = stat_info.info
+    n = len(info)
+    line = array('H',[add(STRINGS.get(i)) for i in info.line])
+    dir  = array('H',[add(STRINGS.get(i)) for i in info.dir])
+    stations.append(
+      struct.pack("<BHIH",1,add(stat_info.name),stat_info.update or 0,n) +
+      struct.pack(f"<{n}I",*info.plan) + struct.pack(f"<{n}h",*info.delay) +
+      struct.pack(f"<{n}H",*line) + struct.pack(f"<{n}H",*dir) +
+      bytes(info.cancelled))
+
+  parts = []
+  for text in strings:
+    b = text.encode()
+    if len(b) > 255:
+      # cut at the start of a utf-8 sequence (not within a character)
+      n = 255
+      while n and b[n] & 0xC0 == 0x80:
+        n -= 1
+      b = b[:n]
+    parts.append(bytes([len(b)]))
+    parts.append(b)
+  payload = b"".join(parts+stations)
+  header  = struct.pack(HEADER,MAGIC,VERSION,data.get("station_index",0),
+                        data.get("row",0),len(stations),_config_crc(),
+                        int(saved),int(interval),fingerprint & 0xFFFFFFFF,
+                        len(strings),len(payload),crc32(payload))
+  return header + payload
+
+# --- decode model   ---------------------------------------------------------
+
+def decode(blob):
+  """ decode bytes, return (data,saved,interval,fingerprint) or None """
+
+  if len(blob) < HEADER_SIZE:
+    return None
+  (magic,version,station_index,row,n_stations,config,saved,interval,
+   fingerprint,n_strings,length,crc) = struct.unpack_from(HEADER,blob)
+  if (magic != MAGIC or version != VERSION or
+      n_stations != len(app_config.stations) or config != _config_crc() or
+      len(blob) < HEADER_SIZE+length):
+    return None
+  payload = memoryview(blob)[HEADER_SIZE:HEADER_SIZE+length]
+  if crc32(payload) != crc:
+    return None
+
+  pos = 0
+  strings = []
+  for _ in range(n_strings):
+    size = payload[pos]
+    strings.append(str(bytes(payload[pos+1:pos+1+size]),"utf-8"))
+    pos += 1+size
+
+  departures = []
+  for _ in range(n_stations):
+    if not payload[pos]:
+      departures.append(None)
+      pos += 1
+      continue
+    _,name,update,n = struct.unpack_from("<BHIH",payload,pos)
+    pos += 9
+    columns = []
+    for fmt in "IhHH":
+      columns.append(struct.unpack_from(f"<{n}{fmt}",payload,pos))
+      pos += struct.calcsize(fmt)*n
+    cancelled = payload[pos:pos+(n+7)//8]
+    pos += (n+7)//8
+    info = DepList()
+    for i in range(n):
+      info.append(columns[0][i],columns[1][i],strings[columns[2][i]],
+                  strings[columns[3][i]],cancelled[i >> 3] & (1 << (i & 7)))
+    departures.append(StatInfo(strings[name],info,update or None))
+
+  data = {"station_index": station_index, "row": row,
+          "departures": departures}
+  return (data,saved,interval,fingerprint)
+
+# --- save and restore   -----------------------------------------------------
+
+class Snapshot:
+  """ save and restore snapshots """
+
+  def __init__(self,debug=False):
+    """ constructor """
+
+    self._debug   = debug
+    self._enabled = getattr(app_config,'snapshot',True)
+    self._file    = getattr(app_config,'snapshot_file',None)
+    self._memory  = getattr(alarm,'sleep_memory',None) if alarm else None
+    self._crc     = None                # crc of the last snapshot
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- save snapshot   ------------------------------------------------------
+
+  def save(self,data,saved,interval,fingerprint=0):
+    """ save snapshot to sleep-memory or file """
+
+    if not self._enabled:
+      return
+    try:
+      blob = encode(data,saved,interval,fingerprint)
+    except Exception as ex:
+      self.msg(f"snapshot: encoding failed: {ex}")
+      return
+    crc = crc32(blob)
+    if crc == self._crc:
+      return                          # unchanged
+    self._crc = crc
+
+    if self._memory is not None and OFFSET+len(blob) <= len(self._memory):
+      self._memory[OFFSET:OFFSET+len(blob)] = blob
+      self.msg(f"snapshot: {len(blob)} bytes saved to sleep-memory")
+      return
+    if self._memory is not None and len(self._memory) > OFFSET:
+      self._memory[OFFSET] = 0          # invalidate old snapshot
+    if self._file:
+      try:
+        with open(self._file,"wb") as f:
+          f.write(blob)
+        self.msg(f"snapshot: {len(blob)} bytes saved to {self._file}")
+      except OSError as ex:
+        self.msg(f"snapshot: cannot write {self._file}: {ex}")
+
+  # --- restore snapshot   ---------------------------------------------------
+
+  def restore(self):
+    """ restore snapshot, return (data,saved,interval,fingerprint) or None """
+
+    if not self._enabled:
+      return None
+    # invalid snapshots (e.g. from other versions) are ignored
+    result = None
+    if self._memory is not None:
+      try:
+        result = decode(self._memory[OFFSET:])
+      except Exception as ex:
+        self.msg(f"snapshot: invalid data in sleep-memory: {ex}")
+      if result:
+        self.msg("snapshot: restored from sleep-memory")
+    if not result and self._file:
+      try:
+        with open(self._file,"rb") as f:
+          result = decode(f.read())
+        if result:
+          self.msg(f"snapshot: restored from {self._file}")
+      except OSError:
+        pass
+      except Exception as ex:
+        self.msg(f"snapshot: invalid data in {self._file}: {ex}")
+    return result
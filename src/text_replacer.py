@@ -0,0 +1,105 @@
+# -------------------------------------------------------------------------
+# Compiled text replacements (app_config.replace).
+#
+# The list of (pattern,replacement) tuples is compiled once. Literal
+# patterns (without regex meta-characters) use str.replace(). Runs of
+# literal patterns that cannot influence each other are combined into a
+# single alternation, so the text is scanned once for all of them. A
+# bounded cache keeps already rewritten texts (station names, lines,
+# directions repeat every cycle).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+import re
+
+_META = ".^$*+?{}[]\\|()"
+
+# --- helper functions   -----------------------------------------------------
+
+def _is_literal(pattern):
+  """ check if pattern has no regex meta-characters """
+  for c in pattern:
+    if c in _META:
+      return False
+  return True
+
+def _overlaps(a,b):
+  """ check if a and b can overlap within a text """
+  if a in b or b in a:
+    return True
+  for k in range(1,min(len(a),len(b))):
+    if a[-k:] == b[:k] or b[-k:] == a[:k]:
+      return True
+  return False
+
+def _independent(group,src,dest):
+  """ check if a literal replacement is independent of a group """
+  for g_src,g_dest in group:
+    if _overlaps(g_src,src) or _overlaps(g_dest,src) or _overlaps(g_src,dest):
+      return False
+  return True
+
+# --- replacement steps   ----------------------------------------------------
+
+def _regex_step(src,dest):
+  regex = re.compile(src)
+  return lambda text: regex.sub(dest,text)
+
+def _literal_step(src,dest):
+  return lambda text: text.replace(src,dest)
+
+def _group_step(group):
+  if len(group) == 1:
+    return _literal_step(*group[0])
+  table = {}
+  for src,dest in group:
+    table[src] = dest
+  regex = re.compile("|".join([src for src,_ in group]))
+  return lambda text: regex.sub(lambda m: table[m.group(0)],text)
+
+# --- replacer class   -------------------------------------------------------
+
+class TextReplacer:
+  """ apply a list of replacements to texts """
+
+  def __init__(self,patterns,cache_size=64):
+    """ constructor: compile patterns """
+
+    self._cache_size = cache_size
+    self._cache      = {}
+    self._steps      = []
+
+    group = []
+    for src,dest in patterns:
+      if _is_literal(src) and _independent(group,src,dest):
+        group.append((src,dest))
+        continue
+      if group:
+        self._steps.append(_group_step(group))
+        group = []
+      if _is_literal(src):
+        group.append((src,dest))
+      else:
+        self._steps.append(_regex_step(src,dest))
+    if group:
+      self._steps.append(_group_step(group))
+
+  def __call__(self,text):
+    """ return text with all replacements applied """
+
+    if not text or not self._steps:
+      return text
+    result = self._cache.get(text,None)
+    if result is None:
+      result = text
+      for step in self._steps:
+        result = step(result)
+      if len(self._cache) >= self._cache_size:
+        self._cache.clear()
+      self._cache[text] = result
+    return result
@@ -0,0 +1,57 @@
+# -------------------------------------------------------------------------
+# Dataprovider of the thin client (app_config.render_url).
+#
+# The render service (tools/render_service.py) fetches the departures and
+# delivers complete frames, so the device fetches no departures at all.
+# The number of departures of the visible station (paging) and the clock
+# are sent along with the frame (see DepmonUIProvider).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+from settings import app_config
+
+# --- main data-provider class   ---------------------------------------------
+
+class ThinDataProvider:
+
+  def __init__(self,debug=False):
+    self._debug = debug
+    self._wifi  = None
+
+  # --- set wifi-object   ----------------------------------------------------
+
+  def set_wifi(self,wifi):
+    """ set wifi-object (the ui-provider fetches the frames) """
+    self._wifi = wifi
+
+  # --- query departures   ---------------------------------------------------
+
+  def update_data(self,data):
+    """ callback for App: no departures on the device """
+
+    data["departures"] = [None]*len(app_config.stations)
+    data["stale"]      = {}
+    data["update"]     = None
+
+  # --- interface of DepmonDataProvider (fetch on demand)   ------------------
+
+  def is_stale(self,data,index):
+    """ the render service has all stations """
+    return False
+
+  def update_station(self,data,index):
+    """ nothing to fetch """
+    pass
+
+  def retry_stale(self,data):
+    """ failed requests are retried by the render service """
+    return False
+
+  def prefetch(self,data):
+    """ nothing to fetch """
+    return False
@@ -41,6 +41,8 @@ UI_SETTINGS.FG_INDEX   = COLORS.BLACK
 UI_SETTINGS.BG_INDEX   = COLORS.WHITE
 UI_SETTINGS.ROWS       = 4
 UI_SETTINGS.FOOTER     = "Aktualisiert"
+UI_SETTINGS.STALE      = "Veraltet seit"
+UI_SETTINGS.MINUTES    = " min"             # countdown
 
 # don't change
 UI_SETTINGS.FG_COLOR = PALETTE[UI_SETTINGS.FG_INDEX]
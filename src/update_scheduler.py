@@ -0,0 +1,130 @@
+# -------------------------------------------------------------------------
+# Adaptive update scheduler for the Departure Monitor.
+#
+# Computes the interval until the next update from the departures on
+# the display: the display is valid until the first departure leaves
+# (unless the countdown is updated locally, app_config.display_mode),
+# unchanged realtime data and stable delays allow longer intervals.
+# The interval is limited by app_config.upd_min and app_config.upd_max
+# (both default to app_config.upd_time, i.e. a fixed interval) or by the
+# bounds of the time-of-day profile in app_config.upd_profiles.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# -------------------------------------------------------------------------
+
+from settings import app_config
+from depmon_model import STRINGS, CLOCK
+from metrics import METRICS
+
+MAX_BACKOFF = 4.0          # max. factor for unchanged realtime data
+
+class UpdateScheduler:
+  """ compute interval until the next update """
+
+  def __init__(self,debug=False):
+    """ constructor """
+
+    self._debug    = debug
+    self._min      = getattr(app_config,'upd_min',app_config.upd_time)
+    self._max      = getattr(app_config,'upd_max',app_config.upd_time)
+    self._lead     = getattr(app_config,'upd_lead',1)  # minutes
+    self._profiles = getattr(app_config,'upd_profiles',[])
+    self._countdown = getattr(app_config,'display_mode','time') == 'countdown'
+    self._delays   = {}        # (plan,line) -> delay of the last update
+    self._updated  = None      # realtimeDataUpdatedAt of the last update
+    self._backoff  = 1.0
+
+    # polling interval for event-loops (seconds)
+    self.tick = min([10,self._min] + [p[2] for p in self._profiles])
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- bounds for the given hour   ------------------------------------------
+
+  def _bounds(self,hour):
+    """ return (min,max) of the matching profile or the default bounds """
+
+    for start,end,upd_min,upd_max in self._profiles:
+      if start <= end:
+        match = start <= hour < end
+      else:
+        match = hour >= start or hour < end      # e.g. (22,5,...)
+      if match:
+        return (upd_min,upd_max)
+    return (self._min,self._max)
+
+  # --- change of delays since the last update   -----------------------------
+
+  def _volatility(self,info):
+    """ return mean change of delays (minutes) since the last update """
+
+    delays  = {}
+    changes = 0
+    count   = 0
+    for i in range(len(info)):
+      key = (info.plan[i],STRINGS.get(info.line[i]))
+      delay = info.delay[i]
+      delays[key] = delay
+      last = self._delays.get(key,None)
+      if last is not None:
+        changes += abs(delay-last)
+        count   += 1
+    self._delays = delays
+    return changes/count if count else 0.0
+
+  # --- compute interval   ---------------------------------------------------
+
+  def next_interval(self,data):
+    """ return seconds until the next update """
+
+    try:
+      stat_info = data["departures"][data["station_index"]]
+    except (KeyError,IndexError,TypeError):
+      stat_info = None
+    if stat_info is None or not stat_info.update:
+      return app_config.upd_time
+
+    # local time (minutes since 1970)
+    now = CLOCK.minutes(stat_info.update)
+    upd_min,upd_max = self._bounds((now//60) % 24)
+
+    # unchanged realtime data: the backend is idle, back off
+    if stat_info.update == self._updated:
+      self._backoff = min(MAX_BACKOFF,1.5*self._backoff)
+    else:
+      self._backoff = 1.0
+    self._updated = stat_info.update
+
+    # time until the first displayed departure leaves (the countdown
+    # drops departed trains without an update)
+    info  = stat_info.info
+    lead  = None
+    first = len(info) if self._countdown else data.get("row",0)
+    for i in range(first,len(info)):
+      if info.is_cancelled(i):
+        continue
+      lead = max(0,info.plan[i] + info.delay[i] - now)
+      break
+    if lead is None:
+      interval = upd_max
+    else:
+      interval = 60*(lead - self._lead)
+
+    # volatile delays: update more often
+    volatility = self._volatility(info)
+    interval = self._backoff*interval/(1+volatility)
+
+    interval = int(max(upd_min,min(upd_max,interval)))
+    self.msg(f"next update in {interval}s (lead: {lead}min, " +
+             f"volatility: {volatility:.1f}, backoff: {self._backoff})")
+    METRICS.set("interval",interval)
+    return interval
@@ -0,0 +1,219 @@
+# ----------------------------------------------------------------------------
+# wifi_helper_base.py: base-class of the Wifi-helpers
+#
+# Implements the request-logic common to all Wifi-helpers: compressed
+# transfer, closing of responses and persistent (keep-alive) connections.
+# Sub-classes implement connect() and _session().
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import time
+import json
+
+import content_decoder
+try:
+  from settings import secrets
+except ImportError:
+  secrets = None
+
+class WifiHelperBase:
+  """ base-class of Wifi-helpers """
+
+  # --- constructor   --------------------------------------------------------
+
+  def __init__(self,debug=False):
+    """ constructor """
+
+    self._debug = debug
+    self.compress = (getattr(secrets,'compress',True) and
+                     content_decoder.available())
+
+    # persistent connections: sockets idle for more than keepalive
+    # seconds are closed before the next request
+    self._keepalive   = getattr(secrets,'keepalive',30)
+    self._connections = {}     # (session,host) -> [socket,time of last use]
+    self.handshakes   = 0      # new connections
+    self.reused       = 0      # requests on an existing connection
+
+    # power down radio after every update (secrets.radio_off)
+    self._radio_off   = getattr(secrets,'radio_off',False)
+
+  # --- print debug-message   ------------------------------------------------
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._debug:
+      print(text)
+
+  # --- return session (implemented by sub-classes)   ------------------------
+
+  def _session(self):
+    """ return adafruit_requests.Session (connect if necessary) """
+    raise NotImplementedError
+
+  def _open_sessions(self):
+    """ return existing sessions (never connects) """
+    return []
+
+  # --- radio power-management (implemented by sub-classes)   ---------------
+
+  def radio_up(self):
+    """ power up radio and connect (noop if not supported) """
+    pass
+
+  def radio_down(self):
+    """ power down radio if secrets.radio_off is set (noop if not
+    supported) """
+    pass
+
+  # --- connection-handling   ------------------------------------------------
+
+  def _key(self,session,url):
+    """ return key of connection """
+    return (id(session),url.split('/')[2])
+
+  def _close_socket(self,session,sock):
+    """ close socket and remove it from the connection-manager """
+    try:
+      session._connection_manager.close_socket(sock)
+    except Exception:
+      pass                     # already closed or unknown
+
+  def _drop_stale(self,session,key):
+    """ close connection if idle for too long """
+
+    conn = self._connections.get(key,None)
+    if conn and time.monotonic() - conn[1] > self._keepalive:
+      self.msg(f"closing idle connection to {key[1]}")
+      self._close_socket(session,conn[0])
+      del self._connections[key]
+
+  def _track(self,key,resp):
+    """ count new and reused connections """
+
+    conn = self._connections.get(key,None)
+    if conn and conn[0] is resp.socket:
+      self.reused += 1
+    else:
+      self.handshakes += 1
+    self._connections[key] = [resp.socket,time.monotonic()]
+    self.msg(f"connections: {self.handshakes} new, " +
+             f"{self.reused} reused (handshakes avoided)")
+
+  def close_all(self):
+    """ close all connections """
+
+    self._connections = {}
+    for session in self._open_sessions():
+      try:
+        # the connection-manager has no public close_all()
+        session._connection_manager._free_sockets(force=True)
+      except Exception:
+        pass
+
+  # --- execute get-request and return json   ------------------------------
+
+  def get_json(self,url):
+    """ process get-request """
+
+    # response.json() does not decompress the body
+    response = self.get(url)
+    body = b"".join(self.iter_content(response,256))
+    self.close(response)
+    return json.loads(body.decode("utf-8"))
+
+  # --- execute get-request and return response   ---------------------------
+
+  def get(self,url,**kw):
+    """ process get-request """
+
+    session = self._session()
+    key = self._key(session,url)
+    self._drop_stale(session,key)
+    if self.compress:
+      kw["headers"] = dict(kw.get("headers",None) or {})
+      kw["headers"]["Accept-Encoding"] = content_decoder.ACCEPT_ENCODING
+    try:
+      resp = session.get(url,**kw)
+    except (OSError,RuntimeError) as ex:
+      # stale connection: reconnect and retry once
+      self.msg(f"request failed ({ex}), reconnecting")
+      conn = self._connections.pop(key,None)
+      if conn:
+        self._close_socket(session,conn[0])
+      resp = session.get(url,**kw)
+    self._track(key,resp)
+    return resp
+
+  # --- iterate over (decompressed) content of response   -------------------
+
+  def iter_content(self,resp,chunk_size,counter=None):
+    """ return iterator of decompressed chunks of the response """
+    return content_decoder.iter_content(resp,chunk_size,counter)
+
+  def stream(self,resp,chunk_size=256,counter=None):
+    """ return readable stream of the decompressed response """
+    return content_decoder.stream(resp,chunk_size,counter)
+
+  # --- read (uncompressed) content into buffer   ----------------------------
+
+  def readinto(self,resp,buf):
+    """ read next part of the body into buf, return number of bytes """
+    return resp._readinto(buf)
+
+  # --- close response   ----------------------------------------------------
+
+  def _drain(self,resp,limit=1024):
+    """ read the rest of the (raw) body, e.g. the end of the last chunk
+    or the gzip-trailer. Returns False if the body is not delimited or
+    more than limit bytes are left """
+
+    if resp._remaining is None and not resp._chunked:
+      return False             # body ends with the connection
+    buf = bytearray(64)
+    try:
+      while limit > 0:
+        n = resp._readinto(buf)
+        if not n:
+          return True
+        limit -= n
+    except Exception:
+      pass
+    return False
+
+  def close(self,resp,drain=True):
+    """ close response.
+
+    With drain, the rest of the response is read and the connection is
+    kept for the next request. Otherwise (or if draining fails) the
+    socket is closed.
+    """
+
+    sock = resp.socket
+    if not sock:
+      return
+    if content_decoder.get_header(resp,"connection") == "close":
+      drain = False
+    if drain:
+      drain = self._drain(resp)
+    session = getattr(resp,'_session',None) or self._session()
+    key = None
+    for k,conn in list(self._connections.items()):
+      if conn[0] is sock:
+        key = k
+        break
+
+    if drain:
+      resp.close()
+      if key:
+        self._connections[key][1] = time.monotonic()
+    else:
+      self._close_socket(session,sock)
+      resp.socket = None
+      if key:
+        del self._connections[key]
@@ -15,8 +15,10 @@ import ssl
 import adafruit_requests
 
 from settings import secrets
+from wifi_helper_base import WifiHelperBase
+from metrics import METRICS
 
-class WifiHelper:
+class WifiHelper(WifiHelperBase):
   """ Wifi-Helper for MCU with integrated wifi """
 
   # --- constructor   --------------------------------------------------------
@@ -24,20 +26,17 @@ class WifiHelper:
   def __init__(self,debug=False):
     """ constructor """
 
-    self._debug = debug
+    super().__init__(debug=debug)
     self._wifi = None
+    self._requests = None
+    self._bssid    = None      # cached access-point for fast reconnects
+    self._channel  = None
+    self._radio_on = None      # time of radio power-up
     if not hasattr(secrets,'channel'):
       secrets.channel = 0
     if not hasattr(secrets,'timeout'):
       secrets.timeout = None
 
-  # --- print debug-message   ------------------------------------------------
-
-  def msg(self,text):
-    """ print (debug) message """
-    if self._debug:
-      print(text)
-
   # --- initialze and connect to AP and to remote-port   ---------------------
 
   def connect(self):
@@ -47,6 +46,12 @@ class WifiHelper:
     self._wifi = wifi
     self.msg("connecting to %s" % secrets.ssid)
     retries = secrets.retry
+    start   = time.monotonic()
+    if not wifi.radio.enabled:
+      wifi.radio.enabled = True
+      self._radio_on = start
+    elif self._radio_on is None:
+      self._radio_on = start
 
     # check for static client hostname/address
     if hasattr(secrets,'hostname'):
@@ -62,22 +67,64 @@ class WifiHelper:
                                   ipv4_dns = dns)
     while True:
       try:
-        wifi.radio.connect(secrets.ssid,
-                          secrets.password,
-                           channel = secrets.channel,
-                           timeout = secrets.timeout
-                           )
+        if self._bssid:
+          # fast reconnect: no scan with channel and bssid of last AP
+          wifi.radio.connect(secrets.ssid,
+                             secrets.password,
+                             channel = self._channel,
+                             bssid = self._bssid,
+                             timeout = secrets.timeout
+                             )
+        else:
+          wifi.radio.connect(secrets.ssid,
+                            secrets.password,
+                             channel = secrets.channel,
+                             timeout = secrets.timeout
+                             )
         break
       except:
         self.msg("could not connect to %s" % secrets.ssid)
+        if self._bssid:
+          self._bssid = None          # AP changed? Retry with a scan
+          continue
         retries -= 1
         if retries == 0:
           raise
         time.sleep(1)
         continue
-    self.msg("connected to %s" % secrets.ssid)
-    pool = socketpool.SocketPool(wifi.radio)
-    self._requests = adafruit_requests.Session(pool,ssl.create_default_context())
+    try:
+      self._bssid   = wifi.radio.ap_info.bssid
+      self._channel = wifi.radio.ap_info.channel
+    except:
+      pass
+    duration = time.monotonic()-start
+    METRICS.observe("time.connect",duration)
+    self.msg("connected to %s (%fs)" % (secrets.ssid,duration))
+    if not self._requests:
+      pool = socketpool.SocketPool(wifi.radio)
+      self._requests = adafruit_requests.Session(pool,
+                                                 ssl.create_default_context())
+
+  # --- radio power-management   ---------------------------------------------
+
+  def radio_up(self):
+    """ power up radio and connect """
+    if not self._wifi or not self._wifi.radio.connected:
+      self.connect()
+
+  def radio_down(self):
+    """ power down radio if secrets.radio_off is set """
+
+    if not self._radio_off or not self._wifi or not self._wifi.radio.enabled:
+      return
+    self.close_all()                # sockets are invalid afterwards
+    self._wifi.radio.enabled = False
+    if self._radio_on is not None:
+      duration = time.monotonic()-self._radio_on
+      METRICS.observe("time.radio_on",duration)
+      METRICS.inc("radio_on_total",duration)
+      self.msg(f"radio down after {duration:f}s")
+    self._radio_on = None
 
   # --- return implementing wifi   -----------------------------------------
 
@@ -86,20 +133,14 @@ class WifiHelper:
     """ return wifi """
     return self._wifi
 
-  # --- execute get-request and return json   ------------------------------
+  # --- return session   ---------------------------------------------------
 
-  def get_json(self,url):
-    """ process get-request """
+  def _session(self):
+    """ return session (connect if necessary) """
 
-    if not self._wifi:
-      self.connect()
-    return self._requests.get(url).json()
-
-  # --- execute get-request and return response   ---------------------------
+    self.radio_up()
+    return self._requests
 
-  def get(self,url,**kw):
-    """ process get-request """
-
-    if not self._wifi:
-      self.connect()
-    return self._requests.get(url,**kw)
+  def _open_sessions(self):
+    """ return existing sessions (never connects) """
+    return [self._requests] if self._requests else []
@@ -10,31 +10,55 @@
 
 import socket
 import ssl
+import threading
 import adafruit_requests
 
-class WifiHelper:
+from wifi_helper_base import WifiHelperBase
+
+class _SocketPool:
+  """ socket-pool wrapping the socket-module.
+
+  adafruit_requests shares one connection-manager per socket-pool and the
+  connection-manager is not thread-safe. Every thread therefore uses
+  its own pool-instance (and session).
+  """
+
+  def __getattr__(self,name):
+    return getattr(socket,name)
+
+class WifiHelper(WifiHelperBase):
   """ request-implementation using sockets from CPython """
 
   def __init__(self,debug=False):
     """ constructor """
-    self._debug = debug
+    super().__init__(debug=debug)
     self._http = None
+    self._local = threading.local()
+    self._lock  = threading.Lock()
+    self._sessions = []        # sessions of all threads
 
   def connect(self):
-    self._http = adafruit_requests.Session(socket,ssl.create_default_context())
+    """ create session of the current thread """
+    http = adafruit_requests.Session(_SocketPool(),
+                                     ssl.create_default_context())
+    with self._lock:
+      self._sessions.append(http)
+      if not self._http:
+        self._http = http
+    self._local.http = http
 
-  def get_json(self,url):
-    if not self._http:
+  def _session(self):
+    """ return session of the current thread """
+    http = getattr(self._local,'http',None)
+    if http is None:
       self.connect()
-    response = self._http.get(url)
-    result = response.json()
-    response.close()
-    return result
+      http = self._local.http
+    return http
 
-  def get(self,url):
-    if not self._http:
-      self.connect()
-    return self._http.get(url)
+  def _open_sessions(self):
+    """ return sessions of all threads """
+    with self._lock:
+      return list(self._sessions)
 
   @property
   def wifi(self):
@@ -45,4 +69,3 @@ class WifiHelper:
   def connected(self):
     """ emulate radio.connected """
     return self._http is not None
-
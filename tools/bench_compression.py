@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: compare transferred bytes and wall time of departure queries
+# with and without compressed transfer (Accept-Encoding: gzip).
+#
+# Uses the CPython wifi-helper from src/, so it needs the same packages
+# as the PC version of the departure monitor (adafruit_requests,
+# json-stream).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),"..","src"))
+
+import json_stream
+import content_decoder
+from wifi_helper_generic import WifiHelper
+
+# --- count bytes of an iterator of chunks   ---------------------------------
+
+class Counter:
+  """ pass-through iterator counting bytes """
+
+  def __init__(self,chunks):
+    self._chunks = chunks
+    self.count   = 0
+
+  def __iter__(self):
+    for chunk in self._chunks:
+      self.count += len(chunk)
+      yield chunk
+
+# --- run a single query   ---------------------------------------------------
+
+def query(wifi,url):
+  """ query url, parse body and return (transferred bytes, duration) """
+
+  start = time.monotonic()
+  resp  = wifi.get(url)
+  raw   = Counter(resp.iter_content(256))
+  body  = content_decoder.decode(iter(raw),
+                                 content_decoder.get_header(
+                                   resp,"content-encoding"))
+  jdata = json_stream.load(body)
+  for dep in jdata["departures"]:
+    dep["line"]["name"]                 # access like the dataprovider
+  resp.close()
+  return raw.count, time.monotonic()-start
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == "__main__":
+  if len(sys.argv) == 1:
+    print(f"usage: {sys.argv[0]} url [repetitions]")
+    sys.exit(0)
+
+  url = sys.argv[1]
+  n   = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  wifi = WifiHelper()
+  print(f"{'mode':<8} {'bytes':>10} {'min [s]':>9} {'avg [s]':>9}")
+  for compress in [False,True]:
+    wifi.compress = compress
+    sizes = []
+    times = []
+    for _ in range(n):
+      size,duration = query(wifi,url)
+      sizes.append(size)
+      times.append(duration)
+    mode = "gzip" if compress else "plain"
+    print(f"{mode:<8} {max(sizes):>10} {min(times):>9.3f} "
+          f"{sum(times)/n:>9.3f}")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: headless end-to-end update cycles of the departure monitor.
+#
+# Runs DepMon (src/main.py) on the GENERIC_LINUX_PC HAL with a headless
+# display (no pygame window) against the local departures server
+# (depserver.py). Per-phase timings (min/median/p95) and the peak memory
+# are written as json and compared with a stored baseline.
+#
+# Needs the packages of the PC version (see README.md).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import threading
+import tracemalloc
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR   = os.path.join(TOOLS_DIR,"..","src")
+sys.path.insert(0,TOOLS_DIR)
+sys.path.insert(0,SRC_DIR)
+
+import depserver
+
+PHASES = ["update_data","create_ui","update_ui","show","cycle","key"]
+
+# --- headless display   -----------------------------------------------------
+
+class HeadlessDisplay:
+  """ stand-in for a displayio-display without any output """
+
+  def __init__(self,width,height):
+    self.width      = width
+    self.height     = height
+    self.root_group = None
+    self.refreshs   = 0
+
+  def show(self,group):
+    self.root_group = group
+
+  def refresh(self):
+    self.refreshs += 1
+
+# --- settings for the benchmark   -------------------------------------------
+
+def create_settings(options,url_prefix):
+  """ create settings-module (replaces src/settings.py) """
+
+  class Settings:
+    pass
+
+  secrets = Settings()
+  secrets.ssid     = None
+  secrets.password = None
+  secrets.compress = options.gzip
+
+  hw_config = Settings()
+  hw_config.DISPLAY  = lambda hal: HeadlessDisplay(options.width,
+                                                   options.height)
+  hw_config.get_keys = lambda hal: None
+
+  app_config = Settings()
+  app_config.debug      = False
+  app_config.url_prefix = url_prefix
+  app_config.stations   = [(s,None,None,None) for s in options.stations]
+  app_config.duration   = 120
+  app_config.upd_time   = 60
+  app_config.off_time   = 0
+  app_config.replace    = [("München","MUC")]
+  if options.config:
+    for item in options.config:
+      key,value = item.split("=",1)
+      setattr(app_config,key,json.loads(value))
+
+  settings = types.ModuleType("settings")
+  settings.Settings   = Settings
+  settings.secrets    = secrets
+  settings.hw_config  = hw_config
+  settings.app_config = app_config
+  settings.ui_config  = Settings()
+  return settings
+
+# --- timing of phases   -----------------------------------------------------
+
+class Timings:
+  """ collect durations per phase """
+
+  def __init__(self):
+    self.samples = {phase: [] for phase in PHASES}
+
+  def wrap(self,phase,func):
+    """ return wrapper of func recording the duration """
+    def wrapper(*args,**kw):
+      start = time.perf_counter()
+      try:
+        return func(*args,**kw)
+      finally:
+        self.samples[phase].append(time.perf_counter()-start)
+    return wrapper
+
+  def summary(self):
+    """ return min/median/p95 per phase """
+    result = {}
+    for phase,values in self.samples.items():
+      if not values:
+        continue
+      values = sorted(values)
+      n = len(values)
+      result[phase] = {
+        "n":      n,
+        "min":    values[0],
+        "median": values[n//2],
+        "p95":    values[min(n-1,int(0.95*n))]
+        }
+    return result
+
+# --- check page cache   -----------------------------------------------------
+
+def check_paging(app):
+  """ page down to the last page and back up, return the rows that were
+  not prepared (cache misses) """
+
+  from main import DepMon
+  ui = app._uiprovider
+  misses = []
+  get_text = ui._get_departure_text
+  def wrapper(info,row,now):
+    misses.append(row)
+    return get_text(info,row,now)
+
+  ui._get_departure_text = wrapper
+  try:
+    row = None
+    while row != app.data["row"]:
+      row = app.data["row"]
+      app.process_keys(DepMon.KEY_DOWN)
+    while app.data["row"] > 0:
+      app.process_keys(DepMon.KEY_UP)
+  finally:
+    del ui._get_departure_text
+  return misses
+
+# --- compare with baseline   ------------------------------------------------
+
+def compare(result,baseline,tolerance):
+  """ print comparison, return list of regressions """
+
+  regressions = []
+  print(f"{'phase':<12} {'stat':<7} {'baseline':>10} {'current':>10} "
+        f"{'change':>8}")
+  for phase,stats in result["phases"].items():
+    base = baseline["phases"].get(phase,None)
+    if not base:
+      continue
+    for stat in ["median","p95"]:
+      change = (stats[stat]-base[stat])/base[stat] if base[stat] else 0.0
+      flag = ""
+      if change > tolerance:
+        flag = " !"
+        regressions.append(f"{phase}.{stat}")
+      print(f"{phase:<12} {stat:<7} {1000*base[stat]:>8.1f}ms "
+            f"{1000*stats[stat]:>8.1f}ms {100*change:>+7.1f}%{flag}")
+
+  base = baseline.get("peak_memory",0)
+  change = (result["peak_memory"]-base)/base if base else 0.0
+  if change > tolerance:
+    regressions.append("peak_memory")
+  print(f"{'memory':<12} {'peak':<7} {base/1024:>8.1f}kB "
+        f"{result['peak_memory']/1024:>8.1f}kB {100*change:>+7.1f}%")
+  return regressions
+
+# --- run benchmark   --------------------------------------------------------
+
+def run(options):
+  """ run benchmark and return result """
+
+  # start local departures server
+  srv_options = depserver.get_parser().parse_args(
+    ["-p","0","-s",options.size] +
+    (["-f",options.fixtures] if options.fixtures else []))
+  server = depserver.create_server(srv_options)
+  threading.Thread(target=server.serve_forever,daemon=True).start()
+  url_prefix = f"http://localhost:{server.server_address[1]}/stops"
+
+  # create application
+  sys.modules["settings"] = create_settings(options,url_prefix)
+  os.chdir(SRC_DIR)                          # fonts are relative to src
+  from main import DepMon
+  app = DepMon()
+  app.blink = lambda duration,color=None: None    # no artificial sleeps
+
+  timings = Timings()
+  app._dataprovider.update_data = timings.wrap(
+    "update_data",app._dataprovider.update_data)
+  app._uiprovider.create_ui = timings.wrap(
+    "create_ui",app._uiprovider.create_ui)
+  app._uiprovider.update_ui = timings.wrap(
+    "update_ui",app._uiprovider.update_ui)
+  app._show = timings.wrap("show",app._show)
+  run_cycle   = timings.wrap("cycle",app.run)
+  process_key = timings.wrap("key",app.process_keys)
+
+  tracemalloc.start()
+  for _ in range(options.cycles):
+    run_cycle()
+    if options.keys:
+      process_key(DepMon.KEY_DOWN)
+      process_key(DepMon.KEY_RIGHT)
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  misses = check_paging(app) if options.paging else []
+  server.shutdown()
+
+  return {
+    "cycles":      options.cycles,
+    "stations":    options.stations,
+    "size":        options.size,
+    "refreshs":    app.display.refreshs,
+    "phases":      timings.summary(),
+    "peak_memory": peak,
+    "page_misses": misses
+    }
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="headless end-to-end benchmark of the departure monitor")
+  parser.add_argument("-n","--cycles",type=int,default=20,
+                      help="number of update cycles (default: 20)")
+  parser.add_argument("-s","--stations",nargs="+",
+                      default=["8005676","8004158"],help="station ids")
+  parser.add_argument("--size",default="station",
+                      help="size of synthetic payloads (default: station)")
+  parser.add_argument("-f","--fixtures",metavar="DIR",
+                      help="directory with recorded responses")
+  parser.add_argument("--no-gzip",dest="gzip",action="store_false",
+                      help="don't request compressed responses")
+  parser.add_argument("-k","--keys",action="store_true",
+                      help="simulate key-presses after every cycle")
+  parser.add_argument("-p","--paging",action="store_true",
+                      help="check that paging only hits prepared pages")
+  parser.add_argument("-c","--config",nargs="+",metavar="KEY=JSON",
+                      help="additional app_config settings")
+  parser.add_argument("--width",type=int,default=296,help="display width")
+  parser.add_argument("--height",type=int,default=128,help="display height")
+  parser.add_argument("-o","--output",default="bench_cycle.json",
+                      help="output file (default: bench_cycle.json)")
+  parser.add_argument("-b","--baseline",
+                      help="baseline file to compare with")
+  parser.add_argument("--save-baseline",action="store_true",
+                      help="write result to the baseline file")
+  parser.add_argument("-t","--tolerance",type=float,default=0.2,
+                      help="allowed relative regression (default: 0.2)")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  options.output   = os.path.abspath(options.output)
+  if options.baseline:
+    options.baseline = os.path.abspath(options.baseline)
+  if options.fixtures:
+    options.fixtures = os.path.abspath(options.fixtures)
+
+  result = run(options)
+  with open(options.output,"w") as f:
+    json.dump(result,f,indent=2)
+  print(f"results written to {options.output}")
+  if result["page_misses"]:
+    print(f"pages not prepared (rows): {result['page_misses']}")
+    sys.exit(1)
+
+  if options.baseline and options.save_baseline:
+    with open(options.baseline,"w") as f:
+      json.dump(result,f,indent=2)
+    print(f"baseline written to {options.baseline}")
+  elif options.baseline:
+    with open(options.baseline,"r") as f:
+      baseline = json.load(f)
+    regressions = compare(result,baseline,options.tolerance)
+    if regressions:
+      print(f"regressions: {', '.join(regressions)}")
+      sys.exit(1)
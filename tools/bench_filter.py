@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: selective departure filters on a large payload.
+#
+# Compares the processing of a hub payload (parse, time conversion,
+# model) without filter, with the filter applied after decoding (the
+# original line-filter) and with the compiled filter evaluated on the
+# raw fields within the parser. "reject all" is the cost of scanning
+# the document alone.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),"..","src"))
+
+import depfixtures
+from departure_parser import DepartureParser
+from departure_filter import compile_filter
+from depmon_model import DepList
+from rest_api import parse_time
+
+# --- processing of a single departure (as in DepmonDataProvider)   ---------
+
+def post_filter(accept):
+  """ filter on decoded fields (original implementation) """
+  if not accept:
+    return None
+  return lambda cancelled,delay,direction,line: accept(
+    cancelled,int(delay/60) if delay else 0,
+    direction and direction.encode("utf-8"),line and line.encode("utf-8"))
+
+def process(data,accept,post):
+  """ process payload, return number of departures """
+
+  parser = DepartureParser(depfixtures.chunks(data))
+  info   = DepList()
+  for _,cancelled,planned,delay,direction,line in parser.departures(accept):
+    if post and not post(cancelled,delay,direction,line):
+      continue
+    info.append(parse_time(planned)[0],int(delay/60) if delay else 0,
+                line,direction,cancelled)
+  return len(info)
+
+def run(data,rounds,variants):
+  """ return list of (departures, best time in seconds, peak heap) """
+
+  # variants are interleaved, so drifting load affects all of them
+  times = [[] for _ in variants]
+  for _ in range(rounds):
+    for i,(accept,post) in enumerate(variants):
+      start = time.perf_counter()
+      process(data,accept,post)
+      times[i].append(time.perf_counter() - start)
+
+  result = []
+  for i,(accept,post) in enumerate(variants):
+    tracemalloc.start()                # separate run, slows down parsing
+    count = process(data,accept,post)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result.append((count,min(times[i]),peak))
+  return result
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="benchmark selective departure filters")
+  parser.add_argument("-n","--departures",type=int,
+                      default=depfixtures.SIZES["hub"],
+                      help="departures of the payload (default: hub)")
+  parser.add_argument("-f","--filter",
+                      default='{"prefix": "S", "dir": "Flughafen"}',
+                      help="filter-spec (json, default: %(default)s)")
+  parser.add_argument("-r","--rounds",type=int,default=10,
+                      help="rounds per variant (default: 10)")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  data    = depfixtures.payload(options.departures)
+  spec    = json.loads(options.filter)
+  accept  = compile_filter(spec)
+
+  print(f"payload: {len(data)} bytes, {options.departures} departures, " +
+        f"filter: {options.filter}")
+  print(f"{'variant':<14} {'deps':>5} {'time [ms]':>10} {'peak [kB]':>10}")
+  variants = [("no filter",(None,None)),
+              ("after decode",(None,post_filter(accept))),
+              ("compiled",(accept,None)),
+              ("reject all",(lambda *fields: False,None))]
+  result = run(data,options.rounds,[v for _,v in variants])
+  for (name,_),(count,duration,peak) in zip(variants,result):
+    print(f"{name:<14} {count:>5} {1000*duration:>10.1f} " +
+          f"{peak/1024:>10.1f}")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: load time and heap of BDF-fonts vs. compiled glyph subsets.
+#
+# Loads every font of src/fonts with adafruit_bitmap_font and with
+# glyph_font.py (subset compiled with compile_font.py into a temporary
+# directory) and renders the glyphs of typical departure rows.
+#
+# Needs the packages of the PC version (see README.md).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import glob
+import time
+import tempfile
+import tracemalloc
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,TOOLS_DIR)
+sys.path.insert(0,os.path.join(TOOLS_DIR,"..","src"))
+
+import depfixtures
+import compile_font
+import glyph_font
+from adafruit_bitmap_font import bitmap_font
+
+ROUNDS = 5
+
+# --- text of typical departure rows   ---------------------------------------
+
+def sample_text():
+  """ return text of departure rows, station names and footer """
+
+  texts = compile_font.texts_of_document(depfixtures.preset("hub"))
+  return "".join(texts) + "0123456789:+- X Aktualisiert 4.1V"
+
+# --- measure a single load   ------------------------------------------------
+
+def measure(load,text):
+  """ return (seconds,heap in bytes) of load() and loading all glyphs """
+
+  tracemalloc.start()
+  start = time.perf_counter()
+  font  = load()
+  font.load_glyphs(text)
+  for c in text:
+    font.get_glyph(ord(c))
+  duration = time.perf_counter()-start
+  current  = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return (duration,current)
+
+def best(load,text):
+  """ return best time and heap of ROUNDS loads """
+  results = [measure(load,text) for _ in range(ROUNDS)]
+  return (min(r[0] for r in results),min(r[1] for r in results))
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == "__main__":
+  fonts = sys.argv[1:] or sorted(
+    glob.glob(os.path.join(TOOLS_DIR,"..","src","fonts","*.bdf")))
+  text  = sample_text()
+  chars = compile_font.DEFAULT_CHARS + text
+
+  print(f"{'font':<26} {'format':<8} {'time':>9} {'heap':>9} {'file':>8}")
+  with tempfile.TemporaryDirectory() as tmp:
+    for font in fonts:
+      name = os.path.basename(font)
+      compiled = os.path.join(tmp,os.path.splitext(name)[0]+".bin")
+      compile_font.compile_font(font,chars,compiled)
+      for fmt,filename,load in [
+        ("bdf",font,lambda: bitmap_font.load_font(font)),
+        ("compiled",compiled,lambda: glyph_font.GlyphFont(compiled))]:
+        duration,heap = best(load,text)
+        print(f"{name:<26} {fmt:<8} {1000*duration:>7.1f}ms " +
+              f"{heap/1024:>7.1f}kB {os.path.getsize(filename)/1024:>6.1f}kB")
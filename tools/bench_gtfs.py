@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: build time, size and query latency of the GTFS timetable index.
+#
+# Builds the index (gtfs_build.py) of a GTFS-feed, by default a synthetic
+# feed (stations with two platforms, routes in both directions, services
+# for weekdays, saturday and sunday), and queries the next departures of
+# every indexed station at different times of the day.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import csv
+import time
+import random
+import datetime
+import argparse
+import tempfile
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,TOOLS_DIR)
+sys.path.insert(0,os.path.join(TOOLS_DIR,"..","src"))
+
+import gtfs_build
+from gtfs_index import GtfsIndex
+from depmon_model import day_number
+
+# --- synthetic feed   -------------------------------------------------------
+
+def write_table(path,name,header,rows):
+  """ write a GTFS-table """
+  with open(os.path.join(path,name),"w",newline="",encoding="utf-8") as f:
+    writer = csv.writer(f)
+    writer.writerow(header)
+    writer.writerows(rows)
+
+def create_feed(path,n_stations,n_routes,headway,first,n_days):
+  """ create a synthetic feed """
+
+  random.seed(42)
+  stops = []
+  for i in range(n_stations):
+    stops.append([f"P{i}",f"Station {i}",1,""])
+    stops.append([f"P{i}a",f"Station {i}",0,f"P{i}"])
+    stops.append([f"P{i}b",f"Station {i}",0,f"P{i}"])
+  write_table(path,"stops.txt",
+              ["stop_id","stop_name","location_type","parent_station"],stops)
+
+  last = first+datetime.timedelta(days=n_days-1)
+  write_table(path,"calendar.txt",
+              ["service_id","monday","tuesday","wednesday","thursday",
+               "friday","saturday","sunday","start_date","end_date"],
+              [[s]+days+[first.strftime("%Y%m%d"),last.strftime("%Y%m%d")]
+               for s,days in [("wk",[1,1,1,1,1,0,0]),("sa",[0,0,0,0,0,1,0]),
+                              ("so",[0,0,0,0,0,0,1])]])
+  holiday = (first+datetime.timedelta(days=n_days//2)).strftime("%Y%m%d")
+  write_table(path,"calendar_dates.txt",
+              ["service_id","date","exception_type"],
+              [["wk",holiday,2],["so",holiday,1]])
+
+  routes = []
+  trips  = []
+  times  = []
+  for r in range(n_routes):
+    kind = random.choice([(3,"Bus"),(109,"S"),(0,"Tram"),(106,"RB")])
+    routes.append([f"R{r}",f"{kind[1]} {r}",kind[0]])
+    length = random.randint(5,min(25,n_stations))
+    start  = random.randint(0,n_stations-length)
+    line   = list(range(start,start+length))
+    for direction,stations in enumerate([line,line[::-1]]):
+      platform = "ab"[direction]
+      for service,factor in [("wk",1),("sa",2),("so",3)]:
+        for dep in range(300+r % headway,1500,headway*factor):
+          trip = f"T{len(trips)}"
+          trips.append([trip,f"R{r}",service,f"Station {stations[-1]}"])
+          for seq,s in enumerate(stations):
+            t = dep+2*seq
+            tm = f"{t//60:02}:{t%60:02}:00"
+            times.append([trip,seq,f"P{s}{platform}",tm,tm])
+  write_table(path,"routes.txt",
+              ["route_id","route_short_name","route_type"],routes)
+  write_table(path,"trips.txt",
+              ["trip_id","route_id","service_id","trip_headsign"],trips)
+  write_table(path,"stop_times.txt",
+              ["trip_id","stop_sequence","stop_id","arrival_time",
+               "departure_time"],times)
+  return len(times)
+
+# --- query benchmark   ------------------------------------------------------
+
+def bench_queries(filename,stops,day,n,horizon):
+  """ query every stop each 10 minutes of the day, return latencies (s) """
+
+  index = GtfsIndex(filename)
+  stops = [index.stop(s) for s in stops]
+  latencies = []
+  found = 0
+  for minute in range(0,1440,10):
+    for stop in stops:
+      start = time.perf_counter()
+      for _,line,headsign in index.departures(stop,day,minute,horizon,n):
+        index.string(line)
+        index.string(headsign)
+        found += 1
+      latencies.append(time.perf_counter()-start)
+  return latencies,found
+
+def percentile(values,p):
+  """ return percentile p of values """
+  values = sorted(values)
+  return values[min(len(values)-1,int(p*len(values)))]
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="benchmark the GTFS timetable index")
+  parser.add_argument("--feed",
+                      help="GTFS-feed (default: synthetic feed)")
+  parser.add_argument("--stops",nargs="+",
+                      help="stop-ids to index (default: P0 P5 P10 ...)")
+  parser.add_argument("--stations",type=int,default=200,
+                      help="synthetic feed: number of stations")
+  parser.add_argument("--routes",type=int,default=60,
+                      help="synthetic feed: number of routes")
+  parser.add_argument("--headway",type=int,default=10,
+                      help="synthetic feed: minutes between trips")
+  parser.add_argument("-n","--departures",type=int,default=10,
+                      help="departures per query")
+  parser.add_argument("--horizon",type=int,default=120,
+                      help="time-horizon of queries in minutes")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  first = datetime.date.today()
+  with tempfile.TemporaryDirectory() as tmp:
+    feed = options.feed
+    if not feed:
+      feed = tmp
+      count = create_feed(tmp,options.stations,options.routes,
+                          options.headway,first,60)
+      print(f"synthetic feed: {options.stations} stations, " +
+            f"{options.routes} routes, {count} stop-times")
+    stops = options.stops or [f"P{i}" for i in range(0,options.stations,5)]
+    output = os.path.join(tmp,"gtfs.bin")
+
+    start = time.perf_counter()
+    stats = gtfs_build.build(feed,stops,stops[1:3],output)
+    print(f"build: {time.perf_counter()-start:.2f}s, {stats['size']} bytes, " +
+          f"{stats['departures']} departures of {stats['stops']} stops, " +
+          f"{stats['services']} services, {stats['days']} days")
+
+    first = stats["first"]
+    day = day_number(first.year,first.month,first.day)
+    latencies,found = bench_queries(output,stops,day,
+                                    options.departures,options.horizon)
+    print(f"queries: {len(latencies)}, {found} departures, " +
+          f"median {1000*percentile(latencies,0.5):.3f}ms, " +
+          f"p95 {1000*percentile(latencies,0.95):.3f}ms, " +
+          f"max {1000*max(latencies):.3f}ms")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: memory used by the departure model.
+#
+# Compares the original model (lists of plain DepInfo-objects with a
+# formatted time-string per departure) with the column store of
+# depmon_model.py using tracemalloc.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),"..","src"))
+
+import depfixtures
+from departure_parser import DepartureParser
+from depmon_model import StatInfo, DepList
+
+# --- original model   -------------------------------------------------------
+
+class LegacyDepInfo:
+  def __init__(self,plan,delay,line,dir,cancelled):
+    self.plan      = plan
+    self.delay     = delay
+    self.line      = line
+    self.dir       = dir
+    self.cancelled = cancelled
+
+class LegacyStatInfo:
+  def __init__(self,name,info,update):
+    self.name   = name
+    self.info   = info
+    self.update = update
+
+# --- parse departures   -----------------------------------------------------
+
+def parse(data):
+  """ return list of tuples (plan-minutes, delay, line, dir, cancelled) """
+  result = []
+  for _,cancelled,planned,delay,direction,line in (
+    DepartureParser(depfixtures.chunks(data)).departures()):
+    hour,minute = planned.split('T')[1].split(':')[0:2]
+    result.append((int(hour),int(minute),int((delay or 0)/60),
+                   line,direction,cancelled))
+  return result
+
+# --- build models   ---------------------------------------------------------
+
+def build_legacy(stations):
+  """ create model as done by the original data-provider """
+  model = []
+  for deps in stations:
+    info = []
+    for hour,minute,delay,line,direction,cancelled in deps:
+      # strings are fresh objects for every departure (as from json_stream)
+      info.append(LegacyDepInfo(":".join([f"{hour:02}",f"{minute:02}"]),
+                                delay,"".join(line),"".join(direction),
+                                cancelled))
+    model.append(LegacyStatInfo("Station",info,0))
+  return model
+
+def build_compact(stations):
+  """ create model using the column store """
+  model = []
+  for deps in stations:
+    info = DepList()
+    for hour,minute,delay,line,direction,cancelled in deps:
+      info.append(60*hour+minute,delay,"".join(line),"".join(direction),
+                  cancelled)
+    model.append(StatInfo("Station",info,0))
+  return model
+
+def measure(builder,stations):
+  """ return memory (current, peak) used by model """
+  tracemalloc.start()
+  model = builder(stations)              # alive while measuring
+  current,peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del model
+  return current,peak
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == "__main__":
+  n_stations = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+  print(f"{'size':<8} {'model':<8} {'deps':>6} {'current [kB]':>13} "
+        f"{'peak [kB]':>10}")
+  for name,count in depfixtures.SIZES.items():
+    stations = [parse(depfixtures.payload(count,seed=i))
+                for i in range(n_stations)]
+    n_deps = sum(len(s) for s in stations)
+    for mname,builder in [("legacy",build_legacy),("compact",build_compact)]:
+      current,peak = measure(builder,stations)
+      print(f"{name:<8} {mname:<8} {n_deps:>6} {current/1024:>13.1f} "
+            f"{peak/1024:>10.1f}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: parse time and peak heap of the departure parsers.
+#
+# Compares the json_stream based parser (the original implementation)
+# with the selective extractor, with and without early termination.
+# The payloads are synthetic documents from depfixtures.py or a recorded
+# response passed as filename.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import tracemalloc
+import importlib.util
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),"..","src"))
+
+import depfixtures
+from departure_parser import DepartureParser, JsonStreamParser
+
+# --- run parser   -----------------------------------------------------------
+
+def run(parser_class,data,max_departures=0):
+  """ parse data, return (departures, seconds, peak heap) """
+
+  tracemalloc.start()
+  start  = time.perf_counter()
+  parser = parser_class(depfixtures.chunks(data))
+  count  = 0
+  for dep in parser.departures():
+    count += 1
+    if count == max_departures:
+      break
+  duration = time.perf_counter() - start
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return count, duration, peak
+
+# --- main program   ---------------------------------------------------------
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    with open(sys.argv[1],"rb") as f:
+      payloads = {os.path.basename(sys.argv[1]): f.read()}
+  else:
+    payloads = {name: depfixtures.payload(n)
+                for name,n in depfixtures.SIZES.items()}
+
+  if importlib.util.find_spec("json_stream"):
+    parsers = [("json_stream",JsonStreamParser,0)]
+  else:
+    print("json_stream not installed, skipping reference parser")
+    parsers = []
+  parsers += [("extract",DepartureParser,0),
+              ("extract-10",DepartureParser,10)]
+
+  print(f"{'payload':<10} {'bytes':>8} {'parser':<12} {'deps':>5} "
+        f"{'time [ms]':>10} {'peak [kB]':>10}")
+  for name,data in payloads.items():
+    for pname,pclass,max_deps in parsers:
+      count,duration,peak = run(pclass,data,max_deps)
+      print(f"{name:<10} {len(data):>8} {pname:<12} {count:>5} "
+            f"{1000*duration:>10.1f} {peak/1024:>10.1f}")
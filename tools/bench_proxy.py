@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Benchmark: throughput of the edge proxy with many simulated devices.
+#
+# Starts the local departures server (depserver.py) as upstream and the
+# edge proxy (depproxy.py), then runs n client threads. Every client
+# polls the proxy with the query of one of k distinct stations. Reports
+# requests per second, latency, upstream requests and the payload size
+# and decode time per device compared to the json-document.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import argparse
+import threading
+import http.client
+import urllib.request
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,TOOLS_DIR)
+sys.path.insert(0,os.path.join(TOOLS_DIR,"..","src"))
+
+import depserver
+import depproxy
+from departure_parser import DepartureParser
+from proxy_payload import PayloadReader
+from rest_api import create_url
+
+# --- simulated device   -----------------------------------------------------
+
+def client(port,path,requests,latencies,errors):
+  """ poll the proxy using a persistent connection """
+
+  conn = http.client.HTTPConnection("localhost",port)
+  for _ in range(requests):
+    start = time.perf_counter()
+    try:
+      conn.request("GET",path)
+      resp = conn.getresponse()
+      resp.read()
+      if resp.status != 200:
+        errors.append(resp.status)
+    except Exception as ex:
+      errors.append(str(ex))
+      conn.close()
+      conn = http.client.HTTPConnection("localhost",port)
+    latencies.append(time.perf_counter()-start)
+  conn.close()
+
+def percentile(values,p):
+  """ return percentile p of values """
+  values = sorted(values)
+  return values[min(len(values)-1,int(p*len(values)))]
+
+# --- decode cost per device   -----------------------------------------------
+
+def decode_json(body,rounds):
+  """ return time per decode of the json-document """
+
+  start = time.perf_counter()
+  for _ in range(rounds):
+    for _ in DepartureParser([body[i:i+256]
+                              for i in range(0,len(body),256)]).departures():
+      pass
+  return (time.perf_counter()-start)/rounds
+
+def decode_payload(body,rounds,size):
+  """ return time per decode of the proxy-payload """
+
+  def reader(pos):
+    def readinto(buf):
+      n = min(len(buf),len(body)-pos[0])
+      buf[0:n] = body[pos[0]:pos[0]+n]
+      pos[0] += n
+      return n
+    return readinto
+
+  start = time.perf_counter()
+  for _ in range(rounds):
+    for _ in PayloadReader(reader([0]),size).departures():
+      pass
+  return (time.perf_counter()-start)/rounds
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="benchmark the edge proxy with simulated devices")
+  parser.add_argument("-c","--clients",type=int,default=200,
+                      help="number of simulated devices (default: 200)")
+  parser.add_argument("-k","--stations",type=int,default=5,
+                      help="number of distinct stations (default: 5)")
+  parser.add_argument("-n","--requests",type=int,default=20,
+                      help="requests per device (default: 20)")
+  parser.add_argument("-s","--size",default="hub",
+                      help="upstream payload: halt, station, hub or number")
+  parser.add_argument("-l","--latency",type=depserver.latency,default=None,
+                      help="upstream latency, e.g. 0.5 or 0.2-1")
+  parser.add_argument("--buffer",type=int,default=256,
+                      help="buffer size of the device (default: 256)")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+
+  upstream_args = ["-p","0","-s",options.size,"--shift","--no-gzip"]
+  upstream = depserver.create_server(
+    depserver.get_parser().parse_args(upstream_args))
+  upstream.options.latency = options.latency
+  threading.Thread(target=upstream.serve_forever,daemon=True).start()
+  prefix = f"http://localhost:{upstream.server_address[1]}/stops"
+
+  proxy = depproxy.create_server(depproxy.get_parser().parse_args(
+    ["-p","0","-u",prefix,"-i","60"]))
+  threading.Thread(target=proxy.serve_forever,daemon=True).start()
+  port = proxy.server_address[1]
+
+  stations = [str(8000000+i) for i in range(options.stations)]
+  latencies = []
+  errors    = []
+  threads   = [threading.Thread(
+    target=client,
+    args=(port,f"/departures?station={stations[i % len(stations)]}" +
+          "&duration=120&max=10",options.requests,latencies,errors))
+                 for i in range(options.clients)]
+  start = time.perf_counter()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  duration = time.perf_counter()-start
+
+  stats = proxy.proxy.stats
+  print(f"clients: {options.clients}, stations: {options.stations}, " +
+        f"requests: {len(latencies)}, errors: {len(errors)}")
+  print(f"throughput: {len(latencies)/duration:.0f} requests/s, " +
+        f"latency median {1000*percentile(latencies,0.5):.2f}ms, " +
+        f"p95 {1000*percentile(latencies,0.95):.2f}ms")
+  print(f"upstream requests: {stats['upstream']} " +
+        f"(errors: {stats['upstream_errors']}), cache hits: {stats['hits']}")
+
+  # size and decode time per device
+  with urllib.request.urlopen(
+    create_url(prefix,stations[0],None,None,120)) as resp:
+    doc = resp.read()
+  with urllib.request.urlopen(
+    f"http://localhost:{port}/departures?station={stations[0]}" +
+    "&duration=120") as resp:
+    payload = resp.read()
+  print(f"device: json {len(doc)} bytes, " +
+        f"{1000*decode_json(doc,20):.2f}ms decode; " +
+        f"payload {len(payload)} bytes, " +
+        f"{1000*decode_payload(payload,20,options.buffer):.2f}ms decode " +
+        "(all departures, no max)")
+
+  proxy.proxy.stop()
+  proxy.shutdown()
+  upstream.shutdown()
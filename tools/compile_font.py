@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Compile BDF-fonts to a binary glyph subset for src/glyph_font.py.
+#
+# The subset contains the printable ASCII characters (digits, symbols and
+# line names of the departure rows, error messages), the characters of
+# the footer and all characters of station names, line names and
+# directions. These are collected from recorded responses (see
+# record_departures.py), from the live API (--fetch) and from the
+# command line, after applying app_config.replace.
+#
+# Format of the output file (little endian):
+#   header: magic "DMF\x01", number of glyphs, bounding box (w,h,x,y),
+#           ascent, descent
+#   index:  per glyph (sorted by codepoint): codepoint, width, height,
+#           dx, dy, shift_x, shift_y, offset of bitmap
+#   bitmaps: one bit per pixel, rows padded to full bytes (as in BDF)
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import glob
+import json
+import struct
+import argparse
+import importlib.util
+import urllib.request
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),"..","src"))
+sys.path.insert(0,SRC_DIR)
+
+from text_replacer import TextReplacer
+from rest_api import URL_PREFIX, create_url
+
+MAGIC  = b"DMF\x01"
+HEADER = "<4sHhhhhhh"
+RECORD = "<HBBbbbbI"
+
+# always included: ASCII and German umlauts
+DEFAULT_CHARS = "".join(chr(c) for c in range(0x20,0x7F)) + "äöüÄÖÜß"
+
+# --- parse BDF-font   -------------------------------------------------------
+
+def read_bdf(filename):
+  """ parse BDF, return (bbox,ascent,descent,glyphs) """
+
+  bbox    = (0,0,0,0)
+  ascent  = 0
+  descent = 0
+  glyphs  = {}
+  glyph   = None
+  rows    = None
+  with open(filename,"r",encoding="latin-1") as f:
+    for line in f:
+      parts = line.split()
+      if not parts:
+        continue
+      key = parts[0]
+      if rows is not None:
+        if key == "ENDCHAR":
+          glyph["bitmap"] = b"".join(rows)
+          if glyph["codepoint"] >= 0:
+            glyphs[glyph["codepoint"]] = glyph
+          glyph = None
+          rows  = None
+        else:
+          rows.append(bytes.fromhex(key))
+      elif key == "FONTBOUNDINGBOX":
+        bbox = tuple(int(v) for v in parts[1:5])
+      elif key == "FONT_ASCENT":
+        ascent = int(parts[1])
+      elif key == "FONT_DESCENT":
+        descent = int(parts[1])
+      elif key == "STARTCHAR":
+        glyph = {"shift": (0,0)}
+      elif key == "ENCODING":
+        glyph["codepoint"] = int(parts[-1])
+      elif key == "DWIDTH":
+        glyph["shift"] = (int(parts[1]),int(parts[2]))
+      elif key == "BBX":
+        glyph["bbx"] = tuple(int(v) for v in parts[1:5])
+      elif key == "BITMAP":
+        rows = []
+  return (bbox,ascent,descent,glyphs)
+
+# --- write subset   ---------------------------------------------------------
+
+def compile_font(filename,chars,output):
+  """ write subset of the BDF-font, return (number of glyphs,missing) """
+
+  bbox,ascent,descent,glyphs = read_bdf(filename)
+  codepoints = sorted(set(ord(c) for c in chars if ord(c) < 0x10000))
+  missing    = [chr(c) for c in codepoints if not c in glyphs]
+  codepoints = [c for c in codepoints if c in glyphs]
+
+  index  = []
+  bitmap = []
+  offset = (struct.calcsize(HEADER) +
+            len(codepoints)*struct.calcsize(RECORD))
+  for c in codepoints:
+    g = glyphs[c]
+    width,height,dx,dy = g["bbx"]
+    index.append(struct.pack(RECORD,c,width,height,dx,dy,
+                             g["shift"][0],g["shift"][1],offset))
+    bitmap.append(g["bitmap"])
+    offset += len(g["bitmap"])
+
+  with open(output,"wb") as f:
+    f.write(struct.pack(HEADER,MAGIC,len(codepoints),*bbox,ascent,descent))
+    f.write(b"".join(index))
+    f.write(b"".join(bitmap))
+  return (len(codepoints),missing)
+
+# --- collect texts   --------------------------------------------------------
+
+def texts_of_document(doc):
+  """ return station names, line names and directions of a response """
+
+  texts = set()
+  for dep in doc.get("departures",[]):
+    for value in [dep.get("stop",{}).get("name",None),
+                  dep.get("direction",None),
+                  (dep.get("line",None) or {}).get("name",None)]:
+      if value:
+        texts.add(value)
+  return texts
+
+def load_settings(filename):
+  """ load settings-module """
+
+  spec = importlib.util.spec_from_file_location("settings",filename)
+  settings = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(settings)
+  return settings
+
+def collect_chars(options):
+  """ return string with all characters of the subset """
+
+  texts = set(options.text or [])
+  app_config = None
+  ui_config  = None
+  if options.settings:
+    settings   = load_settings(options.settings)
+    app_config = settings.app_config
+    ui_config  = getattr(settings,'ui_config',None)
+
+  # recorded responses
+  if options.fixtures:
+    for filename in glob.glob(os.path.join(options.fixtures,"*.json")):
+      with open(filename,"r") as f:
+        texts |= texts_of_document(json.load(f))
+
+  # live API
+  if options.fetch and app_config:
+    prefix = getattr(app_config,'url_prefix',URL_PREFIX)
+    for station in app_config.stations:
+      # all directions and products: texts of every line at the station
+      url = create_url(prefix,station[0],None,None,240)
+      with urllib.request.urlopen(url) as resp:
+        texts |= texts_of_document(json.load(resp))
+
+  # footer
+  texts.add(getattr(ui_config,'FOOTER',"Aktualisiert"))
+
+  # apply replacements (the replaced texts are never displayed)
+  if app_config:
+    replace = TextReplacer(getattr(app_config,'replace',[]))
+    texts = set(replace(t) for t in texts)
+  return DEFAULT_CHARS + "".join(texts)
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="compile BDF-fonts to binary glyph subsets")
+  parser.add_argument("fonts",nargs="*",
+                      default=glob.glob(os.path.join(SRC_DIR,"fonts","*.bdf")),
+                      help="BDF-fonts (default: src/fonts/*.bdf)")
+  parser.add_argument("-s","--settings",
+                      help="settings.py (stations and replacements)")
+  parser.add_argument("-f","--fixtures",metavar="DIR",
+                      help="directory with recorded responses")
+  parser.add_argument("--fetch",action="store_true",
+                      help="query station names from the API (needs -s)")
+  parser.add_argument("-t","--text",nargs="+",
+                      help="additional texts")
+  parser.add_argument("-o","--output",metavar="DIR",
+                      help="output directory (default: directory of font)")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  chars = collect_chars(options)
+  for font in options.fonts:
+    name   = os.path.splitext(os.path.basename(font))[0] + ".bin"
+    output = os.path.join(options.output or os.path.dirname(font),name)
+    count,missing = compile_font(font,chars,output)
+    print(f"{font}: {count} glyphs, {os.path.getsize(output)} bytes " +
+          f"-> {output}")
+    if missing:
+      print(f"  missing glyphs: {''.join(missing)!r}")
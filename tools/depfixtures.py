@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------
+# Synthetic departure-documents in the format of v6.db.transport.rest.
+#
+# The documents contain all the (for the departure monitor useless)
+# subtrees of the real responses, so they are suitable for benchmarks
+# of the parsers.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import json
+import random
+import datetime
+
+# number of departures for typical station sizes
+SIZES = {
+  "halt":    8,
+  "station": 60,
+  "hub":     400
+  }
+
+PRODUCTS = ["nationalExpress","national","regionalExpress","regional",
+            "suburban","bus","ferry","subway","tram","taxi"]
+
+LINES = [
+  ("ICE 1087","nationalExpress"), ("IC 2013","national"),
+  ("RE 4","regionalExpress"), ("RB 66","regional"),
+  ("S 6","suburban"), ("S 8","suburban"), ("U 5","subway"),
+  ("Bus 960","bus"), ("Bus 43","bus"), ("Tram 19","tram"),
+  ]
+
+DIRECTIONS = [
+  (8000261,"München Hbf"), (8000240,"Tutzing"), (8004158,"Pasing"),
+  (8004168,"Flughafen München"), (625169,"Neuperlach Süd"),
+  (8005677,"Starnberg Nord"), (8000119,"Garmisch-Partenkirchen"),
+  (8000262,"Ostbahnhof"), (638169,"Laimer Platz"),
+  (624537,"Fürstenried West")
+  ]
+
+# station-id and name used for the presets
+STATIONS = {
+  "halt":    (8005677,"Starnberg Nord"),
+  "station": (8005676,"Starnberg"),
+  "hub":     (8000261,"München Hbf")
+  }
+
+# --- create a single departure   --------------------------------------------
+
+def departure(station,name,when,delay,line,product,destination,cancelled):
+  """ create departure entry """
+
+  tz = datetime.timezone(datetime.timedelta(hours=2))
+  planned = when.replace(tzinfo=tz)
+  actual  = planned + datetime.timedelta(seconds=delay or 0)
+  return {
+    "tripId": f"1|{random.randint(100000,999999)}|0|80|{when:%d%m%Y}",
+    "stop": {
+      "type": "stop",
+      "id": str(station),
+      "name": name,
+      "location": {
+        "type": "location",
+        "id": str(station),
+        "latitude": 48.000,
+        "longitude": 11.344
+        },
+      "products": {p: True for p in PRODUCTS}
+      },
+    "when": None if cancelled else actual.isoformat(),
+    "plannedWhen": planned.isoformat(),
+    "delay": None if cancelled else delay,
+    "platform": str(random.randint(1,8)),
+    "plannedPlatform": str(random.randint(1,8)),
+    "prognosisType": "prognosed",
+    "direction": destination[1],
+    "provenance": None,
+    "line": {
+      "type": "line",
+      "id": line.lower().replace(" ","-"),
+      "fahrtNr": str(random.randint(1000,99999)),
+      "name": line,
+      "public": True,
+      "adminCode": "800725",
+      "productName": line.split()[0],
+      "mode": "train" if product != "bus" else "bus",
+      "product": product,
+      "operator": {
+        "type": "operator",
+        "id": "db-regio-ag-bayern",
+        "name": "DB Regio AG Bayern"
+        }
+      },
+    "remarks": [],
+    "origin": None,
+    "destination": {
+      "type": "stop",
+      "id": str(destination[0]),
+      "name": destination[1],
+      "location": {"type": "location","id": str(destination[0]),
+                   "latitude": 48.140,"longitude": 11.558}
+      },
+    "cancelled": True if cancelled else None,
+    "currentTripPosition": {"type": "location",
+                            "latitude": 48.1,"longitude": 11.5}
+    }
+
+# --- create departures document   -------------------------------------------
+
+def document(count,station=8005676,name="Starnberg",seed=42,
+             start=None,lines=None,destinations=None):
+  """ create departures-document with count departures """
+
+  random.seed(seed)
+  start = start or datetime.datetime(2024,5,6,7,0)
+  lines = lines or LINES
+  destinations = destinations or DIRECTIONS
+  departures = []
+  for i in range(count):
+    when = start + datetime.timedelta(minutes=int(i*120/max(count,1)))
+    line,product = lines[i % len(lines)]
+    cancelled = random.random() < 0.03
+    delay = random.choice([None,0,0,60,120,300,900])
+    departures.append(departure(station,name,when.replace(second=0),delay,
+                                line,product,random.choice(destinations),
+                                cancelled))
+  return {
+    "departures": departures,
+    "realtimeDataUpdatedAt": int(start.timestamp())
+    }
+
+def preset(size,**kw):
+  """ create departures-document for a preset (halt, station, hub) """
+  station,name = STATIONS[size]
+  return document(SIZES[size],station=station,name=name,**kw)
+
+def payload(count,**kw):
+  """ create departures-document as bytes """
+  return json.dumps(document(count,**kw)).encode()
+
+def chunks(data,size=256):
+  """ split payload into chunks like resp.iter_content() """
+  for i in range(0,len(data),size):
+    yield data[i:i+size]
+
+# --- write presets as fixture-files   ---------------------------------------
+
+if __name__ == "__main__":
+  import os
+  import sys
+  if len(sys.argv) == 1:
+    print(f"usage: {sys.argv[0]} directory")
+    sys.exit(0)
+
+  os.makedirs(sys.argv[1],exist_ok=True)
+  for size,(station,_) in STATIONS.items():
+    filename = os.path.join(sys.argv[1],f"{station}.json")
+    with open(filename,"w") as f:
+      json.dump(preset(size),f,ensure_ascii=False)
+    print(f"{size:<8}: {filename}")
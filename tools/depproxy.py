@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Aggregating edge proxy for a fleet of departure monitors.
+#
+# Devices query /departures with the fields of their app_config.stations
+# tuples (station, via, products, line) plus duration and max. Every
+# distinct query is fetched once per interval from the upstream API,
+# parsed and filtered centrally and served as compact line based payload
+# (see src/proxy_payload.py). Queries seen from devices (or read from
+# settings-files with -s) are refreshed in the background, so devices
+# are served from memory. Queries not requested for --idle intervals are
+# dropped. On upstream errors the last good result is served.
+#
+# Point the departure monitor to the proxy with
+#
+#   app_config.proxy_url = "http://proxy-host:8081/departures"
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import importlib.util
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..","src"))
+
+import content_decoder
+import proxy_payload
+from departure_parser import DepartureParser
+from departure_filter import compile_filter, line_name
+from rest_api import URL_PREFIX, create_url, parse_time
+
+# --- upstream query   -------------------------------------------------------
+
+def fetch(prefix,key,timeout=30):
+  """ query upstream, return (name,updated,list of encoded departures) """
+
+  station,via,products,line,duration = key
+  request = urllib.request.Request(
+    create_url(prefix,station,via,products,duration),
+    headers={"Accept-Encoding": content_decoder.ACCEPT_ENCODING})
+  with urllib.request.urlopen(request,timeout=timeout) as resp:
+    chunks = iter(lambda: resp.read(4096),b"")
+    parser = DepartureParser(content_decoder.decode(
+      chunks,resp.headers.get("Content-Encoding")))
+    offset = 0
+    departures = []
+    for _,cancelled,planned,delay,direction,name in (
+      parser.departures(compile_filter(line))):
+      plan,offset = parse_time(planned)
+      delay = int(int(delay)/60) if delay else 0
+      departures.append(proxy_payload.encode_departure(
+        plan,delay,cancelled,name,direction))
+    name = parser.stop or station
+  updated = int(parser.updated)+offset if parser.updated else 0
+  return (name,updated,departures)
+
+# --- cache of queries   -----------------------------------------------------
+
+class Entry:
+  """ result of a query """
+
+  def __init__(self):
+    self.lock       = threading.Lock()   # single upstream request per query
+    self.name       = None
+    self.updated    = 0
+    self.departures = None
+    self.fetched    = 0                  # time of last (attempted) fetch
+    self.pending    = False              # background refresh submitted
+    self.used       = time.monotonic()   # time of last request
+
+class Proxy:
+  """ fetch, cache and refresh queries """
+
+  def __init__(self,options):
+    """ constructor """
+
+    self._options = options
+    self._entries = {}
+    self._lock    = threading.Lock()
+    self._stop    = threading.Event()
+    self._pool    = ThreadPoolExecutor(max_workers=options.workers)
+    self.stats    = {"requests": 0, "hits": 0, "upstream": 0,
+                     "upstream_errors": 0, "bytes": 0}
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._options.verbose:
+      print(text)
+
+  def _count(self,key,n=1):
+    """ update statistics """
+    with self._lock:
+      self.stats[key] += n
+
+  def _entry(self,key):
+    """ return entry of query (create if necessary) """
+    with self._lock:
+      entry = self._entries.get(key,None)
+      if not entry:
+        entry = Entry()
+        self._entries[key] = entry
+      return entry
+
+  def _refresh(self,key,entry,force=False):
+    """ fetch query from upstream unless another thread just did it """
+
+    with entry.lock:
+      if not force and (entry.departures is not None and
+                        time.monotonic()-entry.fetched < self._options.interval):
+        return
+      entry.fetched = time.monotonic()
+      try:
+        self._count("upstream")
+        entry.name,entry.updated,entry.departures = fetch(
+          self._options.upstream,key)
+        self.msg(f"fetched {key}: {len(entry.departures)} departures")
+      except Exception as ex:
+        self._count("upstream_errors")
+        self.msg(f"fetching {key} failed: {ex}")
+        if entry.departures is None:
+          raise
+
+  def get(self,key,max_departures=0):
+    """ return payload of query """
+
+    self._count("requests")
+    entry = self._entry(key)
+    entry.used = time.monotonic()
+    if (entry.departures is not None and
+        entry.used-entry.fetched < 2*self._options.interval):
+      self._count("hits")
+    else:
+      self._refresh(key,entry)
+
+    departures = entry.departures
+    if max_departures:
+      departures = departures[:max_departures]
+    payload = (proxy_payload.encode_header(entry.updated,len(departures),
+                                           entry.name) +
+               b"".join(departures))
+    self._count("bytes",len(payload))
+    return payload
+
+  def add(self,key):
+    """ register query (e.g. from settings) """
+    self._entry(key)
+
+  # --- background refresh   -------------------------------------------------
+
+  def _refresh_all(self):
+    """ refresh due queries, drop unused queries """
+
+    now  = time.monotonic()
+    idle = self._options.idle*self._options.interval
+    with self._lock:
+      items = list(self._entries.items())
+    for key,entry in items:
+      if now-entry.used > idle:
+        with self._lock:
+          del self._entries[key]
+        self.msg(f"dropped {key}")
+      elif not entry.pending and now-entry.fetched >= self._options.interval:
+        # skip queries still waiting for a worker (busy pool)
+        entry.pending = True
+        self._pool.submit(self._refresh_pending,key,entry)
+
+  def _refresh_pending(self,key,entry):
+    """ background refresh of a query """
+    try:
+      self._refresh(key,entry)
+    except Exception:
+      pass                       # already counted and logged
+    finally:
+      entry.pending = False
+
+  def run(self):
+    """ refresh loop (run in a thread) """
+    while not self._stop.wait(1):
+      self._refresh_all()
+
+  def stop(self):
+    """ stop refresh loop """
+    self._stop.set()
+    self._pool.shutdown(wait=False)
+
+# --- request handler   ------------------------------------------------------
+
+def query_key(params,default_duration=120):
+  """ create key of query from request-parameters """
+
+  def value(name):
+    return params.get(name,[None])[0] or None
+  if not value("station"):
+    raise ValueError("missing station")
+  return (value("station"),value("via"),value("products"),value("line"),
+          int(value("duration") or default_duration))
+
+class Handler(BaseHTTPRequestHandler):
+  """ handle requests for /departures """
+
+  protocol_version = "HTTP/1.1"    # keep-alive
+
+  def log_message(self,format,*args):
+    if self.server.options.verbose:
+      super().log_message(format,*args)
+
+  def _send(self,status,body=b"",content_type="text/plain; charset=utf-8"):
+    """ send response """
+    self.send_response(status)
+    self.send_header("Content-Type",content_type)
+    self.send_header("Content-Length",str(len(body)))
+    self.end_headers()
+    if body:
+      self.wfile.write(body)
+
+  def do_GET(self):
+    """ process get-request """
+
+    url = urlparse(self.path)
+    if url.path == "/stats":
+      with self.server.proxy._lock:
+        stats = dict(self.server.proxy.stats,
+                     queries=len(self.server.proxy._entries))
+      self._send(200,json.dumps(stats).encode(),"application/json")
+      return
+    elif url.path != "/departures":
+      self._send(404,b"not found")
+      return
+
+    params = parse_qs(url.query)
+    try:
+      key = query_key(params)
+      max_departures = int(params.get("max",["0"])[0])
+    except ValueError as ex:
+      self._send(400,str(ex).encode())
+      return
+    try:
+      self._send(200,self.server.proxy.get(key,max_departures))
+    except Exception as ex:
+      self._send(502,f"upstream: {ex}".encode())
+
+# --- main program   ---------------------------------------------------------
+
+def load_stations(filename):
+  """ return app_config.stations and duration of settings-file """
+
+  spec = importlib.util.spec_from_file_location("settings",filename)
+  settings = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(settings)
+  app_config = settings.app_config
+  return (app_config.stations,getattr(app_config,'duration',120))
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="edge proxy serving compact departures to departure monitors")
+  parser.add_argument("-p","--port",type=int,default=8081,
+                      help="port (default: 8081)")
+  parser.add_argument("-u","--upstream",default=URL_PREFIX,
+                      help=f"upstream url-prefix (default: {URL_PREFIX})")
+  parser.add_argument("-i","--interval",type=int,default=60,
+                      help="refresh interval in seconds (default: 60)")
+  parser.add_argument("--idle",type=int,default=10,
+                      help="drop queries unused for n intervals (default: 10)")
+  parser.add_argument("-w","--workers",type=int,default=4,
+                      help="parallel upstream requests (default: 4)")
+  parser.add_argument("-s","--settings",nargs="+",default=[],
+                      help="settings-files of devices (prefetch stations)")
+  parser.add_argument("-v","--verbose",action="store_true",
+                      help="log requests")
+  return parser
+
+def create_server(options,host="localhost"):
+  """ create (but don't start) server and refresh-thread """
+
+  server = ThreadingHTTPServer((host,options.port),Handler)
+  server.daemon_threads = True
+  server.options = options
+  server.proxy   = Proxy(options)
+  for filename in options.settings:
+    stations,duration = load_stations(filename)
+    for station,via,products,line in stations:
+      # other filters are applied by the devices
+      server.proxy.add((str(station),str(via) if via else None,
+                        products or None,line_name(line),duration))
+  threading.Thread(target=server.proxy.run,daemon=True).start()
+  return server
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  server = create_server(options,"")
+  print(f"serving departures on http://localhost:{options.port}/departures")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.proxy.stop()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Local stand-in for the /stops/{id}/departures endpoint of
+# https://v6.db.transport.rest/
+#
+# The server replays recorded responses (see record_departures.py) or
+# synthetic documents (see depfixtures.py). It implements the query
+# parameters used by the departure monitor (duration, direction and the
+# product flags), compressed transfer and ETags. Latency and errors can
+# be injected.
+#
+# Point the departure monitor to the server with
+#
+#   app_config.url_prefix = "http://localhost:8080/stops"
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import random
+import zlib
+import datetime
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0,os.path.dirname(__file__))
+import depfixtures
+
+PATH_REGEX = re.compile(r"^/stops/([^/]+)/departures$")
+
+# --- source of departure-documents   ----------------------------------------
+
+class Fixtures:
+  """ recorded or synthetic departure-documents """
+
+  def __init__(self,directory=None,size="station",shift=False):
+    """ constructor """
+    self._dir   = directory
+    self._size  = size
+    self._shift = shift
+    self._docs  = {}
+    self._lock  = threading.Lock()
+
+  def _load(self,station):
+    """ load recorded document or create synthetic document """
+
+    if self._dir:
+      filename = os.path.join(self._dir,f"{station}.json")
+      if os.path.exists(filename):
+        with open(filename,"r") as f:
+          return json.load(f)
+    if self._size in depfixtures.SIZES:
+      count = depfixtures.SIZES[self._size]
+    else:
+      count = int(self._size)
+    return depfixtures.document(count,station=station,
+                                name=f"Station {station}",
+                                seed=zlib.crc32(station.encode()))
+
+  def get(self,station):
+    """ return (cached) document of station """
+    with self._lock:
+      if not station in self._docs:
+        doc = self._load(station)
+        if self._shift:
+          shift_times(doc)
+        self._docs[station] = doc
+      return self._docs[station]
+
+# --- helper functions   -----------------------------------------------------
+
+def shift_times(doc):
+  """ shift all timestamps, so that the first departure is now """
+
+  if not doc["departures"]:
+    return
+  first = datetime.datetime.fromisoformat(doc["departures"][0]["plannedWhen"])
+  now   = datetime.datetime.now(first.tzinfo).replace(second=0,microsecond=0)
+  delta = now - first
+  for dep in doc["departures"]:
+    for key in ["when","plannedWhen"]:
+      if dep[key]:
+        dep[key] = (datetime.datetime.fromisoformat(dep[key])+
+                    delta).isoformat()
+  doc["realtimeDataUpdatedAt"] = int(time.time())
+
+def query(doc,params):
+  """ apply query parameters to document """
+
+  deps = doc["departures"]
+
+  # duration (minutes after the first departure)
+  duration = int(params.get("duration",["10"])[0])
+  if deps:
+    first = datetime.datetime.fromisoformat(deps[0]["plannedWhen"])
+    limit = first + datetime.timedelta(minutes=duration)
+    deps = [d for d in deps
+            if datetime.datetime.fromisoformat(d["plannedWhen"]) < limit]
+
+  # direction: keep departures to the given destination
+  direction = params.get("direction",[None])[0]
+  if direction:
+    deps = [d for d in deps
+            if d.get("destination") and d["destination"]["id"] == direction]
+
+  # products set to false
+  excluded = [p for p in depfixtures.PRODUCTS
+              if params.get(p,["true"])[0] == "false"]
+  if excluded:
+    deps = [d for d in deps if not d["line"]["product"] in excluded]
+
+  return {"departures": deps,
+          "realtimeDataUpdatedAt": doc["realtimeDataUpdatedAt"]}
+
+# --- request handler   ------------------------------------------------------
+
+class Handler(BaseHTTPRequestHandler):
+  """ handle requests for /stops/{id}/departures """
+
+  protocol_version = "HTTP/1.1"    # keep-alive
+
+  def log_message(self,format,*args):
+    if self.server.options.verbose:
+      super().log_message(format,*args)
+
+  def _send(self,status,body=b"",headers={}):
+    """ send response """
+    self.send_response(status)
+    for key,value in headers.items():
+      self.send_header(key,value)
+    self.send_header("Content-Length",str(len(body)))
+    self.end_headers()
+    if body:
+      self.wfile.write(body)
+
+  def do_GET(self):
+    """ process get-request """
+
+    options = self.server.options
+    url     = urlparse(self.path)
+    match   = PATH_REGEX.match(url.path)
+    if not match:
+      self._send(404,b'{"message":"not found"}',
+                 {"Content-Type": "application/json"})
+      return
+
+    # inject latency and errors
+    if options.latency:
+      time.sleep(random.uniform(*options.latency))
+    if random.random() < options.error_rate:
+      if options.error_status == 0:
+        self.close_connection = True      # connection reset
+        self.connection.close()
+      else:
+        self._send(options.error_status,b'{"message":"injected error"}',
+                   {"Content-Type": "application/json"})
+      return
+
+    doc  = self.server.fixtures.get(match.group(1))
+    body = json.dumps(query(doc,parse_qs(url.query)),
+                      ensure_ascii=False).encode()
+
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    if options.etag:
+      etag = f'"{zlib.crc32(body):08x}"'
+      headers["ETag"] = etag
+      if self.headers.get("If-None-Match") == etag:
+        self._send(304,headers=headers)
+        return
+    if options.gzip and "gzip" in self.headers.get("Accept-Encoding",""):
+      body = gzip.compress(body)
+      headers["Content-Encoding"] = "gzip"
+    self._send(200,body,headers)
+
+# --- parse latency   --------------------------------------------------------
+
+def latency(value):
+  """ parse latency: seconds or range min-max """
+  if "-" in value:
+    low,high = value.split("-")
+    return (float(low),float(high))
+  return (float(value),float(value))
+
+# --- main program   ---------------------------------------------------------
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="local stand-in for v6.db.transport.rest departures")
+  parser.add_argument("-p","--port",type=int,default=8080,
+                      help="port (default: 8080)")
+  parser.add_argument("-f","--fixtures",metavar="DIR",
+                      help="directory with recorded responses <station>.json")
+  parser.add_argument("-s","--size",default="station",
+                      help="synthetic payload: halt, station, hub or " +
+                      "number of departures (default: station)")
+  parser.add_argument("--shift",action="store_true",
+                      help="shift timestamps to the current time")
+  parser.add_argument("-l","--latency",type=latency,default=None,
+                      help="latency in seconds, e.g. 1.5 or 1-3")
+  parser.add_argument("-e","--error-rate",type=float,default=0.0,
+                      help="fraction of failing requests (default: 0)")
+  parser.add_argument("--error-status",type=int,default=503,
+                      help="http-status of failures, 0: reset connection")
+  parser.add_argument("--no-gzip",dest="gzip",action="store_false",
+                      help="ignore Accept-Encoding")
+  parser.add_argument("--no-etag",dest="etag",action="store_false",
+                      help="don't send ETags")
+  parser.add_argument("-v","--verbose",action="store_true",
+                      help="log requests")
+  return parser
+
+def create_server(options,host="localhost"):
+  """ create (but don't start) server """
+
+  server = ThreadingHTTPServer((host,options.port),Handler)
+  server.daemon_threads = True
+  server.options  = options
+  server.fixtures = Fixtures(options.fixtures,options.size,options.shift)
+  return server
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  server = create_server(options,"")
+  print(f"serving departures on http://localhost:{options.port}/stops")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
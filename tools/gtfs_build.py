@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Compile a GTFS static feed to the timetable index of src/gtfs_index.py.
+#
+# Only the stops of app_config.stations (or --stops) are indexed. A
+# station (location_type 1) includes the departures of all its platforms.
+# Via-stops (the second field of app_config.stations, or --via) are
+# stored as a bit per departure: the trip calls at the via-stop later on.
+# Services are reduced to the services used by the indexed departures
+# and stored as one bitset per day of the calendar window.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import io
+import os
+import csv
+import sys
+import struct
+import zipfile
+import argparse
+import datetime
+import importlib.util
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),"..","src"))
+sys.path.insert(0,SRC_DIR)
+
+from gtfs_index import MAGIC, HEADER, STOP, RECORD, PRODUCTS
+
+EPOCH    = datetime.date(1970,1,1)
+MAX_VIA  = 16
+
+# GTFS route_type -> index into PRODUCTS
+ROUTE_TYPES = {
+  0: "tram", 1: "subway", 2: "regional", 3: "bus", 4: "ferry",
+  5: "tram", 6: "tram", 7: "tram", 11: "bus", 12: "tram",
+  101: "nationalExpress", 102: "national", 103: "regionalExpress",
+  105: "national", 106: "regional", 109: "suburban",
+  400: "subway", 401: "subway", 402: "subway", 403: "suburban",
+  1000: "ferry", 1200: "ferry", 1500: "taxi", 1501: "taxi"
+  }
+
+def product_of(route_type):
+  """ map (extended) route_type to index into PRODUCTS """
+
+  route_type = int(route_type or 3)
+  name = ROUTE_TYPES.get(route_type,None)
+  if not name:
+    if 100 <= route_type < 200:
+      name = "regional"
+    elif 900 <= route_type < 1000:
+      name = "tram"
+    else:
+      name = "bus"
+  return PRODUCTS.index(name)
+
+# --- read feed   ------------------------------------------------------------
+
+class Feed:
+  """ GTFS-feed in a directory or zip-file """
+
+  def __init__(self,path):
+    self._zip  = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+    self._path = path
+
+  def rows(self,name,required=True):
+    """ iterate over the rows of a table """
+
+    try:
+      if self._zip:
+        f = io.TextIOWrapper(self._zip.open(name),encoding="utf-8-sig")
+      else:
+        f = open(os.path.join(self._path,name),"r",encoding="utf-8-sig")
+    except (KeyError,FileNotFoundError):
+      if required:
+        raise
+      return
+    with f:
+      yield from csv.DictReader(f)
+
+def parse_time(value):
+  """ parse HH:MM:SS (hours may exceed 23), return minutes """
+  hour,minute = value.strip().split(":")[0:2]
+  return 60*int(hour)+int(minute)
+
+def parse_date(value):
+  """ parse YYYYMMDD """
+  return datetime.date(int(value[0:4]),int(value[4:6]),int(value[6:8]))
+
+# --- string table   ---------------------------------------------------------
+
+class Strings:
+  """ interned strings """
+
+  def __init__(self):
+    self.index   = {}
+    self.strings = []
+
+  def add(self,text):
+    if not text in self.index:
+      self.index[text] = len(self.strings)
+      self.strings.append(text)
+    return self.index[text]
+
+# --- compile feed   ---------------------------------------------------------
+
+def read_stops(feed):
+  """ return names and members (stop itself and platforms) of all stops """
+
+  names   = {}
+  members = {}
+  for row in feed.rows("stops.txt"):
+    stop_id = row["stop_id"]
+    names[stop_id] = row.get("stop_name","")
+    members.setdefault(stop_id,set()).add(stop_id)
+    parent = row.get("parent_station","")
+    if parent and row.get("location_type","0") in ("","0"):
+      members.setdefault(parent,set()).add(stop_id)
+  return names,members
+
+def read_calendar(feed,services,first,n_days):
+  """ return list of active service-ids per day of the window """
+
+  days = [set() for _ in range(n_days)]
+  for row in feed.rows("calendar.txt",required=False):
+    service = row["service_id"]
+    if not service in services:
+      continue
+    weekdays = [row[d] == "1" for d in
+                ["monday","tuesday","wednesday","thursday","friday",
+                 "saturday","sunday"]]
+    start = max(0,(parse_date(row["start_date"])-first).days)
+    end   = min(n_days-1,(parse_date(row["end_date"])-first).days)
+    for d in range(start,end+1):
+      if weekdays[(first+datetime.timedelta(days=d)).weekday()]:
+        days[d].add(service)
+  for row in feed.rows("calendar_dates.txt",required=False):
+    service = row["service_id"]
+    d = (parse_date(row["date"])-first).days
+    if not service in services or not 0 <= d < n_days:
+      continue
+    if row["exception_type"] == "1":
+      days[d].add(service)
+    else:
+      days[d].discard(service)
+  return days
+
+def feed_window(feed):
+  """ return first and last day of the feed """
+
+  dates = []
+  for row in feed.rows("calendar.txt",required=False):
+    dates += [parse_date(row["start_date"]),parse_date(row["end_date"])]
+  for row in feed.rows("calendar_dates.txt",required=False):
+    dates.append(parse_date(row["date"]))
+  if not dates:
+    raise ValueError("feed without calendar")
+  return (min(dates),max(dates))
+
+def build(path,stops,via,output,first=None,n_days=None):
+  """ compile feed, return statistics """
+
+  feed = Feed(path)
+  names,members = read_stops(feed)
+  strings = Strings()
+
+  # indexed stops and via-stops
+  stops = [str(s) for s in stops]
+  via   = [str(v) for v in via][:MAX_VIA]
+  keys  = {}                             # stop_id -> indices into stops
+  for i,stop in enumerate(stops):
+    if not stop in members:
+      raise ValueError(f"unknown stop {stop}")
+    for member in members[stop]:
+      keys.setdefault(member,[]).append(i)
+  via_bits = {}                          # stop_id -> via-bits
+  for i,stop in enumerate(via):
+    for member in members.get(stop,[]):
+      via_bits[member] = via_bits.get(member,0) | (1 << i)
+
+  routes = {}
+  for row in feed.rows("routes.txt"):
+    routes[row["route_id"]] = (
+      row.get("route_short_name","") or row.get("route_long_name",""),
+      product_of(row.get("route_type","3")))
+  trips = {}
+  for row in feed.rows("trips.txt"):
+    trips[row["trip_id"]] = (row["route_id"],row["service_id"],
+                             row.get("trip_headsign",""))
+
+  # stop-times of trips calling at an indexed stop (two passes: the
+  # stop-times of large feeds don't fit into memory)
+  calls = {}
+  for row in feed.rows("stop_times.txt"):
+    if row["stop_id"] in keys:
+      calls[row["trip_id"]] = []
+  for row in feed.rows("stop_times.txt"):
+    stop_times = calls.get(row["trip_id"],None)
+    if stop_times is not None:
+      stop_times.append(
+        (int(row["stop_sequence"]),row["stop_id"],
+         row.get("departure_time","") or row.get("arrival_time",""),
+         row.get("stop_headsign",""),row.get("pickup_type","")))
+  records  = [[] for _ in stops]
+  services = {}
+  for trip_id,stop_times in calls.items():
+    route_id,service,headsign = trips[trip_id]
+    line,product = routes[route_id]
+    stop_times.sort()
+    last = names.get(stop_times[-1][1],"")
+    bits = via_bits.get(stop_times[-1][1],0) # via-stops after current stop
+    for _,stop_id,tm,stop_headsign,pickup in reversed(stop_times[:-1]):
+      if stop_id in keys and tm and pickup != "1":
+        service_index = services.setdefault(service,len(services))
+        for i in keys[stop_id]:
+          records[i].append((parse_time(tm),service_index,
+                             strings.add(line),
+                             strings.add(stop_headsign or headsign or last),
+                             bits,product))
+      bits |= via_bits.get(stop_id,0)
+  calls = None
+
+  # calendar window
+  if first is None or n_days is None:
+    feed_first,feed_last = feed_window(feed)
+    first  = first or feed_first
+    n_days = n_days or (feed_last-first).days+1
+  days = read_calendar(feed,services,first,n_days)
+
+  # drop services not running within the window
+  used = set()
+  for active in days:
+    used |= active
+  renumber = {}
+  for service,index in services.items():
+    if service in used:
+      renumber[index] = len(renumber)
+  records = [[(d[0],renumber[d[1]])+d[2:] for d in deps if d[1] in renumber]
+             for deps in records]
+
+  stride = (len(renumber)+7)//8
+  calendar = bytearray(n_days*stride)
+  for d,active in enumerate(days):
+    for service in active:
+      s = renumber[services[service]]
+      calendar[d*stride+(s >> 3)] |= 1 << (s & 7)
+
+  # stop-table, strings and records
+  stop_table = []
+  for stop in stops:
+    stop_table.append((strings.add(stop),strings.add(names[stop])))
+  via_table = [strings.add(v) for v in via]
+  blob    = [s.encode("utf-8") for s in strings.strings]
+  offsets = [0]
+  for b in blob:
+    offsets.append(offsets[-1]+len(b))
+
+  offset = (struct.calcsize(HEADER) + 2*len(via_table) +
+            len(stops)*struct.calcsize(STOP) + len(calendar) +
+            4*len(offsets) + offsets[-1])
+  with open(output,"wb") as f:
+    f.write(struct.pack(HEADER,MAGIC,(first-EPOCH).days,n_days,len(renumber),
+                        len(blob),len(stops),len(via_table)))
+    f.write(struct.pack(f"<{len(via_table)}H",*via_table))
+    for (id_index,name),deps in zip(stop_table,records):
+      f.write(struct.pack(STOP,id_index,name,offset,len(deps)))
+      offset += len(deps)*struct.calcsize(RECORD)
+    f.write(calendar)
+    f.write(struct.pack(f"<{len(offsets)}I",*offsets))
+    f.write(b"".join(blob))
+    for deps in records:
+      deps.sort()
+      f.write(b"".join(struct.pack(RECORD,*d) for d in deps))
+
+  return {"stops": len(stops), "departures": sum(len(r) for r in records),
+          "services": len(renumber), "strings": len(blob),
+          "days": n_days, "first": first, "size": os.path.getsize(output)}
+
+# --- stations from settings   -----------------------------------------------
+
+def load_settings(filename):
+  """ load settings-module """
+
+  spec = importlib.util.spec_from_file_location("settings",filename)
+  settings = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(settings)
+  return settings
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="compile a GTFS-feed to a timetable index")
+  parser.add_argument("feed",help="GTFS-feed (zip-file or directory)")
+  parser.add_argument("-s","--settings",
+                      help="settings.py (stations and via-stops)")
+  parser.add_argument("--stops",nargs="+",default=[],
+                      help="additional stop-ids")
+  parser.add_argument("--via",nargs="+",default=[],
+                      help="additional via-stop-ids")
+  parser.add_argument("--from",dest="first",metavar="YYYYMMDD",
+                      help="first day of the calendar (default: feed start)")
+  parser.add_argument("--days",type=int,
+                      help="number of days (default: until feed end)")
+  parser.add_argument("-o","--output",default=os.path.join(SRC_DIR,"gtfs.bin"),
+                      help="output file (default: src/gtfs.bin)")
+  return parser
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  stops = list(options.stops)
+  via   = list(options.via)
+  if options.settings:
+    for station in load_settings(options.settings).app_config.stations:
+      if not str(station[0]) in stops:
+        stops.append(str(station[0]))
+      if station[1] and not str(station[1]) in via:
+        via.append(str(station[1]))
+  if not stops:
+    sys.exit("no stops (use --settings or --stops)")
+  if len(via) > MAX_VIA:
+    print(f"warning: only {MAX_VIA} via-stops supported")
+
+  first = parse_date(options.first) if options.first else None
+  stats = build(options.feed,stops,via,options.output,first,options.days)
+  print(f"{options.output}: {stats['size']} bytes, {stats['stops']} stops, " +
+        f"{stats['departures']} departures, {stats['services']} services, " +
+        f"{stats['strings']} strings, {stats['days']} days " +
+        f"from {stats['first']}")
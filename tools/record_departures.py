@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Record departure-responses of https://v6.db.transport.rest/ for replay
+# with depserver.py.
+#
+# The responses are recorded without filters (direction, products) and
+# with a long duration, so the replay can apply any query.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import urllib.request
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..","src"))
+
+import rest_api
+
+URL_PREFIX = os.environ.get("URL_PREFIX",rest_api.URL_PREFIX)
+DURATION   = 240
+
+if __name__ == "__main__":
+  if len(sys.argv) < 3:
+    print(f"usage: {sys.argv[0]} directory station-id [station-id ...]")
+    sys.exit(0)
+
+  directory = sys.argv[1]
+  os.makedirs(directory,exist_ok=True)
+  for station in sys.argv[2:]:
+    url = rest_api.create_url(URL_PREFIX,station,None,None,DURATION)
+    with urllib.request.urlopen(url) as resp:
+      doc = json.load(resp)
+    filename = os.path.join(directory,f"{station}.json")
+    with open(filename,"w") as f:
+      json.dump(doc,f,ensure_ascii=False)
+    print(f"{station}: {len(doc['departures'])} departures -> {filename}")
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# Rendering service for thin clients (app_config.render_url).
+#
+# Runs the data provider and the layout of DepmonUIProvider headless for
+# the settings of the devices and serves ready-made frames:
+#
+#   GET /frame?width=296&height=128&depth=1&station=0&row=0&bat=3.7
+#
+# The frame is a packed framebuffer with 1 or 2 bits per pixel (gray
+# levels, highest value: white), rows padded to full bytes, first pixel
+# in the most significant bits. The ETag is the crc32 of the frame, an
+# unchanged frame is answered with 304. The headers X-Row (row clamped
+# to the departures), X-Departures (number of departures of the station)
+# and X-Time (local time, seconds since 1970) let the devices page and
+# count down without fetching departures themselves.
+#
+# Needs the packages of the PC version (see README.md). Blinka-displayio
+# has no public interface to read the pixels of a group, so they are read
+# with its display-core (displayio._displaycore, internal). This needs
+# exactly adafruit-blinka-displayio==2.7.0 (see the README).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/cp-departure-monitor
+#
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import gzip
+import time
+import zlib
+import argparse
+import threading
+import importlib.util
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),"..","src"))
+sys.path.insert(0,SRC_DIR)
+
+from depmon_model import CLOCK
+
+FRAME_CACHE = 64
+
+# --- headless display   -----------------------------------------------------
+
+class HeadlessDisplay:
+  """ size of the display for create_ui() """
+
+  def __init__(self,width,height):
+    self.width  = width
+    self.height = height
+
+class Renderer:
+  """ layout and rasterization for a given display size """
+
+  def __init__(self,width,height,debug=False):
+    """ constructor """
+
+    # displayio._displaycore and busdisplay import each other: import
+    # busdisplay first, otherwise the import of _DisplayCore fails
+    importlib.import_module("busdisplay")
+    from displayio._displaycore import _DisplayCore
+    from depmon_uiprovider import DepmonUIProvider
+
+    self.display = HeadlessDisplay(width,height)
+    self.ui      = DepmonUIProvider(debug=debug)
+    self.ui._render_url = None     # the service renders locally
+    self.view    = self.ui.create_ui(self.display)
+
+    # 8-bit grayscale, quantized to the requested depth by pack()
+    self._core = _DisplayCore(
+      bus=None,width=width,height=height,ram_width=width,ram_height=height,
+      colstart=0,rowstart=0,rotation=0,color_depth=8,grayscale=True,
+      pixels_in_byte_share_row=True,bytes_per_cell=1,
+      reverse_pixels_in_byte=False,reverse_bytes_in_word=False,
+      column_command=0,row_command=0,set_current_column_command=0,
+      set_current_row_command=0,data_as_commands=False,
+      always_toggle_chip_select=False,sh1107_addressing=False,
+      address_little_endian=False)
+    self._core.set_root_group(self.view)
+
+  def pixels(self):
+    """ return luminance of all pixels (one byte per pixel) """
+
+    from displayio._area import Area
+    width,height = self.display.width,self.display.height
+    size   = width*height
+    buffer = memoryview(bytearray((size+3)//4*4)).cast("I")
+    mask   = memoryview(bytearray((size//32+1)*4)).cast("I")
+    self._core.fill_area(Area(0,0,width,height),mask,buffer)
+    return buffer.tobytes()[:size]
+
+def pack(pixels,width,height,depth):
+  """ pack luminance to depth bits per pixel, rows padded to bytes """
+
+  shift  = 8-depth
+  per_byte = 8//depth
+  stride = (width*depth+7)//8
+  frame  = bytearray(stride*height)
+  for y in range(height):
+    row = pixels[y*width:(y+1)*width]
+    for x in range(width):
+      value = row[x] >> shift
+      if value:
+        frame[y*stride + x//per_byte] |= (
+          value << (8-depth*(1 + x % per_byte)))
+  return bytes(frame)
+
+# --- departure data and frames   --------------------------------------------
+
+class Service:
+  """ data updates and rendering of frames """
+
+  def __init__(self,options):
+    """ constructor """
+
+    from settings import app_config
+    from ui_settings import UI_SETTINGS
+    from depmon_dataprovider import DepmonDataProvider
+    from wifi_helper_generic import WifiHelper
+
+    self._options  = options
+    self._rows     = UI_SETTINGS.ROWS
+    self._interval = options.interval or app_config.upd_time
+    app_config.fetch_mode = "all"         # the service needs all stations
+    self._provider = DepmonDataProvider(debug=options.verbose)
+    self._provider.set_wifi(WifiHelper(debug=options.verbose))
+    self.n_stations = len(app_config.stations)
+    self._data      = {"station_index": 0}
+    self._renderers = {}                  # (width,height) -> Renderer
+    self._frames    = {}                  # key -> (etag,frame)
+    self._order     = []
+    self._lock      = threading.Lock()    # displayio is not thread-safe
+    self.stats      = {"frames": 0, "rendered": 0, "not_modified": 0}
+
+  def msg(self,text):
+    """ print (debug) message """
+    if self._options.verbose:
+      print(text)
+
+  # --- update data   --------------------------------------------------------
+
+  def update(self):
+    """ fetch departures of all stations.
+
+    Fetches into a copy of the model (frame() keeps rendering the old
+    one) and swaps it in under the lock.
+    """
+
+    with self._lock:
+      data = {"station_index": 0}
+      if "departures" in self._data:
+        data["departures"] = list(self._data["departures"])
+        data["stale"]      = dict(self._data.get("stale",{}))
+    try:
+      self._provider.update_data(data)
+    except Exception as ex:
+      self.msg(f"update failed: {ex}")
+    with self._lock:
+      # also keeps the stations updated before an error, failed stations
+      # are marked as stale
+      self._data = data
+      self._provider.compact(self._data)
+
+  def run(self):
+    """ update loop (run in a thread) """
+    while True:
+      time.sleep(self._interval)
+      self.update()
+
+  # --- render frame   -------------------------------------------------------
+
+  def _renderer(self,width,height):
+    """ return (cached) renderer for display size """
+    renderer = self._renderers.get((width,height),None)
+    if not renderer:
+      renderer = Renderer(width,height,self._options.verbose)
+      self._renderers[(width,height)] = renderer
+    return renderer
+
+  def frame(self,width,height,depth,station,row,bat):
+    """ return (etag,frame,row,departures). The row is clamped to the
+    departures of the station (paging of the devices) """
+
+    with self._lock:
+      self.stats["frames"] += 1
+      renderer = self._renderer(width,height)
+      ui = renderer.ui
+      departures = (self._data.get("departures",None) or
+                    [None]*self.n_stations)
+      now = CLOCK.minutes()
+      if ui._countdown and now is not None:
+        departures = [d and d.expire(now) for d in departures]
+
+      # stations without data: station-id and stale-footer (see update_ui)
+      n   = len(departures[station].info) if departures[station] else 0
+      row = max(0,min(row,n-self._rows))
+      data = {"bat_level": bat, "station_index": station,
+              "row": row,
+              "departures": departures,
+              "stale": self._data.get("stale",{})}
+      ui.update_ui(data)
+
+      key = (width,height,depth,station,ui.fingerprint)
+      result = self._frames.get(key,None)
+      if result:
+        return result+(row,n)
+
+      self.stats["rendered"] += 1
+      frame  = pack(renderer.pixels(),width,height,depth)
+      result = (f'"{zlib.crc32(frame):08x}"',frame)
+      if len(self._order) >= FRAME_CACHE:
+        del self._frames[self._order.pop(0)]
+      self._frames[key] = result
+      self._order.append(key)
+      return result+(row,n)
+
+# --- request handler   ------------------------------------------------------
+
+class Handler(BaseHTTPRequestHandler):
+  """ handle requests for /frame """
+
+  protocol_version = "HTTP/1.1"    # keep-alive
+
+  def log_message(self,format,*args):
+    if self.server.options.verbose:
+      super().log_message(format,*args)
+
+  def _send(self,status,body=b"",headers={}):
+    """ send response """
+    self.send_response(status)
+    for key,value in headers.items():
+      self.send_header(key,value)
+    self.send_header("Content-Length",str(len(body)))
+    self.end_headers()
+    if body:
+      self.wfile.write(body)
+
+  def do_GET(self):
+    """ process get-request """
+
+    url = urlparse(self.path)
+    if url.path != "/frame":
+      self._send(404,b"not found")
+      return
+    params = parse_qs(url.query)
+    try:
+      width  = int(params["width"][0])
+      height = int(params["height"][0])
+      depth  = int(params.get("depth",["1"])[0])
+      station = int(params.get("station",["0"])[0])
+      row    = int(params.get("row",["0"])[0])
+      bat    = float(params.get("bat",["0"])[0])
+      if not depth in [1,2] or not 0 < width*height <= 1<<20:
+        raise ValueError("unsupported size or depth")
+      if not 0 <= station < self.server.service.n_stations:
+        raise ValueError("unknown station")
+    except (KeyError,ValueError) as ex:
+      self._send(400,f"invalid request: {ex}".encode())
+      return
+
+    service = self.server.service
+    etag,frame,row,n = service.frame(width,height,depth,station,row,bat)
+    headers = {"ETag": etag, "Content-Type": "application/octet-stream",
+               "X-Row": str(row), "X-Departures": str(n)}
+    if CLOCK.now():
+      headers["X-Time"] = str(CLOCK.now())    # local time of the devices
+    if self.headers.get("If-None-Match") == etag:
+      service.stats["not_modified"] += 1
+      self._send(304,headers=headers)
+      return
+    if "gzip" in self.headers.get("Accept-Encoding",""):
+      frame = gzip.compress(frame)
+      headers["Content-Encoding"] = "gzip"
+    self._send(200,frame,headers)
+
+# --- main program   ---------------------------------------------------------
+
+def load_settings(filename):
+  """ load settings-module of the devices (replaces src/settings.py) """
+
+  spec = importlib.util.spec_from_file_location("settings",filename)
+  settings = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(settings)
+  sys.modules["settings"] = settings
+  return settings
+
+def get_parser():
+  """ create argument-parser """
+
+  parser = argparse.ArgumentParser(
+    description="render frames for thin clients")
+  parser.add_argument("-s","--settings",required=True,
+                      help="settings.py of the devices (stations, ui_config)")
+  parser.add_argument("-p","--port",type=int,default=8082,
+                      help="port (default: 8082)")
+  parser.add_argument("-i","--interval",type=int,default=0,
+                      help="update interval (default: app_config.upd_time)")
+  parser.add_argument("-v","--verbose",action="store_true",
+                      help="log requests")
+  return parser
+
+def create_server(options,host="localhost"):
+  """ create (but don't start) server, fetch data and start updates """
+
+  load_settings(options.settings)
+  os.chdir(SRC_DIR)                        # fonts are relative to src/
+  server = ThreadingHTTPServer((host,options.port),Handler)
+  server.daemon_threads = True
+  server.options = options
+  server.service = Service(options)
+  server.service.update()
+  threading.Thread(target=server.service.run,daemon=True).start()
+  return server
+
+if __name__ == "__main__":
+  options = get_parser().parse_args()
+  server = create_server(options,"")
+  print(f"serving frames on http://localhost:{options.port}/frame")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass